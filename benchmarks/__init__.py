@@ -0,0 +1 @@
+"""Benchmarks of DakaP against fake Discord objects"""
@@ -0,0 +1,200 @@
+"""
+Run the benchmarks and save the results as JSON, or compare two saved results.
+
+    python -m benchmarks run --output results.json [--quick] [<benchmark>...]
+    python -m benchmarks compare baseline.json results.json [--threshold 0.1]
+
+Each benchmark is run in its own process, since some of them measure the imports.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Any
+
+BENCHMARKS = [
+    'hot_paths',
+    'on_message',
+    'time',
+    'emoji_output',
+    'emoji_accumulator',
+    'scan_scheduler',
+    'startup',
+    'stock',
+    'memory',
+    'shards',
+    'youtube',
+    'emoji_progress',
+    'stock_watch',
+    'command_pipeline',
+    'replay',
+    'stock_history',
+]
+"""The modules `benchmarks.bench_<name>`"""
+QUICK_ARGUMENTS = {
+    'hot_paths': ['--scales', 'small', '--number', '5000'],
+    'on_message': ['--number', '10000'],
+    'time': ['--number', '500'],
+    'emoji_output': ['--latency', '0.01'],
+    'emoji_accumulator': ['--messages', '100000'],
+    'scan_scheduler': ['--concurrency', '4', '8', '--messages', '5000', '--latency', '0.005'],
+    'startup': ['--repeat', '1'],
+    'stock': ['--users', '10', '--latency', '0.01'],
+    'memory': ['--messages', '10000'],
+    'shards': ['--processes', '2', '--guilds', '10'],
+    'youtube': ['--lengths', '400', '10000', '--legacy-max-length', '400'],
+    'emoji_progress': ['--channels', '8', '--messages', '10000'],
+    'stock_watch': ['--channels', '10', '100', '--polls', '2', '--latency', '0.01'],
+    'command_pipeline': ['--messages', '100', '--slow-seconds', '0.2'],
+    'replay': ['--generate', '500', '--speed', '0'],
+    'stock_history': ['--symbols', '4', '--calls', '2', '--latency', '0.01'],
+}
+
+_LOWER_IS_BETTER = ('seconds', 'elapsed')
+_HIGHER_IS_BETTER = ('per_second', 'throughput')
+
+
+def run(names: list[str], quick: bool) -> dict[str, Any]:
+    """Run the benchmarks and collect their JSON lines."""
+    results = []
+    for name in names:
+        arguments = QUICK_ARGUMENTS[name] if quick else []
+        print(f'Running {name} {" ".join(arguments)}', file=sys.stderr)
+        process = subprocess.run(
+            [sys.executable, '-m', f'benchmarks.bench_{name}', *arguments],
+            stdout=subprocess.PIPE,
+            check=True,
+            text=True,
+        )
+        results += [
+            {'module': name, **json.loads(line)}
+            for line in process.stdout.splitlines()
+            if line.startswith('{')
+        ]
+
+    return {
+        'meta': {
+            'time': time.time(),
+            'commit': _get_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: dict[str, Any], current: dict[str, Any], threshold: float) -> list[dict]:
+    """
+    Compare the timings and the throughputs of the same records (by the order in each module),
+    and return the changes with whether each one is a regression beyond the threshold.
+    """
+    changes = []
+    baseline_records = _key_records(baseline)
+    for key, current_record in _key_records(current).items():
+        if not (baseline_record := baseline_records.get(key)):
+            continue
+        for field, value in current_record.items():
+            baseline_value = baseline_record.get(field)
+            if not isinstance(value, float) or not isinstance(baseline_value, float):
+                continue
+            if field.endswith(_HIGHER_IS_BETTER):
+                higher_is_better = True
+            elif field.endswith(_LOWER_IS_BETTER):
+                higher_is_better = False
+            else:
+                continue
+            if not baseline_value:
+                continue
+
+            change = (value - baseline_value) / baseline_value
+            changes.append({
+                'module': key[0],
+                'index': key[1],
+                'benchmark': current_record.get('benchmark'),
+                'params': {
+                    name: param
+                    for name, param in current_record.items()
+                    if isinstance(param, str) and name not in ('module', 'benchmark')
+                },
+                'field': field,
+                'baseline': baseline_value,
+                'current': value,
+                'change': change,
+                'regression': (-change if higher_is_better else change) > threshold,
+            })
+    return changes
+
+
+def _key_records(result: dict[str, Any]) -> dict[tuple[str, int], dict]:
+    indices: dict[str, int] = {}
+    records = {}
+    for record in result['results']:
+        index = indices[record['module']] = indices.get(record['module'], -1) + 1
+        records[record['module'], index] = record
+    return records
+
+
+def _get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument(
+        'names',
+        nargs='*',
+        help=f'any of {", ".join(BENCHMARKS)} (default: all)',
+    )
+    run_parser.add_argument('--output', help='save the results as JSON (default: stdout)')
+    run_parser.add_argument('--quick', action='store_true', help='with the smaller workloads')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two saved results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='the relative slowdown regarded as a regression',
+    )
+
+    args = arg_parser.parse_args()
+    if args.command == 'run':
+        if unknown_names := set(args.names) - set(BENCHMARKS):
+            arg_parser.error(f'unknown benchmarks: {", ".join(sorted(unknown_names))}')
+        result = run(names=args.names or BENCHMARKS, quick=args.quick)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as output_file:
+                json.dump(result, output_file, indent=2)
+        else:
+            print(json.dumps(result, indent=2))
+    else:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        with open(args.current, encoding='utf-8') as current_file:
+            current = json.load(current_file)
+        changes = compare(baseline, current, threshold=args.threshold)
+        for change in changes:
+            print(json.dumps(change))
+        if any(change['regression'] for change in changes):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+Measure a flood of multi-line command messages in a busy guild next to a few quiet guilds, where
+the commands share a backend of limited slots (like the thread pool), run line by line in each
+message as before and through the command pipeline: the latency in the quiet guilds, the replies
+out of order in the channels, the peak concurrency and the shed commands.
+
+    python -m benchmarks.bench_command_pipeline --busy-channels 8 --quiet-guilds 4 --messages 300
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import time
+from collections import Counter as counter
+from types import SimpleNamespace
+from typing import Counter, Sequence
+
+from dakap.command_pipeline import CommandPipeline
+from dakap.common import Command
+from dakap.dakap import DakaP
+
+
+class _Recorder:
+    """Record the replies, their latencies and the concurrency of the commands."""
+
+    def __init__(self, backend_slots: int):
+        self.backend = asyncio.Semaphore(backend_slots)
+        self.latencies: dict[int, list[float]] = {}
+        """Keyed by the guild IDs"""
+        self.replies: dict[int, list[int]] = {}
+        """The sequence numbers of the replies keyed by the channel IDs"""
+        self.running = 0
+        self.max_running = 0
+        self.guild_running: Counter[int] = counter()
+        self.max_guild_running = 0
+
+    def make_command(self, name: str, seconds: float) -> Command:
+        async def func(_client, message, arguments: Sequence[str]) -> None:
+            self.running += 1
+            self.guild_running[message.guild.id] += 1
+            self.max_running = max(self.max_running, self.running)
+            self.max_guild_running = max(
+                self.max_guild_running,
+                self.guild_running[message.guild.id],
+            )
+            try:
+                async with self.backend:
+                    await asyncio.sleep(seconds)
+            finally:
+                self.running -= 1
+                self.guild_running[message.guild.id] -= 1
+            self.replies.setdefault(message.channel.id, []).append(int(arguments[1]))
+            self.latencies.setdefault(message.guild.id, []).append(
+                time.perf_counter() - message.created_at
+            )
+
+        return Command(names=(name,), func=func, usage='', description='')
+
+
+async def _legacy_on_message(client: DakaP, message) -> None:
+    """The previous `DakaP.on_message`, which ran the lines one by one."""
+    # pylint: disable=protected-access
+    for message_line in message.content.splitlines():
+        if command := client._match_command(message_line):
+            arguments = client._parse_arguments(message_line)
+            await client._run_command(command, message, arguments)
+
+
+async def run(
+    mode: str,
+    busy_channel_count: int,
+    quiet_guild_count: int,
+    message_count: int,
+    busy_ratio: float,
+    slow_ratio: float,
+    slow_seconds: float,
+    fast_seconds: float,
+    backend_slots: int,
+    interval: float,
+    seed: int = 0,
+) -> dict:
+    rng = random.Random(seed)
+    recorder = _Recorder(backend_slots)
+    client = DakaP(
+        commands=[
+            recorder.make_command('slow', slow_seconds),
+            recorder.make_command('fast', fast_seconds),
+        ],
+        warm_commands=False,
+    )
+    client.command_pipeline = CommandPipeline()
+    shed_replies = []
+
+    async def reply(content: str | None = None, **_kwargs) -> None:
+        shed_replies.append(content)
+
+    busy_guild = SimpleNamespace(id=1, shard_id=0)
+    busy_channels = [
+        SimpleNamespace(id=1000 + index, guild=busy_guild) for index in range(busy_channel_count)
+    ]
+    quiet_channels = [
+        SimpleNamespace(id=guild_id * 1000, guild=SimpleNamespace(id=guild_id, shard_id=0))
+        for guild_id in range(2, quiet_guild_count + 2)
+    ]
+    sequences: Counter[int] = counter()
+    tasks = []
+    start_time = time.perf_counter()
+    for _ in range(message_count):
+        if rng.random() < busy_ratio:
+            channel = rng.choice(busy_channels)
+            names = ['slow' if rng.random() < slow_ratio else 'fast' for _ in range(3)]
+        else:
+            channel = rng.choice(quiet_channels)
+            names = ['fast']
+        lines = []
+        for name in names:
+            sequences[channel.id] += 1
+            lines.append(f'${name} {sequences[channel.id]}')
+        message = SimpleNamespace(
+            id=0,
+            content='\n'.join(lines),
+            author=SimpleNamespace(bot=False),
+            channel=channel,
+            guild=channel.guild,
+            created_at=time.perf_counter(),
+            reply=reply,
+        )
+        # Dispatched in a task for each message, like discord.py
+        tasks.append(asyncio.create_task(
+            client.on_message(message) if mode == 'pipeline'
+            else _legacy_on_message(client, message)
+        ))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    await client.command_pipeline.join()
+    elapsed = time.perf_counter() - start_time
+
+    busy_latencies = sorted(recorder.latencies.pop(busy_guild.id))
+    quiet_latencies = sorted(
+        latency for latencies in recorder.latencies.values() for latency in latencies
+    )
+    return {
+        'benchmark': 'command_pipeline',
+        'mode': mode,
+        'messages': message_count,
+        'commands': sum(sequences.values()),
+        'elapsed': elapsed,
+        'quiet_p50_seconds': statistics.median(quiet_latencies),
+        'quiet_p95_seconds': quiet_latencies[int(len(quiet_latencies) * 0.95)],
+        'busy_p50_seconds': statistics.median(busy_latencies),
+        'busy_p95_seconds': busy_latencies[int(len(busy_latencies) * 0.95)],
+        'out_of_order': sum(
+            sum(previous > current for previous, current in zip(replies, replies[1:]))
+            for replies in recorder.replies.values()
+        ),
+        'max_running': recorder.max_running,
+        'max_guild_running': recorder.max_guild_running,
+        'shed': client.command_pipeline.shed_count,
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--busy-channels', type=int, default=8)
+    arg_parser.add_argument('--quiet-guilds', type=int, default=4)
+    arg_parser.add_argument('--messages', type=int, default=300)
+    arg_parser.add_argument('--busy-ratio', type=float, default=0.8)
+    arg_parser.add_argument('--slow-ratio', type=float, default=0.2)
+    arg_parser.add_argument('--slow-seconds', type=float, default=0.5)
+    arg_parser.add_argument('--fast-seconds', type=float, default=0.01)
+    arg_parser.add_argument('--backend-slots', type=int, default=8)
+    arg_parser.add_argument('--interval', type=float, default=0.01, help='Seconds per message')
+    args = arg_parser.parse_args()
+
+    logging.getLogger('dakap').setLevel(logging.ERROR)
+    for mode in ('line_by_line', 'pipeline'):
+        print(json.dumps(asyncio.run(run(
+            mode=mode,
+            busy_channel_count=args.busy_channels,
+            quiet_guild_count=args.quiet_guilds,
+            message_count=args.messages,
+            busy_ratio=args.busy_ratio,
+            slow_ratio=args.slow_ratio,
+            slow_seconds=args.slow_seconds,
+            fast_seconds=args.fast_seconds,
+            backend_slots=args.backend_slots,
+            interval=args.interval,
+        ))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare counting the emojis of a million messages into `DailyEmojiCounts` with the previous
+`Counter` per message merged into a `Counter` keyed by `(day, emoji_id)`, in time and memory.
+
+    python -m benchmarks.bench_emoji_accumulator --messages 1000000 --emojis 50 500
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from collections import Counter as counter
+from itertools import cycle, islice
+from typing import Callable, Counter, Iterable
+
+from dakap.emoji_index import current_day, snowflake_day
+from dakap.emoji_matcher import DailyEmojiCounts, EmojiMatcher
+
+from .fakes import FakeMessage, make_emojis, make_messages
+
+_POOL_SIZE = 20_000
+"""The distinct messages, repeated to make up the million without keeping them all in memory"""
+
+
+def _count_legacy(emoji_matcher: EmojiMatcher, messages: Iterable[FakeMessage]) -> object:
+    message_counts: Counter[int] = counter()
+    emoji_counts: Counter[tuple[int, int]] = counter()
+    for message in messages:
+        day = snowflake_day(message.id)
+        message_counts[day] += 1
+        emoji_counter = counter(emoji_matcher.find_in_content(message.content))
+        if message.reactions:
+            emoji_counter.update(emoji_matcher.find_in_reactions(message.reactions))
+        for emoji, count in emoji_counter.items():
+            emoji_counts[day, emoji.id] += count
+    return message_counts, emoji_counts
+
+
+def _count_arrays(emoji_matcher: EmojiMatcher, messages: Iterable[FakeMessage]) -> object:
+    daily_counts = DailyEmojiCounts(
+        emoji_matcher=emoji_matcher,
+        first_day=current_day() - 12 * 7 - 1,
+        last_day=current_day(),
+    )
+    for message in messages:
+        daily_counts.add_message(message, day=snowflake_day(message.id))
+    return daily_counts
+
+
+def _measure(
+    count: Callable[[EmojiMatcher, Iterable[FakeMessage]], object],
+    emoji_matcher: EmojiMatcher,
+    pool: list[FakeMessage],
+    message_count: int,
+) -> dict:
+    start_time = time.perf_counter()
+    count(emoji_matcher, islice(cycle(pool), message_count))
+    seconds = time.perf_counter() - start_time
+
+    # Separately, since tracing slows it down
+    tracemalloc.start()
+    result = count(emoji_matcher, islice(cycle(pool), message_count // 10))
+    retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        'seconds': seconds,
+        'messages_per_second': message_count / seconds,
+        # Of a tenth of the messages
+        'retained_bytes': retained_bytes,
+        'peak_bytes': peak_bytes,
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--messages', type=int, default=1_000_000)
+    arg_parser.add_argument('--emojis', type=int, nargs='+', default=[50, 500])
+    args = arg_parser.parse_args()
+
+    for emoji_count in args.emojis:
+        emojis = make_emojis(emoji_count)
+        pool = make_messages(_POOL_SIZE, emojis)
+        emoji_matcher = EmojiMatcher(emojis)
+        arrays = _measure(_count_arrays, emoji_matcher, pool, args.messages)
+        legacy = _measure(_count_legacy, emoji_matcher, pool, args.messages)
+        print(json.dumps({
+            'benchmark': 'emoji_accumulator',
+            'messages': args.messages,
+            'emojis': emoji_count,
+            **arrays,
+            **{f'legacy_{key}': value for key, value in legacy.items()},
+        }))
+
+
+if __name__ == '__main__':
+    main()
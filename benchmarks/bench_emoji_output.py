@@ -0,0 +1,82 @@
+"""
+Compare the round trips of sending the `$emoji` results packed into one message with sending one
+message per line as before, against a channel with a simulated latency per send.
+
+    python -m benchmarks.bench_emoji_output --emojis 50 200 1000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter as counter
+from itertools import zip_longest
+
+from dakap.count_emojis import _send_emoji_count_result
+from dakap.packed_output import EMBED_DESCRIPTION_LIMIT, MESSAGE_LIMIT
+
+from .fakes import make_emojis
+
+
+class _RecordingChannel:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.send_count = 0
+        self.oversized_count = 0
+        self.attachment_count = 0
+
+    async def send(self, content: str | None = None, *, embeds=(), file=None, **_kwargs) -> None:
+        self.send_count += 1
+        self.oversized_count += len(content or '') > MESSAGE_LIMIT
+        self.oversized_count += sum(
+            len(embed.description) > EMBED_DESCRIPTION_LIMIT for embed in embeds
+        )
+        self.attachment_count += file is not None
+        await asyncio.sleep(self.latency)
+
+
+async def _legacy_send_emoji_count_result(emoji_counter, channel_to_send) -> None:
+    emoji_count_strs = [
+        f'{str(emoji)}: {count - 1 :3}'
+        for emoji, count in sorted(emoji_counter.items(), key=lambda item: item[1], reverse=True)
+    ]
+    for column in zip_longest(*[iter(emoji_count_strs)] * 10, fillvalue=''):
+        await channel_to_send.send('\t'.join(column))
+
+
+async def _measure(send, emoji_count: int, latency: float) -> dict:
+    emoji_counter = counter({
+        emoji: 1 + index for index, emoji in enumerate(make_emojis(emoji_count))
+    })
+    channel = _RecordingChannel(latency)
+    started_at = time.perf_counter()
+    await send(emoji_counter, channel)
+    return {
+        'seconds': time.perf_counter() - started_at,
+        'sends': channel.send_count,
+        'oversized': channel.oversized_count,
+        'attachments': channel.attachment_count,
+    }
+
+
+async def _main(args: argparse.Namespace) -> None:
+    for emoji_count in args.emojis:
+        packed = await _measure(_send_emoji_count_result, emoji_count, args.latency)
+        legacy = await _measure(_legacy_send_emoji_count_result, emoji_count, args.latency)
+        print(json.dumps({
+            'benchmark': 'emoji_output',
+            'emojis': emoji_count,
+            **packed,
+            **{f'legacy_{key}': value for key, value in legacy.items()},
+        }))
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--emojis', type=int, nargs='+', default=[50, 200, 1000])
+    arg_parser.add_argument('--latency', type=float, default=0.1, help='seconds per send')
+    asyncio.run(_main(arg_parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Measure how soon `$emoji` shows something while scanning a slow guild, with and without the
+progress, and the messages it sends and edits.
+
+    python -m benchmarks.bench_emoji_progress --channels 20 --messages 50000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from dakap import count_emojis
+from dakap.emoji_cube import _cubes, _last_saved, _unsaved_guild_ids
+from dakap.emoji_index import get_emoji_index
+
+from .fakes import FakeSentMessage, make_client, make_command_message, make_guild
+
+
+async def run(progress: bool, channel_count: int, message_count: int, latency: float) -> dict:
+    guild = make_guild(
+        channel_count=channel_count,
+        emoji_count=50,
+        message_count=message_count,
+        latency=latency,
+    )
+    message = make_command_message(guild)
+    reply = message.reply
+    replies: list[FakeSentMessage] = []
+    reply_times: list[float] = []
+
+    async def record_reply(content: str | None = None, **kwargs) -> FakeSentMessage:
+        reply_times.append(time.perf_counter())
+        replies.append(await reply(content, **kwargs))
+        return replies[-1]
+
+    message.reply = record_reply
+    count_emojis.PROGRESS_DELAY = 1.0 if progress else float('inf')
+    start_time = time.perf_counter()
+    await count_emojis.count_emojis(make_client(), message, ['emoji'])
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        'benchmark': 'emoji_progress',
+        'mode': 'progress' if progress else 'final_only',
+        'channels': channel_count,
+        'messages': message_count,
+        'elapsed': elapsed,
+        'first_feedback_seconds': reply_times[0] - start_time,
+        'replies': len(replies),
+        'edits': sum(len(sent_message.edits) for sent_message in replies),
+        'sends': len(guild.sent) - len(replies),
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--channels', type=int, default=20)
+    arg_parser.add_argument('--messages', type=int, default=50_000)
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='Seconds per page')
+    args = arg_parser.parse_args()
+
+    logging.getLogger('dakap').setLevel(logging.WARNING)
+    logging.getLogger('dakap.count_emojis').setLevel(logging.WARNING)
+    for progress in (False, True):
+        # A fresh index and cube each time, outside the working directory
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            get_emoji_index.cache_clear()
+            count_emojis.emoji_results.invalidate()
+            _cubes.clear()
+            _unsaved_guild_ids.clear()
+            _last_saved.clear()
+            print(json.dumps(asyncio.run(run(
+                progress=progress,
+                channel_count=args.channels,
+                message_count=args.messages,
+                latency=args.latency,
+            ))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Measure the hot paths of the bot against synthetic guilds of increasing sizes.
+
+    python -m benchmarks.bench_hot_paths --scales small medium large
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from functools import partial
+from typing import Callable
+
+from dakap.count_emojis import _cjk_ljust, _count_emojis_in_channel, _count_emojis_in_msg
+from dakap.dakap import DakaP
+from dakap.emoji_index import EmojiIndex, current_day, snowflake_day
+from dakap.emoji_matcher import DailyEmojiCounts, EmojiMatcher
+from dakap.get_time import _get_from_time
+from dakap.youtube_thumbnail import parse_and_generate_youtube_thumbnail_url
+
+from .fakes import make_client, make_guild
+from .timing import time_per_call
+
+SCALES = {
+    # name: (channels, emojis, messages)
+    'small': (5, 20, 2_000),
+    'medium': (20, 100, 20_000),
+    'large': (50, 500, 100_000),
+}
+
+COMMAND_LINES = [
+    '$emoji',
+    '$time 2023-01-02 21:30 JST',
+    '$choose "ramen or sushi" curry "fried rice"',
+    '$stock 2330.TW AAPL 5253.T',
+]
+YOUTUBE_URLS = [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtu.be/dQw4w9WgXcQ?t=42',
+    'https://www.youtube.com/live/dQw4w9WgXcQ?feature=share',
+    'https://example.com/not/a/video',
+]
+CJK_STRINGS = ['From #general:', 'From #雜談-閒聊:', 'From #ホロライブ-切り抜き:']
+TIME_STRINGS = ['21:30', '2023-01-02 21:30', '21:30 JST', '9PM']
+
+
+def _ignore_value_error(func: Callable[[str], object], value: str) -> None:
+    try:
+        func(value)
+    except ValueError:
+        pass
+
+
+def _record(function: str, seconds: float, **params) -> dict:
+    return {'benchmark': 'hot_paths', 'function': function, **params, 'seconds': seconds}
+
+
+async def _bench_scale(scale: str, number: int) -> list[dict]:
+    channel_count, emoji_count, message_count = SCALES[scale]
+    guild = make_guild(
+        channel_count=channel_count,
+        emoji_count=emoji_count,
+        message_count=message_count,
+    )
+    messages = [message for channel in guild.text_channels for message in channel.messages]
+    emoji_matcher = EmojiMatcher(guild.emojis)
+    params = {
+        'scale': scale,
+        'channels': channel_count,
+        'emojis': emoji_count,
+        'messages': len(messages),
+    }
+
+    daily_counts = DailyEmojiCounts(
+        emoji_matcher=emoji_matcher,
+        first_day=min(snowflake_day(message.id) for message in messages),
+        last_day=current_day(),
+    )
+    start_time = time.perf_counter()
+    for message in messages:
+        _count_emojis_in_msg(daily_counts, message)
+    count_in_msg_seconds = (time.perf_counter() - start_time) / len(messages)
+
+    # The busiest channel, into a fresh index each time
+    channel = max(guild.text_channels, key=lambda channel: len(channel.messages))
+    client = make_client()
+    elapsed = 0.0
+    for _ in range(max(number // 10_000, 1)):
+        emoji_index = EmojiIndex(':memory:')
+        start_time = time.perf_counter()
+        await _count_emojis_in_channel(
+            client=client,
+            channel=channel,
+            emoji_matcher=emoji_matcher,
+            after_id=channel.messages[0].id - 1,
+            before_id=None,
+            emoji_index=emoji_index,
+        )
+        elapsed += time.perf_counter() - start_time
+        emoji_index.close()
+    count_in_channel_seconds = elapsed / max(number // 10_000, 1)
+
+    return [
+        _record('_count_emojis_in_msg', count_in_msg_seconds, **params),
+        _record(
+            '_count_emojis_in_channel',
+            count_in_channel_seconds,
+            **params,
+            channel_messages=len(channel.messages),
+            messages_per_second=len(channel.messages) / count_in_channel_seconds,
+        ),
+    ]
+
+
+def _bench_inputs(number: int) -> list[dict]:
+    client = DakaP()
+    records = []
+    for command_line in COMMAND_LINES:
+        records.append(_record(
+            'DakaP._parse_arguments',
+            time_per_call(
+                partial(client._parse_arguments, command_line),  # pylint: disable=protected-access
+                number,
+                warm_up=True,
+            ),
+            input=command_line,
+        ))
+    for youtube_url in YOUTUBE_URLS:
+        records.append(_record(
+            'parse_and_generate_youtube_thumbnail_url',
+            time_per_call(
+                partial(_ignore_value_error, parse_and_generate_youtube_thumbnail_url, youtube_url),
+                number,
+                warm_up=True,
+            ),
+            input=youtube_url,
+        ))
+    for string in CJK_STRINGS:
+        records.append(_record(
+            '_cjk_ljust',
+            time_per_call(partial(_cjk_ljust, string, 50), number, warm_up=True),
+            input=string,
+        ))
+    for time_string in TIME_STRINGS:
+        records.append(_record(
+            '_get_from_time',
+            time_per_call(partial(_get_from_time, time_string), number // 10, warm_up=True),
+            input=time_string,
+        ))
+    return records
+
+
+async def _main(args: argparse.Namespace) -> None:
+    for record in _bench_inputs(args.number):
+        print(json.dumps(record), flush=True)
+    for scale in args.scales:
+        for record in await _bench_scale(scale, args.number):
+            print(json.dumps(record), flush=True)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--scales', nargs='+', choices=SCALES, default=['small', 'medium'])
+    arg_parser.add_argument('--number', type=int, default=50_000)
+    args = arg_parser.parse_args()
+
+    logging.getLogger('dakap').setLevel(logging.WARNING)
+    logging.getLogger('dakap.count_emojis').setLevel(logging.WARNING)
+    asyncio.run(_main(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Compare the default mode with the low-memory mode, in the time and the peak memory (traced by
+`tracemalloc`) to scan a channel, and in the memory kept by the message cache of discord.py after
+receiving the messages.
+
+    python -m benchmarks.bench_memory --messages 100000 --emojis 100
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+import discord
+from discord.state import ConnectionState
+
+from dakap.count_emojis import _count_emojis_in_channel
+from dakap.emoji_index import EmojiIndex
+from dakap.emoji_matcher import EmojiMatcher
+from dakap.memory import LOW_MEMORY_ENV, get_memory_config
+
+from .fakes import (FakeChannel, FakeGuild, FakeHTTP, make_client, make_emojis, make_messages,
+                    to_raw_message)
+
+_CACHED_MESSAGES = 2000
+"""The number of the messages received by the message cache, more than it keeps in either mode"""
+
+
+def _make_text_channel(http: FakeHTTP, fake_channel: FakeChannel) -> discord.TextChannel:
+    """
+    A real channel whose history is served by the fake HTTP client, in a state with the client
+    options of the current mode.
+    """
+    state = ConnectionState(
+        dispatch=lambda *_args, **_kwargs: None,
+        handlers={},
+        hooks={},
+        http=http,
+        intents=discord.Intents.default(),
+        **get_memory_config().get_client_options(),
+    )
+    guild = discord.Guild(data={'id': str(fake_channel.guild.id), 'name': 'guild'}, state=state)
+    channel = discord.TextChannel(
+        state=state,
+        guild=guild,
+        data={
+            'id': str(fake_channel.id),
+            'type': 0,
+            'name': fake_channel.name,
+            'position': 0,
+            'permission_overwrites': [],
+        },
+    )
+    # pylint: disable=protected-access
+    state._add_guild(guild)
+    guild._add_channel(channel)
+    return channel
+
+
+async def _scan(
+    http: FakeHTTP,
+    channel: discord.TextChannel,
+    emoji_matcher: EmojiMatcher,
+    after_id: int,
+) -> None:
+    emoji_index = EmojiIndex(':memory:')
+    await _count_emojis_in_channel(
+        client=make_client(http),
+        channel=channel,
+        emoji_matcher=emoji_matcher,
+        after_id=after_id,
+        before_id=None,
+        emoji_index=emoji_index,
+    )
+    emoji_index.close()
+
+
+def _measure_message_cache(channel: discord.TextChannel, raw_messages: list[dict]) -> int:
+    """The memory kept by the message cache after receiving the messages from the gateway."""
+    state = channel._state  # pylint: disable=protected-access
+    tracemalloc.start()
+    for raw_message in raw_messages:
+        state.parse_message_create(raw_message)
+    current_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current_bytes
+
+
+def _measure(
+    low_memory: bool,
+    http: FakeHTTP,
+    fake_channel: FakeChannel,
+    emoji_matcher: EmojiMatcher,
+    after_id: int,
+) -> dict:
+    os.environ[LOW_MEMORY_ENV] = '1' if low_memory else '0'
+    get_memory_config.cache_clear()
+    channel = _make_text_channel(http, fake_channel)
+
+    start_time = time.perf_counter()
+    asyncio.run(_scan(http, channel, emoji_matcher, after_id))
+    seconds = time.perf_counter() - start_time
+
+    # Separately, since tracing slows it down
+    tracemalloc.start()
+    asyncio.run(_scan(http, channel, emoji_matcher, after_id))
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    raw_messages = [
+        {**to_raw_message(message, fake_channel.id), 'guild_id': str(fake_channel.guild.id)}
+        for message in fake_channel.messages[-_CACHED_MESSAGES:]
+    ]
+    return {
+        'seconds': seconds,
+        'peak_bytes': peak_bytes,
+        'message_cache_bytes': _measure_message_cache(channel, raw_messages),
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--messages', type=int, default=100_000)
+    arg_parser.add_argument('--emojis', type=int, default=100)
+    args = arg_parser.parse_args()
+
+    logging.getLogger('dakap').setLevel(logging.WARNING)
+    logging.getLogger('dakap.count_emojis').setLevel(logging.WARNING)
+
+    emojis = make_emojis(args.emojis)
+    emoji_matcher = EmojiMatcher(emojis)
+    fake_channel = FakeChannel(
+        channel_id=1000,
+        name='channel',
+        guild=FakeGuild(
+            id=1, shard_id=0, emojis=emojis, text_channels=[], threads=[], me=None, sent=[],
+        ),
+        messages=make_messages(args.messages, emojis),
+    )
+    http = FakeHTTP([fake_channel])
+    after_id = fake_channel.messages[0].id - 1
+
+    for low_memory in (False, True):
+        result = _measure(low_memory, http, fake_channel, emoji_matcher, after_id)
+        print(json.dumps({
+            'benchmark': 'memory',
+            'mode': 'low_memory' if low_memory else 'default',
+            'messages': args.messages,
+            'emojis': args.emojis,
+            **result,
+            'messages_per_second': args.messages / result['seconds'],
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Measure the per-message cost of `DakaP.on_message` for the messages which are not commands, the
+ones which only look like commands, and the commands (with no-op handlers).
+
+    python -m benchmarks.bench_on_message
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import shlex
+import sys
+from types import SimpleNamespace
+
+from dakap.command_pipeline import CommandPipeline
+from dakap.dakap import COMMANDS, DakaP
+
+from .timing import time_per_call
+
+MESSAGES = {
+    'chat': '早安，今天天氣不錯 https://example.com/ <:emoji_1:661720242585600001>',
+    'multiline_chat': '\n'.join(['lorem ipsum dolor sit amet'] * 10),
+    'price': 'it costs $5 and that is not a command',
+    'unknown_command': '$foo bar baz',
+    'command': '$time 12:00 JST',
+}
+
+
+def _legacy_parse(prefix: str, content: str) -> None:
+    """The previous per-line parsing, which ran `shlex` on every line with the prefix."""
+    for message_line in content.splitlines():
+        message_stripped = message_line.strip()
+        if message_stripped.startswith(prefix):
+            shlex.split(message_stripped)
+
+
+def _parse(client: DakaP, content: str) -> None:
+    """The parsing in `DakaP.on_message`."""
+    if client.prefix not in content:
+        return
+    for message_line in content.splitlines():
+        if client._match_command(message_line):  # pylint: disable=protected-access
+            client._parse_arguments(message_line)  # pylint: disable=protected-access
+
+
+async def _noop(_client, _message, _arguments) -> None:
+    pass
+
+
+async def run(number: int) -> None:
+    client = DakaP(commands=[command._replace(func=_noop) for command in COMMANDS])
+    # Queue all the commands, which run after the timing
+    client.command_pipeline = CommandPipeline(
+        max_queued=sys.maxsize,
+        max_channel_queued=sys.maxsize,
+    )
+    author = SimpleNamespace(bot=False)
+    channel = SimpleNamespace(id=1)
+
+    for name, content in MESSAGES.items():
+        message = SimpleNamespace(
+            id=0,
+            content=content,
+            author=author,
+            guild=None,
+            channel=channel,
+        )
+        coroutine_func = client.on_message
+
+        def run_on_message() -> None:
+            # Drive the coroutine directly, since it doesn't await unless a command is shed
+            try:
+                coroutine_func(message).send(None)  # pylint: disable=cell-var-from-loop
+            except StopIteration:
+                pass
+
+        print(json.dumps({
+            'benchmark': 'on_message',
+            'message': name,
+            'on_message_seconds': time_per_call(run_on_message, number),
+            'parse_seconds': time_per_call(
+                lambda: _parse(client, content),  # pylint: disable=cell-var-from-loop
+                number,
+            ),
+            'legacy_parse_seconds': time_per_call(
+                lambda: _legacy_parse(client.prefix, content),  # pylint: disable=cell-var-from-loop
+                number,
+            ),
+        }))
+        await client.command_pipeline.join()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--number', type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    logging.getLogger('dakap').setLevel(logging.WARNING)
+    asyncio.run(run(args.number))
+
+
+if __name__ == '__main__':
+    main()
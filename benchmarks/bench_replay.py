@@ -0,0 +1,324 @@
+"""
+Replay the gateway events recorded with `DAKAP_RECORD_EVENTS` into `DakaP` against the local
+stub of the Discord API, and measure the throughput, the latency of each command and the lag of
+the event loop. Without `--events`, replay generated events of a busy guild.
+
+    python -m benchmarks.bench_replay --events events.jsonl --speed 10
+    python -m benchmarks.bench_replay --generate 5000 --speed 0 --save events.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Iterable
+
+import discord
+
+from dakap.common import Command, CommandFunc, LazyCommandFunc
+from dakap.dakap import COMMANDS, DakaP
+from dakap.shards import DISCORD_API_ENV, use_discord_endpoints
+
+from .stub_discord import BOT_ID, StubDiscord, make_message, make_user
+
+GENERATED_COMMANDS = [
+    '$time',
+    '$time 12:00 JST',
+    '$yt https://youtu.be/dQw4w9WgXcQ',
+    '$help',
+    '$emoji 1d',
+    '$emoji top 5',
+]
+"""The commands in the generated messages, which don't need any other service"""
+
+
+class LagMonitor:
+    """Measure how late the event loop wakes up a task sleeping for the interval."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            start_time = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(time.perf_counter() - start_time - self.interval, 0.0))
+
+
+def generate_events(
+    message_count: int,
+    channel_count: int = 8,
+    emoji_count: int = 50,
+    messages_per_second: float = 20.0,
+    command_ratio: float = 0.05,
+    reaction_ratio: float = 0.2,
+    seed: int = 0,
+) -> list[dict[str, Any]]:
+    """Generate the events of a busy guild in the format of `EventRecorder`."""
+    rng = random.Random(seed)
+    guild_id = 1 << 22
+    bot_user = make_user(BOT_ID, 'dakap', bot=True)
+    users = [make_user(100 + index, f'user-{index}') for index in range(20)]
+    channel_ids = [guild_id + 1 + index for index in range(channel_count)]
+    emojis = [
+        {'id': str(guild_id + 1000 + index), 'name': f'emoji_{index}', 'animated': False}
+        for index in range(emoji_count)
+    ]
+    events = [
+        {'at': 0.0, 't': 'READY', 'd': {'user': bot_user}},
+        {'at': 0.0, 't': 'GUILD_CREATE', 'd': _guild(guild_id, channel_ids, emojis, bot_user)},
+    ]
+
+    base_id = discord.utils.time_snowflake(datetime.now(timezone.utc))
+    for index in range(message_count):
+        at = index / messages_per_second
+        message_id = base_id + index
+        channel_id = rng.choice(channel_ids)
+        if rng.random() < command_ratio:
+            content = '\n'.join(rng.sample(GENERATED_COMMANDS, 2 if rng.random() < 0.1 else 1))
+        else:
+            content = ' '.join(
+                f'<:{emoji["name"]}:{emoji["id"]}>' if rng.random() < 0.2 else f'word{word}'
+                for word, emoji in enumerate(rng.choices(emojis, k=rng.randint(1, 12)))
+            )
+        events.append({'at': at, 't': 'MESSAGE_CREATE', 'd': {
+            **make_message(
+                message_id=message_id,
+                channel_id=channel_id,
+                author=rng.choice(users),
+                content=content,
+            ),
+            'guild_id': str(guild_id),
+        }})
+        if rng.random() < reaction_ratio:
+            emoji = rng.choice(emojis)
+            events.append({'at': at, 't': 'MESSAGE_REACTION_ADD', 'd': {
+                'user_id': rng.choice(users)['id'],
+                'channel_id': str(channel_id),
+                'message_id': str(message_id),
+                'guild_id': str(guild_id),
+                'emoji': emoji,
+            }})
+    return events
+
+
+def load_events(path: str) -> list[dict[str, Any]]:
+    with open(path, encoding='utf-8') as events_file:
+        return [json.loads(line) for line in events_file if line.strip()]
+
+
+def save_events(path: str, events: Iterable[dict[str, Any]]) -> None:
+    with open(path, 'w', encoding='utf-8') as events_file:
+        events_file.writelines(json.dumps(event, ensure_ascii=False) + '\n' for event in events)
+
+
+async def replay(events: list[dict[str, Any]], speed: float, lag_interval: float) -> list[dict]:
+    """
+    Feed the events into the parsers of the state like the gateway, at the speed times the
+    recorded one, or as fast as possible if it is 0.
+    """
+    bot_user = next((event['d']['user'] for event in events if event['t'] == 'READY'), None)
+    stub = StubDiscord(bot_user=bot_user)
+    await stub.start()
+    os.environ[DISCORD_API_ENV] = stub.api_url
+    use_discord_endpoints()
+
+    latencies: dict[str, list[float]] = {}
+    dispatched_at: dict[int, float] = {}
+
+    def timed(command: Command) -> CommandFunc:
+        async def func(client, message, arguments) -> None:
+            try:
+                await command.func(client, message, arguments)
+            finally:
+                latencies.setdefault(command.names[0], []).append(
+                    time.perf_counter() - dispatched_at[message.id]
+                )
+
+        return func
+
+    client = DakaP(
+        commands=[command._replace(func=timed(command)) for command in COMMANDS],
+        warm_commands=False,
+    )
+    lag_monitor = LagMonitor(lag_interval)
+    try:
+        await client.login('token')
+        state = client._connection  # pylint: disable=protected-access
+        lag_monitor.start()
+
+        start_time = time.perf_counter()
+        for index, event in enumerate(events):
+            if speed:
+                if (delay := start_time + event['at'] / speed - time.perf_counter()) > 0:
+                    await asyncio.sleep(delay)
+            elif index % 100 == 0:
+                # Let the handlers run
+                await asyncio.sleep(0)
+            if event['t'] == 'READY':
+                continue
+            if event['t'] == 'GUILD_CREATE':
+                # Without chunking the members from the gateway
+                state._add_guild_from_data(event['d'])  # pylint: disable=protected-access
+                continue
+            if event['t'] == 'MESSAGE_CREATE':
+                stub.add_message(event['d'])
+                dispatched_at[int(event['d']['id'])] = time.perf_counter()
+            state.parsers[event['t']](event['d'])
+        await _wait_handlers(client)
+        elapsed = time.perf_counter() - start_time
+    finally:
+        lag_monitor.stop()
+        await client.close()
+        await stub.stop()
+
+    lags = sorted(lag_monitor.lags) or [0.0]
+    records = [{
+        'benchmark': 'replay',
+        'speed': f'{speed:g}',
+        'events': len(events),
+        'messages': len(dispatched_at),
+        'commands': sum(map(len, latencies.values())),
+        'elapsed': elapsed,
+        'recorded_seconds': events[-1]['at'] if events else 0.0,
+        'events_per_second': len(events) / elapsed,
+        'loop_lag_p50_seconds': _percentile(lags, 0.5),
+        'loop_lag_p99_seconds': _percentile(lags, 0.99),
+        'loop_lag_max_seconds': lags[-1],
+        'api_requests': sum(stub.request_counts.values()),
+        'shed': client.command_pipeline.shed_count,
+    }]
+    for command_name, command_latencies in sorted(latencies.items()):
+        command_latencies.sort()
+        records.append({
+            'benchmark': 'replay',
+            'command': command_name,
+            'count': len(command_latencies),
+            'p50_seconds': statistics.median(command_latencies),
+            'p95_seconds': _percentile(command_latencies, 0.95),
+            'p99_seconds': _percentile(command_latencies, 0.99),
+        })
+    return records
+
+
+async def _wait_handlers(client: DakaP) -> None:
+    """Wait for the dispatched events and the commands queued by them."""
+    while True:
+        await asyncio.sleep(0)
+        if handlers := [
+            task for task in asyncio.all_tasks() if task.get_name().startswith('discord.py: on_')
+        ]:
+            await asyncio.wait(handlers)
+        elif client.command_pipeline.depth or client.command_pipeline.running:
+            await client.command_pipeline.join()
+        else:
+            return
+
+
+def _percentile(sorted_values: list[float], quantile: float) -> float:
+    return sorted_values[min(int(len(sorted_values) * quantile), len(sorted_values) - 1)]
+
+
+def _guild(guild_id: int, channel_ids: list[int], emojis: list[dict], bot_user: dict) -> dict:
+    joined_at = datetime.now(timezone.utc).isoformat()
+    return {
+        'id': str(guild_id),
+        'name': 'replay',
+        'icon': None,
+        'owner_id': bot_user['id'],
+        'unavailable': False,
+        'member_count': 1,
+        'roles': [{
+            'id': str(guild_id),
+            'name': '@everyone',
+            'permissions': str(discord.Permissions.text().value),
+            'position': 0,
+            'color': 0,
+            'hoist': False,
+            'managed': False,
+            'mentionable': False,
+        }],
+        'emojis': [
+            {**emoji, 'roles': [], 'require_colons': True, 'managed': False, 'available': True}
+            for emoji in emojis
+        ],
+        'stickers': [],
+        'features': [],
+        'channels': [
+            {
+                'id': str(channel_id),
+                'type': 0,
+                'name': f'channel-{index}',
+                'position': index,
+                'permission_overwrites': [],
+            }
+            for index, channel_id in enumerate(channel_ids)
+        ],
+        'threads': [],
+        'members': [
+            {
+                'user': bot_user,
+                'roles': [],
+                'joined_at': joined_at,
+                'deaf': False,
+                'mute': False,
+                'flags': 0,
+            },
+        ],
+        'voice_states': [],
+        'presences': [],
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--events', help='The JSONL file recorded with DAKAP_RECORD_EVENTS')
+    arg_parser.add_argument('--generate', type=int, default=2_000, help='Messages to generate')
+    arg_parser.add_argument('--save', help='Save the generated events into the JSONL file')
+    arg_parser.add_argument(
+        '--speed',
+        type=float,
+        default=1.0,
+        help='Times the recorded speed, or 0 for as fast as possible',
+    )
+    arg_parser.add_argument('--lag-interval', type=float, default=0.01)
+    args = arg_parser.parse_args()
+
+    for command in COMMANDS:
+        # Imported beforehand, like `warm_commands` after ready
+        if isinstance(command.func, LazyCommandFunc):
+            command.func.load()
+    logging.getLogger('dakap').setLevel(logging.WARNING)
+    logging.getLogger('dakap.count_emojis').setLevel(logging.WARNING)
+    logging.getLogger('discord').setLevel(logging.WARNING)
+    if args.events:
+        events = load_events(args.events)
+    else:
+        events = generate_events(args.generate)
+        if args.save:
+            save_events(args.save, events)
+
+    # The index, the cubes and the live counts outside the working directory
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for record in asyncio.run(replay(events, args.speed, args.lag_interval)):
+            print(json.dumps(record))
+
+
+if __name__ == '__main__':
+    main()
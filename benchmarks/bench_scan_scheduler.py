@@ -0,0 +1,92 @@
+"""
+Tune the concurrency of the channel scans against a fake history source with latency and a
+rate limit.
+
+    python -m benchmarks.bench_scan_scheduler --concurrency 1 2 4 8 16 64
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from functools import partial
+
+from dakap.scan_scheduler import ScanJob, ScanScheduler
+
+from .fakes import FakeChannel, FakeRateLimit, make_guild
+
+
+async def _fetch_all(channel: FakeChannel) -> int:
+    fetched_count = 0
+    async for _message in channel.history(limit=None):
+        fetched_count += 1
+    return fetched_count
+
+
+async def run(
+    concurrency: int,
+    channel_count: int,
+    message_count: int,
+    latency: float,
+    rate: float,
+    burst: int,
+) -> dict:
+    """Scan all the channels of a fake guild with the concurrency and return the stats."""
+    rate_limit = FakeRateLimit(rate=rate, burst=burst)
+    guild = make_guild(
+        channel_count=channel_count,
+        emoji_count=0,
+        message_count=message_count,
+        latency=latency,
+        rate_limit=rate_limit,
+    )
+    scheduler = ScanScheduler(max_concurrency=concurrency)
+    start_time = time.perf_counter()
+    stats = await scheduler.run(
+        ScanJob(
+            channel_name=channel.name,
+            expected_size=len(channel.messages),
+            scan=partial(_fetch_all, channel),
+        )
+        for channel in guild.text_channels
+    )
+    elapsed = time.perf_counter() - start_time
+    throughputs = sorted(channel_stats.throughput for channel_stats in stats)
+    fetched_count = sum(channel_stats.message_count for channel_stats in stats)
+    return {
+        'benchmark': 'scan_scheduler',
+        'concurrency': concurrency,
+        'channels': channel_count,
+        'messages': fetched_count,
+        'elapsed': elapsed,
+        'messages_per_second': fetched_count / elapsed,
+        'median_channel_throughput': throughputs[len(throughputs) // 2],
+        'rate_limited': rate_limit.rate_limited_count,
+        'final_concurrency': scheduler.concurrency,
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 64])
+    arg_parser.add_argument('--channels', type=int, default=64)
+    arg_parser.add_argument('--messages', type=int, default=50_000)
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='Seconds per page')
+    arg_parser.add_argument('--rate', type=float, default=50.0, help='Requests per second')
+    arg_parser.add_argument('--burst', type=int, default=10)
+    args = arg_parser.parse_args()
+
+    for concurrency in args.concurrency:
+        result = asyncio.run(run(
+            concurrency=concurrency,
+            channel_count=args.channels,
+            message_count=args.messages,
+            latency=args.latency,
+            rate=args.rate,
+            burst=args.burst,
+        ))
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
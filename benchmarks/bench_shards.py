@@ -0,0 +1,81 @@
+"""
+Measure starting the shards in the worker processes against the local stub of Discord, and
+restarting a killed worker.
+
+    python -m benchmarks.bench_shards --shards 4 --processes 2 --guilds 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import tempfile
+import time
+from collections import Counter as counter
+from functools import partial
+
+from dakap.dakap import run
+from dakap.shards import DISCORD_API_ENV, DISCORD_GATEWAY_ENV, Supervisor
+
+from .stub_discord import StubDiscord
+
+
+async def _bench(shard_count: int, process_count: int, guild_count: int) -> dict:
+    stub = StubDiscord(guild_count=guild_count)
+    await stub.start()
+    # Inherited by the worker processes
+    os.environ[DISCORD_API_ENV] = stub.api_url
+    os.environ[DISCORD_GATEWAY_ENV] = stub.gateway_url
+
+    supervisor = Supervisor(
+        runner=partial(run, 'token'),
+        shard_count=shard_count,
+        process_count=process_count,
+    )
+    all_shard_ids = list(range(shard_count))
+    start_time = time.perf_counter()
+    supervisor_task = asyncio.ensure_future(asyncio.to_thread(supervisor.run))
+    try:
+        await stub.wait_identified(all_shard_ids, counter())
+        startup_seconds = time.perf_counter() - start_time
+
+        # Kill a worker, and wait for its shards to come back
+        worker = supervisor.workers[0]
+        assert worker.process is not None and worker.process.pid is not None
+        identify_counts = stub.identify_counts.copy()
+        start_time = time.perf_counter()
+        os.kill(worker.process.pid, signal.SIGKILL)
+        await stub.wait_identified(worker.shard_ids, identify_counts)
+        restart_seconds = time.perf_counter() - start_time
+    finally:
+        supervisor.stop()
+        await supervisor_task
+        await stub.stop()
+
+    return {
+        'benchmark': 'shards',
+        'shards': shard_count,
+        'processes': len(supervisor.workers),
+        'guilds': guild_count,
+        'startup_seconds': startup_seconds,
+        'restart_seconds': restart_seconds,
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--shards', type=int, default=4)
+    arg_parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    arg_parser.add_argument('--guilds', type=int, default=100)
+    args = arg_parser.parse_args()
+
+    # Keep the files of the workers, e.g. the emoji index, out of the working directory
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for process_count in args.processes:
+            print(json.dumps(asyncio.run(_bench(args.shards, process_count, args.guilds))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Measure the import time of the bot and of each command module, from `python -X importtime`.
+
+    python -m benchmarks.bench_startup
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+COMMAND_MODULES = [
+    'dakap.count_emojis',
+    'dakap.get_time',
+    'dakap.misc',
+    'dakap.stock',
+    'dakap.youtube_thumbnail',
+]
+HEAVY_MODULES = ['yfinance', 'pandas', 'numpy', 'dateutil.parser._parser']
+
+
+def _import_times(module_name: str) -> dict[str, int]:
+    """
+    Import the module in a fresh interpreter, and get the cumulative import time of each module.
+    """
+    completed = subprocess.run(
+        [
+            sys.executable,
+            '-X',
+            'importtime',
+            '-c',
+            f'import {module_name}',
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    import_times = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_time, cumulative_time, imported = line.removeprefix('import time:').split('|')
+        import_times[imported.strip()] = int(cumulative_time)
+    return import_times
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    for module_name in ['dakap.dakap', *COMMAND_MODULES]:
+        runs = [_import_times(module_name) for _ in range(args.repeat)]
+        print(json.dumps({
+            'benchmark': 'startup',
+            'module': module_name,
+            'import_seconds': min(run[module_name] for run in runs) / 1_000_000,
+            'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in runs[0]],
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Measure `$stock` with many concurrent users against the local stub of Yahoo! Finance.
+
+    python -m benchmarks.bench_stock --users 50 --symbols 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from functools import partial
+from types import SimpleNamespace
+
+from dakap import stock
+from dakap.shared_store import get_shared_store
+
+from .fakes import FakeTyping
+from .stub_yahoo import UNKNOWN_PREFIX, StubYahoo
+
+
+async def run(users: int, symbol_count: int, latency: float) -> dict:
+    stub = StubYahoo(latency=latency)
+    stock.STOCK_QUOTE_URL = await stub.start()
+    stock.STOCK_CHART_URL = stub.chart_url
+    # Not to reuse the quotes of the previous runs
+    stock.get_shared_store = partial(get_shared_store, ':memory:')
+
+    replies: list[int] = []
+    fields: list[int] = []
+    edits: list[int] = []
+
+    async def edit(embeds) -> None:
+        edits.append(len(embeds))
+        fields.extend(len(embed.fields) for embed in embeds)
+
+    async def reply(embeds) -> SimpleNamespace:
+        replies.append(len(embeds))
+        fields.extend(len(embed.fields) for embed in embeds)
+        return SimpleNamespace(edit=edit)
+
+    message = SimpleNamespace(channel=SimpleNamespace(typing=FakeTyping), reply=reply)
+    symbols = [f'SYM{index}' for index in range(symbol_count - 1)] + [f'{UNKNOWN_PREFIX}0']
+
+    start_time = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            stock.get_stocks_prices(None, message, ['stock', *symbols[user % 3:]])
+            for user in range(users)
+        ))
+    finally:
+        await stub.stop()
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        'benchmark': 'stock',
+        'users': users,
+        'symbols': symbol_count,
+        'elapsed': elapsed,
+        'upstream_requests': stub.request_count,
+        'upstream_symbols': stub.symbol_count,
+        'embeds': sum(replies),
+        'edits': len(edits),
+        'sparklines': sum(fields),
+        'upstream_chart_requests': stub.chart_request_count,
+        'cache_hits': stock.quote_cache.hits,
+        'cache_misses': stock.quote_cache.misses,
+        'cache_coalesced': stock.quote_cache.coalesced,
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--users', type=int, default=50)
+    arg_parser.add_argument('--symbols', type=int, default=10)
+    arg_parser.add_argument('--latency', type=float, default=0.2, help='Seconds per request')
+    args = arg_parser.parse_args()
+
+    # The price history outside the working directory
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        print(json.dumps(asyncio.run(run(
+            users=args.users,
+            symbol_count=args.symbols,
+            latency=args.latency,
+        ))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Measure getting the price history of `$stock` against the local stub of Yahoo! Finance, when
+it is cold, when only the new bars are fetched into the cache, and after restarting (memory-mapped
+from the disk), and rendering the sparklines.
+
+    python -m benchmarks.bench_stock_history --symbols 10 --calls 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import timeit
+
+import numpy as np
+
+from dakap import stock
+from dakap.stock_history import (HISTORY_INTERVAL_SECONDS, STOCK_HISTORY_DIR,
+                                 get_price_history_store, render_sparkline)
+
+from .stub_yahoo import StubYahoo
+
+
+async def run(symbol_count: int, call_count: int, latency: float) -> list[dict]:
+    stub = StubYahoo(latency=latency)
+    await stub.start()
+    stock.STOCK_CHART_URL = stub.chart_url
+    symbols = [f'SYM{index}' for index in range(symbol_count)]
+
+    async def get_histories(phase: str) -> dict:
+        # As if the cached bars in memory are expired
+        stock.history_cache.invalidate()
+        request_count, bar_count = stub.chart_request_count, stub.bar_count
+        start_time = time.perf_counter()
+        histories = await asyncio.gather(*map(stock.get_price_history, symbols))
+        return {
+            'benchmark': 'stock_history',
+            'phase': phase,
+            'symbols': symbol_count,
+            'seconds': time.perf_counter() - start_time,
+            'upstream_requests': stub.chart_request_count - request_count,
+            'upstream_bars': stub.bar_count - bar_count,
+            'bars': sum(len(history.timestamps) for history in histories),
+        }
+
+    try:
+        records = [await get_histories('cold')]
+        for _ in range(call_count):
+            records.append(await get_histories('incremental'))
+        # As if restarted, with the bars on the disk
+        get_price_history_store.cache_clear()
+        records.append(await get_histories('restarted'))
+        history = await stock.get_price_history(symbols[0])
+    finally:
+        await stub.stop()
+
+    disk_bytes = sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for directory, _, filenames in os.walk(STOCK_HISTORY_DIR)
+        for filename in filenames
+    )
+    number = 1000
+    records.append({
+        'benchmark': 'stock_history',
+        'phase': 'render',
+        'bars': len(history.timestamps),
+        'disk_bytes_per_symbol': disk_bytes // symbol_count,
+        'sparkline': render_sparkline(history.closes),
+        'sparkline_seconds': timeit.timeit(
+            lambda: render_sparkline(history.closes),
+            number=number,
+        ) / number,
+        'session_sparkline_seconds': timeit.timeit(
+            lambda: render_sparkline(history.last_session().closes),
+            number=number,
+        ) / number,
+        'interval_seconds': HISTORY_INTERVAL_SECONDS,
+        'is_memory_mapped': isinstance(history.closes.base, np.memmap)
+        or isinstance(history.closes, np.memmap),
+    })
+    return records
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--symbols', type=int, default=10)
+    arg_parser.add_argument('--calls', type=int, default=5, help='Incremental calls')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='Seconds per request')
+    args = arg_parser.parse_args()
+
+    # The history outside the working directory
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for record in asyncio.run(run(args.symbols, args.calls, args.latency)):
+            print(json.dumps(record, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Measure polling the watched stocks and the alerts of many channels against the local stub of
+Yahoo! Finance, where the upstream requests should grow with the distinct symbols only.
+
+    python -m benchmarks.bench_stock_watch --channels 10 100 1000 --symbols 20 --polls 5
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from functools import partial
+from types import SimpleNamespace
+
+from dakap import stock
+from dakap.shared_store import get_shared_store
+from dakap.stock_watch import MAX_WATCHES_PER_CHANNEL, StockWatcher
+from dakap.stock_watch_store import StockWatchStore
+
+from .fakes import FakeSentMessage
+from .stub_yahoo import StubYahoo
+
+
+class _Channel:
+    """A channel which records the sent messages."""
+
+    def __init__(self, channel_id: int):
+        self.id = channel_id  # pylint: disable=invalid-name
+        self.sent: list[FakeSentMessage] = []
+
+    async def send(self, content: str | None = None, **_kwargs) -> FakeSentMessage:
+        self.sent.append(FakeSentMessage(content))
+        return self.sent[-1]
+
+
+async def run(
+    channel_count: int,
+    symbol_count: int,
+    alert_count: int,
+    poll_count: int,
+    latency: float,
+    seed: int = 0,
+) -> dict:
+    rng = random.Random(seed)
+    stub = StubYahoo(latency=latency, seed=seed)
+    stock.STOCK_QUOTE_URL = await stub.start()
+    stock.get_shared_store = partial(get_shared_store, ':memory:')
+    # Every poll is after the prices are expired
+    stock.STOCK_PRICE_TTL = 0
+
+    symbols = [f'SYM{index}' for index in range(symbol_count)]
+    store = StockWatchStore(':memory:')
+    channels = {channel_id: _Channel(channel_id) for channel_id in range(1, channel_count + 1)}
+    for channel_id in channels:
+        store.add_watches(channel_id, rng.sample(
+            symbols,
+            rng.randint(1, min(MAX_WATCHES_PER_CHANNEL, symbol_count)),
+        ))
+    for index in range(alert_count):
+        store.add_alert(
+            channel_id=rng.choice(list(channels)),
+            user_id=index,
+            symbol=rng.choice(symbols),
+            direction=rng.choice(['above', 'below']),
+            threshold=rng.uniform(10, 1000),
+        )
+    subscription_count = sum(map(len, store.get_watches().values()))
+
+    watcher = StockWatcher(store)
+    client = SimpleNamespace(get_channel=channels.get)
+    poll_seconds = []
+    try:
+        for _ in range(poll_count):
+            stock.quote_cache.invalidate()
+            start_time = time.perf_counter()
+            await watcher.poll(client)
+            poll_seconds.append(time.perf_counter() - start_time)
+    finally:
+        await stub.stop()
+
+    sent_messages = [message for channel in channels.values() for message in channel.sent]
+    return {
+        'benchmark': 'stock_watch',
+        'channels': channel_count,
+        'subscriptions': subscription_count,
+        'distinct_symbols': symbol_count,
+        'polls': watcher.poll_count,
+        'poll_seconds': sum(poll_seconds) / len(poll_seconds),
+        'max_poll_seconds': max(poll_seconds),
+        'upstream_requests': stub.request_count,
+        'upstream_symbols': stub.symbol_count,
+        'sends': len(sent_messages),
+        'edits': sum(len(message.edits) for message in sent_messages),
+        'alerts': alert_count,
+        'alerts_sent': watcher.sent_alert_count,
+        'alerts_left': len(store.get_alerts()),
+    }
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--channels', type=int, nargs='+', default=[10, 100, 1_000])
+    arg_parser.add_argument('--symbols', type=int, default=20, help='Distinct symbols')
+    arg_parser.add_argument('--alerts', type=int, default=100)
+    arg_parser.add_argument('--polls', type=int, default=5)
+    arg_parser.add_argument('--latency', type=float, default=0.2, help='Seconds per request')
+    args = arg_parser.parse_args()
+
+    for channel_count in args.channels:
+        print(json.dumps(asyncio.run(run(
+            channel_count=channel_count,
+            symbol_count=args.symbols,
+            alert_count=args.alerts,
+            poll_count=args.polls,
+            latency=args.latency,
+        ))))
+
+
+if __name__ == '__main__':
+    main()
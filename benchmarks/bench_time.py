@@ -0,0 +1,86 @@
+"""
+Compare `_get_from_time` of `$time` with the previous implementation, which always ran
+`dateutil.parser.parse` with a new `tzinfos` closure.
+
+    python -m benchmarks.bench_time
+"""
+
+import argparse
+import json
+import timeit
+from datetime import datetime
+from functools import partial
+
+from dateutil import parser
+from dateutil.tz import gettz
+
+from dakap.get_time import DEFAULT_TIMEZONE_NAME, _get_from_time
+
+INPUTS = [
+    '21:30',
+    '9:05',
+    '2023-01-02 21:30',
+    '2023-01-02 21:30:15',
+    '21:30 JST',
+    '21:30 ET',
+    '21:30 UTC',
+    '9PM',
+    '2023/01/02 21:30 PST',
+    'TOMORROW',
+]
+
+
+def _legacy_get_from_time(specific_time_str: str) -> datetime:
+    default_dt = datetime.now(tz=gettz(DEFAULT_TIMEZONE_NAME)).replace(second=0, microsecond=0)
+
+    def tzinfo_func(tzname: str, tzoffset: int):
+        if tzoffset:
+            return tzoffset
+
+        iana_tz = gettz(tzname)
+        if iana_tz:
+            return iana_tz
+
+        if tzname in ['US', 'ET']:
+            return gettz('America/New_York')
+        if tzname in ['JP', 'JPN', 'JAPAN', 'JST']:
+            return gettz('Asia/Tokyo')
+        if tzname in ['TW', 'TWN', 'TAIPEI', 'TPE', 'NST', 'CST']:
+            return gettz('Asia/Taipei')
+
+        return gettz(DEFAULT_TIMEZONE_NAME)
+
+    return parser.parse(specific_time_str, default=default_dt, tzinfos=tzinfo_func)
+
+
+def _result(func, time_str: str) -> str:
+    try:
+        return func(time_str).isoformat()
+    except parser.ParserError:  # type: ignore
+        return 'ParserError'
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--number', type=int, default=5_000)
+    args = arg_parser.parse_args()
+
+    for time_str in INPUTS:
+        print(json.dumps({
+            'benchmark': 'get_from_time',
+            'input': time_str,
+            'same_result': _result(_get_from_time, time_str)
+            == _result(_legacy_get_from_time, time_str),
+            'seconds': timeit.timeit(
+                partial(_result, _get_from_time, time_str),
+                number=args.number,
+            ) / args.number,
+            'legacy_seconds': timeit.timeit(
+                partial(_result, _legacy_get_from_time, time_str),
+                number=args.number,
+            ) / args.number,
+        }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Measure finding the YouTube video IDs in adversarial long inputs, against the previous pattern
+which backtracks on them.
+
+    python -m benchmarks.bench_youtube --lengths 1000 10000 100000 --legacy-max-length 1000
+"""
+
+import argparse
+import json
+import re
+from functools import partial
+from typing import Callable
+
+from dakap.youtube_thumbnail import find_youtube_video_ids
+
+from .timing import time_per_call
+
+_LEGACY_PATTERN = re.compile(
+    r'^.*(?:(?:youtu\.be\/|v\/|vi\/|u\/\w\/|embed\/|live\/)|(?:(?:watch)?\?v(?:i)?=|\&v(?:i)?=))'
+    r'([^#\&\?]+).*'
+)
+
+INPUTS: dict[str, Callable[[int], str]] = {
+    # name: make an input of about the length
+    'repeated_markers': lambda length: 'v/' * (length // 2) + '\n#\n',
+    'repeated_hosts': lambda length: 'youtube.com/watch?v=' * (length // 20),
+    'long_query': lambda length: 'https://www.youtube.com/watch?' + 'a=1&' * (length // 4),
+    'no_url': lambda length: 'lorem ipsum ' * (length // 12),
+    'many_urls': lambda length: ' '.join(
+        f'https://youtu.be/{index:011d}' for index in range(length // 29)
+    ),
+}
+
+
+def _legacy_find_video_ids(text: str) -> list:
+    # One line at a time, as it was used
+    return [_LEGACY_PATTERN.fullmatch(line) for line in text.split(' ')]
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument('--lengths', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    arg_parser.add_argument(
+        '--legacy-max-length',
+        type=int,
+        default=1_000,
+        help='the longest input for the previous pattern, which takes cubic time',
+    )
+    args = arg_parser.parse_args()
+
+    for name, make_input in INPUTS.items():
+        for length in args.lengths:
+            text = make_input(length)
+            record = {
+                'benchmark': 'youtube',
+                'input': name,
+                'length': len(text),
+                'video_ids': len(find_youtube_video_ids(text)),
+                'seconds': time_per_call(partial(find_youtube_video_ids, text)),
+            }
+            if length <= args.legacy_max_length:
+                record['legacy_seconds'] = time_per_call(partial(_legacy_find_video_ids, text))
+            print(json.dumps(record))
+
+
+if __name__ == '__main__':
+    main()
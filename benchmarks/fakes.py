@@ -0,0 +1,338 @@
+"""Fake Discord objects and a fake history source with a simulated rate limit"""
+
+import asyncio
+import bisect
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import AsyncIterator, Sequence
+
+import discord
+import yarl
+
+from dakap.http_trace import notify_response
+
+PAGE_SIZE = 100
+"""Number of messages per history request, as in discord.py"""
+
+
+class FakeEmoji:
+    """Formatted and hashed like `discord.Emoji`"""
+
+    def __init__(self, emoji_id: int, name: str, animated: bool = False):
+        self.id = emoji_id  # pylint: disable=invalid-name
+        self.name = name
+        self.animated = animated
+
+    def __str__(self) -> str:
+        return f'<{"a" if self.animated else ""}:{self.name}:{self.id}>'
+
+    def __hash__(self) -> int:
+        return self.id >> 22
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FakeEmoji) and other.id == self.id
+
+
+class FakeReaction(SimpleNamespace):
+    emoji: FakeEmoji | str
+    count: int
+
+
+class FakeMessage(SimpleNamespace):
+    id: int
+    content: str
+    reactions: list[FakeReaction]
+    author: SimpleNamespace
+
+
+class FakeRateLimit:
+    """A token bucket shared by the requests, which answers 429 when it is empty."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.rate_limited_count = 0
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    async def acquire(self, url: yarl.URL) -> None:
+        """Wait until the request is allowed, like discord.py retrying after a 429."""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                notify_response('GET', url, 200)
+                return
+            self.rate_limited_count += 1
+            notify_response('GET', url, 429)
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class FakeChannel:
+    """A channel with a history which is fetched in pages with latency and a rate limit."""
+
+    def __init__(
+        self,
+        channel_id: int,
+        name: str,
+        guild: 'FakeGuild',
+        messages: Sequence[FakeMessage],
+        latency: float = 0.0,
+        rate_limit: FakeRateLimit | None = None,
+    ):
+        self.id = channel_id  # pylint: disable=invalid-name
+        self.name = name
+        self.guild = guild
+        self.messages = messages
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.last_message_id = messages[-1].id if messages else None
+        self.request_count = 0
+        self._url = yarl.URL(f'https://discord.com/api/v10/channels/{channel_id}/messages')
+
+    def permissions_for(self, _member) -> SimpleNamespace:
+        return SimpleNamespace(read_message_history=True)
+
+    async def history(
+        self,
+        *,
+        limit: int | None = 100,
+        before: discord.abc.Snowflake | None = None,
+        after: discord.abc.Snowflake | None = None,
+        oldest_first: bool | None = None,  # pylint: disable=unused-argument
+    ) -> AsyncIterator[FakeMessage]:
+        """Yield the messages between `after` and `before`, oldest first."""
+        messages = [
+            message
+            for message in self.messages
+            if (after is None or message.id > after.id)
+            and (before is None or message.id < before.id)
+        ][:limit]
+        for page_start in range(0, max(len(messages), 1), PAGE_SIZE):
+            self.request_count += 1
+            if self.rate_limit:
+                await self.rate_limit.acquire(self._url)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            for message in messages[page_start:page_start + PAGE_SIZE]:
+                yield message
+
+    def typing(self) -> 'FakeTyping':
+        return FakeTyping()
+
+    async def send(self, content: str | None = None, **_kwargs) -> 'FakeSentMessage':
+        self.guild.sent.append(content)
+        return FakeSentMessage(content)
+
+
+class FakeTyping:
+    async def __aenter__(self) -> None:
+        pass
+
+    async def __aexit__(self, *_exc_info) -> None:
+        pass
+
+
+class FakeGuild(SimpleNamespace):
+    id: int
+    shard_id: int
+    emojis: list[FakeEmoji]
+    text_channels: list[FakeChannel]
+    threads: list[FakeChannel]
+    me: SimpleNamespace
+    sent: list[str | None]
+
+
+def make_emojis(count: int, animated_ratio: float = 0.2, seed: int = 0) -> list[FakeEmoji]:
+    """Make the custom emojis of a guild."""
+    rng = random.Random(seed)
+    base_id = discord.utils.time_snowflake(datetime(2020, 1, 1, tzinfo=timezone.utc))
+    return [
+        FakeEmoji(base_id + index, f'emoji_{index}', animated=rng.random() < animated_ratio)
+        for index in range(count)
+    ]
+
+
+def make_messages(
+    count: int,
+    emojis: Sequence[FakeEmoji],
+    period: timedelta = timedelta(weeks=12),
+    emoji_ratio: float = 0.3,
+    reaction_ratio: float = 0.2,
+    seed: int = 0,
+) -> list[FakeMessage]:
+    """Make the messages spread over the period until now, oldest first."""
+    rng = random.Random(seed)
+    end = datetime.now(tz=timezone.utc)
+    start = end - period
+    author = SimpleNamespace(bot=False, id=1)
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', '早安', 'https://example.com/']
+    messages = []
+    for index in range(count):
+        created_at = start + period * (index + 0.5) / count
+        parts = rng.choices(words, k=rng.randint(1, 12))
+        if emojis and rng.random() < emoji_ratio:
+            parts += map(str, rng.choices(emojis, k=rng.randint(1, 3)))
+            rng.shuffle(parts)
+        reactions = []
+        if emojis and rng.random() < reaction_ratio:
+            reactions = [
+                FakeReaction(emoji=emoji, count=rng.randint(1, 5))
+                for emoji in rng.sample(list(emojis), k=min(len(emojis), rng.randint(1, 3)))
+            ]
+        messages.append(FakeMessage(
+            id=discord.utils.time_snowflake(created_at) + index % 4096,
+            content=' '.join(parts),
+            reactions=reactions,
+            author=author,
+        ))
+    return messages
+
+
+def make_guild(
+    channel_count: int,
+    emoji_count: int,
+    message_count: int,
+    latency: float = 0.0,
+    rate_limit: FakeRateLimit | None = None,
+    seed: int = 0,
+) -> FakeGuild:
+    """
+    Make a guild with the messages spread over the channels with a skewed distribution, like a
+    few busy channels and many quiet ones.
+    """
+    rng = random.Random(seed)
+    emojis = make_emojis(emoji_count, seed=seed)
+    guild = FakeGuild(
+        id=seed + 1,
+        shard_id=0,
+        emojis=emojis,
+        text_channels=[],
+        threads=[],
+        me=SimpleNamespace(id=0),
+        sent=[],
+    )
+    weights = [1 / (rank + 1) for rank in range(channel_count)]
+    sizes = [int(message_count * weight / sum(weights)) for weight in weights]
+    rng.shuffle(sizes)
+    for index, size in enumerate(sizes):
+        guild.text_channels.append(FakeChannel(
+            channel_id=1000 + index,
+            name=f'channel-{index}',
+            guild=guild,
+            messages=make_messages(size, emojis, seed=seed + index),
+            latency=latency,
+            rate_limit=rate_limit,
+        ))
+    return guild
+
+
+class FakeHTTP:
+    """Serve the history of the channels as raw payloads, like `discord.http.HTTPClient`."""
+
+    def __init__(self, channels: Sequence[FakeChannel]):
+        self.channels = {channel.id: channel for channel in channels}
+        self.request_count = 0
+        self._message_ids = {
+            channel.id: [message.id for message in channel.messages]
+            for channel in channels
+        }
+
+    async def logs_from(
+        self,
+        channel_id: int,
+        limit: int,
+        before: int | None = None,
+        after: int | None = None,
+        around: int | None = None,  # pylint: disable=unused-argument
+    ) -> list[dict]:
+        """The messages after `after` (or before `before`), newest first."""
+        self.request_count += 1
+        messages = self.channels[int(channel_id)].messages
+        message_ids = self._message_ids[int(channel_id)]
+        if after is not None:
+            start = bisect.bisect_right(message_ids, int(after))
+            page = messages[start:start + limit]
+        else:
+            end = bisect.bisect_left(message_ids, int(before)) if before is not None else None
+            page = messages[:end][-limit:]
+        return [to_raw_message(message, channel_id) for message in reversed(page)]
+
+
+def to_raw_message(message: FakeMessage, channel_id: int) -> dict:
+    """The payload of the message in the Discord API."""
+    return {
+        'id': str(message.id),
+        'channel_id': str(channel_id),
+        'author': {
+            'id': str(message.author.id),
+            'username': 'user',
+            'discriminator': '0',
+            'avatar': None,
+        },
+        'content': message.content,
+        'timestamp': discord.utils.snowflake_time(message.id).isoformat(),
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'pinned': False,
+        'type': 0,
+        'reactions': [
+            {
+                'count': reaction.count,
+                'me': False,
+                'emoji': (
+                    {'id': None, 'name': reaction.emoji}
+                    if isinstance(reaction.emoji, str)
+                    else {
+                        'id': str(reaction.emoji.id),
+                        'name': reaction.emoji.name,
+                        'animated': reaction.emoji.animated,
+                    }
+                ),
+            }
+            for reaction in message.reactions
+        ],
+    }
+
+
+def make_client(http: FakeHTTP | None = None) -> SimpleNamespace:
+    """A client whose user is not the author of any fake message."""
+    return SimpleNamespace(user=SimpleNamespace(bot=True, id=0), http=http)
+
+
+class FakeSentMessage:
+    """A sent message, which records its edits"""
+
+    def __init__(self, content: str | None):
+        self.content = content
+        self.edits: list[str | None] = []
+
+    async def edit(self, content: str | None = None, **_kwargs) -> None:
+        self.content = content
+        self.edits.append(content)
+
+
+def make_command_message(guild: FakeGuild, content: str = '$emoji') -> SimpleNamespace:
+    """A message which invokes a command in the first channel of the guild."""
+    channel = guild.text_channels[0]
+
+    async def reply(content: str | None = None, **_kwargs) -> FakeSentMessage:
+        guild.sent.append(content)
+        return FakeSentMessage(content)
+
+    return SimpleNamespace(
+        guild=guild,
+        channel=channel,
+        content=content,
+        author=SimpleNamespace(bot=False, id=2),
+        reply=reply,
+    )
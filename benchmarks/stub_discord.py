@@ -0,0 +1,289 @@
+"""
+A local stub of the Discord API and the gateway, enough for the bot to log in, shard, and read
+and send the messages of the channels
+"""
+
+import asyncio
+import bisect
+import itertools
+import json
+from collections import Counter as counter
+from datetime import datetime, timezone
+from typing import Counter
+
+import discord
+from aiohttp import WSMsgType, web
+
+API_PREFIX = '/api/v10'
+BOT_ID = 1
+OWNER_ID = 2
+HEARTBEAT_INTERVAL = 45_000
+"""Milliseconds between the heartbeats of the client"""
+
+
+class StubDiscord:
+    """
+    Serve the login, the application commands and the gateway, where each shard gets READY and
+    then GUILD_CREATE of its guilds. Count the identifications of each shard.
+    Serve the history of the messages added, and accept the sent and the edited messages.
+    Count the requests of the messages by the method and the route.
+    """
+
+    def __init__(
+        self,
+        guild_count: int = 0,
+        recommended_shards: int = 1,
+        bot_user: dict | None = None,
+    ):
+        self.guild_ids = [(index + 1) << 22 for index in range(guild_count)]
+        self.recommended_shards = recommended_shards
+        self.bot_user = bot_user or make_user(BOT_ID, 'dakap', bot=True)
+        self.identify_counts: Counter[int] = counter()
+        self.request_counts: Counter[str] = counter()
+        self.messages: dict[int, list[dict]] = {}
+        """The messages of each channel, oldest first"""
+        self._message_ids: dict[int, list[int]] = {}
+        self._snowflakes = itertools.count(
+            discord.utils.time_snowflake(datetime.now(timezone.utc))
+        )
+        self.identified = asyncio.Condition()
+        self.api_url = ''
+        self.gateway_url = ''
+        self._runner: web.AppRunner | None = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        """Start serving at `api_url` and `gateway_url`."""
+        app = web.Application()
+        app.router.add_get(f'{API_PREFIX}/users/@me', self._handle_user)
+        app.router.add_get(f'{API_PREFIX}/oauth2/applications/@me', self._handle_application)
+        app.router.add_get(f'{API_PREFIX}/gateway/bot', self._handle_gateway_bot)
+        app.router.add_put(
+            f'{API_PREFIX}/applications/{{application_id}}/commands',
+            self._handle_commands,
+        )
+        app.router.add_put(
+            f'{API_PREFIX}/applications/{{application_id}}/guilds/{{guild_id}}/commands',
+            self._handle_commands,
+        )
+        messages_path = f'{API_PREFIX}/channels/{{channel_id}}/messages'
+        app.router.add_get(messages_path, self._handle_history)
+        app.router.add_post(messages_path, self._handle_send)
+        app.router.add_patch(f'{messages_path}/{{message_id}}', self._handle_edit)
+        app.router.add_post(f'{API_PREFIX}/channels/{{channel_id}}/typing', self._handle_typing)
+        app.router.add_get('/gateway', self._handle_gateway)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        port = self._runner.addresses[0][1]
+        self.api_url = f'http://{host}:{port}{API_PREFIX}'
+        self.gateway_url = f'ws://{host}:{port}/gateway'
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def wait_identified(self, shard_ids: list[int], counts: Counter[int]) -> None:
+        """Wait until each of the shards has identified more times than in the counts."""
+        async with self.identified:
+            await self.identified.wait_for(lambda: all(
+                self.identify_counts[shard_id] > counts[shard_id]
+                for shard_id in shard_ids
+            ))
+
+    def add_message(self, message: dict) -> None:
+        """Add a message payload to the history of its channel, in the order of the IDs."""
+        channel_id = int(message['channel_id'])
+        message_ids = self._message_ids.setdefault(channel_id, [])
+        index = bisect.bisect(message_ids, int(message['id']))
+        message_ids.insert(index, int(message['id']))
+        self.messages.setdefault(channel_id, []).insert(index, message)
+
+    async def _handle_user(self, _request: web.Request) -> web.Response:
+        return _json_response(self.bot_user)
+
+    async def _handle_application(self, _request: web.Request) -> web.Response:
+        return _json_response({
+            'id': str(BOT_ID),
+            'name': 'dakap',
+            'description': '',
+            'icon': None,
+            'bot_public': False,
+            'bot_require_code_grant': False,
+            'owner': make_user(OWNER_ID, 'owner'),
+            'team': None,
+            'verify_key': '',
+            'flags': 0,
+        })
+
+    async def _handle_gateway_bot(self, _request: web.Request) -> web.Response:
+        return _json_response({
+            'url': self.gateway_url,
+            'shards': self.recommended_shards,
+            'session_start_limit': {
+                'total': 1000,
+                'remaining': 1000,
+                'reset_after': 0,
+                'max_concurrency': 16,
+            },
+        })
+
+    async def _handle_commands(self, request: web.Request) -> web.Response:
+        return _json_response([
+            {'id': str(index + 1), 'application_id': str(BOT_ID), 'description': '', **command}
+            for index, command in enumerate(await request.json())
+        ])
+
+    async def _handle_history(self, request: web.Request) -> web.Response:
+        self.request_counts['GET messages'] += 1
+        channel_id = int(request.match_info['channel_id'])
+        messages = self.messages.get(channel_id, [])
+        message_ids = self._message_ids.get(channel_id, [])
+        limit = int(request.query.get('limit', 50))
+        if after := request.query.get('after'):
+            start = bisect.bisect(message_ids, int(after))
+            page = messages[start:start + limit]
+        else:
+            end = bisect.bisect_left(message_ids, int(request.query.get('before', 1 << 63)))
+            page = messages[max(end - limit, 0):end]
+        # Newest first, like Discord
+        return _json_response(page[::-1])
+
+    async def _handle_send(self, request: web.Request) -> web.Response:
+        self.request_counts['POST messages'] += 1
+        if request.content_type.startswith('multipart/'):
+            # With the files
+            payload = {}
+            async for part in await request.multipart():
+                if part.name == 'payload_json':
+                    payload = json.loads(await part.text())
+        else:
+            payload = await request.json()
+        message = make_message(
+            message_id=next(self._snowflakes),
+            channel_id=int(request.match_info['channel_id']),
+            author=self.bot_user,
+            content=payload.get('content') or '',
+            embeds=payload.get('embeds') or [],
+        )
+        self.add_message(message)
+        return _json_response(message)
+
+    async def _handle_edit(self, request: web.Request) -> web.Response:
+        self.request_counts['PATCH message'] += 1
+        payload = await request.json()
+        return _json_response(make_message(
+            message_id=int(request.match_info['message_id']),
+            channel_id=int(request.match_info['channel_id']),
+            author=self.bot_user,
+            content=payload.get('content') or '',
+            embeds=payload.get('embeds') or [],
+        ))
+
+    async def _handle_typing(self, _request: web.Request) -> web.Response:
+        self.request_counts['POST typing'] += 1
+        return web.Response(status=204)
+
+    async def _handle_gateway(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        await websocket.send_json({'op': 10, 'd': {'heartbeat_interval': HEARTBEAT_INTERVAL}})
+        sequence = 0
+        async for ws_message in websocket:
+            if ws_message.type != WSMsgType.TEXT:
+                break
+            payload = json.loads(ws_message.data)
+            if payload['op'] == 1:
+                await websocket.send_json({'op': 11})
+            elif payload['op'] == 2:
+                shard_id, shard_count = payload['d'].get('shard', (0, 1))
+                guild_ids = [
+                    guild_id
+                    for guild_id in self.guild_ids
+                    if (guild_id >> 22) % shard_count == shard_id
+                ]
+                sequence += 1
+                await websocket.send_json({'op': 0, 's': sequence, 't': 'READY', 'd': {
+                    'v': 10,
+                    'user': self.bot_user,
+                    'guilds': [
+                        {'id': str(guild_id), 'unavailable': True} for guild_id in guild_ids
+                    ],
+                    'session_id': f'session-{shard_id}',
+                    'resume_gateway_url': self.gateway_url,
+                    'shard': [shard_id, shard_count],
+                    'application': {'id': str(BOT_ID), 'flags': 0},
+                }})
+                for guild_id in guild_ids:
+                    sequence += 1
+                    await websocket.send_json({
+                        'op': 0,
+                        's': sequence,
+                        't': 'GUILD_CREATE',
+                        'd': _guild(guild_id),
+                    })
+                async with self.identified:
+                    self.identify_counts[shard_id] += 1
+                    self.identified.notify_all()
+        return websocket
+
+
+def _json_response(data: dict | list) -> web.Response:
+    # discord.py only decodes the exact content type, without the charset
+    return web.Response(body=json.dumps(data).encode(), content_type='application/json')
+
+
+def make_user(user_id: int, name: str, bot: bool = False) -> dict:
+    return {
+        'id': str(user_id),
+        'username': name,
+        'discriminator': '0',
+        'global_name': None,
+        'avatar': None,
+        'bot': bot,
+    }
+
+
+def make_message(
+    message_id: int,
+    channel_id: int,
+    author: dict,
+    content: str,
+    embeds: list[dict] | None = None,
+) -> dict:
+    """The payload of a message, as in the responses and `MESSAGE_CREATE`."""
+    return {
+        'id': str(message_id),
+        'channel_id': str(channel_id),
+        'author': author,
+        'content': content,
+        'embeds': embeds or [],
+        'attachments': [],
+        'mentions': [],
+        'mention_roles': [],
+        'mention_everyone': False,
+        'tts': False,
+        'pinned': False,
+        'type': 0,
+        'timestamp': discord.utils.snowflake_time(message_id).isoformat(),
+        'edited_timestamp': None,
+    }
+
+
+def _guild(guild_id: int) -> dict:
+    return {
+        'id': str(guild_id),
+        'name': f'guild-{guild_id >> 22}',
+        'icon': None,
+        'owner_id': str(OWNER_ID),
+        'unavailable': False,
+        'member_count': 1,
+        'roles': [],
+        'emojis': [],
+        'stickers': [],
+        'features': [],
+        'channels': [],
+        'threads': [],
+        'members': [],
+        'voice_states': [],
+        'presences': [],
+    }
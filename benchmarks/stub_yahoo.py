@@ -0,0 +1,121 @@
+"""A local stub of the bulk quote and the chart endpoints of Yahoo! Finance"""
+
+import asyncio
+import math
+import random
+
+from aiohttp import web
+
+UNKNOWN_PREFIX = 'UNKNOWN'
+"""The symbols starting with this are not in the results, like the invalid ones"""
+
+
+class StubYahoo:
+    """
+    Serve `/v7/finance/quote?symbols=...` with random-walk prices after a latency, and count the
+    requests and the requested symbols.
+    Serve `/v8/finance/chart/<symbol>?interval=...&period1=...&period2=...` with the same bars
+    for the same timestamps, and count the requests and the bars.
+    """
+
+    def __init__(self, latency: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.request_count = 0
+        self.symbol_count = 0
+        self.chart_request_count = 0
+        self.bar_count = 0
+        self._rng = random.Random(seed)
+        self._prices: dict[str, float] = {}
+        self._runner: web.AppRunner | None = None
+        self.url = ''
+        self.chart_url = ''
+        """With `{symbol}` to format"""
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving and return the URL of the endpoint."""
+        app = web.Application()
+        app.router.add_get('/v7/finance/quote', self._handle_quote)
+        app.router.add_get('/v8/finance/chart/{symbol}', self._handle_chart)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f'http://{host}:{port}/v7/finance/quote'
+        self.chart_url = f'http://{host}:{port}/v8/finance/chart/{{symbol}}'
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+    def set_price(self, symbol: str, price: float) -> None:
+        """Set the next price of the symbol."""
+        self._prices[symbol.upper()] = price
+
+    async def _handle_quote(self, request: web.Request) -> web.Response:
+        self.request_count += 1
+        symbols = [symbol for symbol in request.query.get('symbols', '').split(',') if symbol]
+        self.symbol_count += len(symbols)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({
+            'quoteResponse': {
+                'result': [
+                    self._quote(symbol.upper())
+                    for symbol in symbols
+                    if not symbol.upper().startswith(UNKNOWN_PREFIX)
+                ],
+                'error': None,
+            },
+        })
+
+    async def _handle_chart(self, request: web.Request) -> web.Response:
+        self.chart_request_count += 1
+        symbol = request.match_info['symbol'].upper()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if symbol.startswith(UNKNOWN_PREFIX):
+            return web.json_response(
+                {'chart': {'result': None, 'error': {'code': 'Not Found'}}},
+                status=404,
+            )
+
+        step = _INTERVAL_SECONDS[request.query.get('interval', '30m')]
+        period_start = int(request.query['period1']) // step * step
+        timestamps = list(range(period_start, int(request.query['period2']), step))
+        self.bar_count += len(timestamps)
+        closes = [_bar_price(symbol, timestamp) for timestamp in timestamps]
+        opens = [_bar_price(symbol, timestamp - step) for timestamp in timestamps]
+        return web.json_response({'chart': {'result': [{
+            'meta': {'symbol': symbol},
+            'timestamp': timestamps,
+            'indicators': {'quote': [{
+                'open': opens,
+                'high': [max(pair) * 1.001 for pair in zip(opens, closes)],
+                'low': [min(pair) * 0.999 for pair in zip(opens, closes)],
+                'close': closes,
+                'volume': [1000] * len(timestamps),
+            }]},
+        }], 'error': None}})
+
+    def _quote(self, symbol: str) -> dict:
+        previous_close = self._prices.setdefault(symbol, self._rng.uniform(10, 1000))
+        price = self._prices[symbol] = previous_close * self._rng.uniform(0.98, 1.02)
+        return {
+            'symbol': symbol,
+            'longName': f'{symbol} Holdings',
+            'currency': 'USD',
+            'regularMarketPreviousClose': previous_close,
+            'regularMarketPrice': price,
+        }
+
+
+_INTERVAL_SECONDS = {'1m': 60, '5m': 5 * 60, '15m': 15 * 60, '30m': 30 * 60, '1h': 60 * 60}
+
+
+def _bar_price(symbol: str, timestamp: int) -> float:
+    """The same price of the symbol at the timestamp in every response."""
+    base = random.Random(symbol).uniform(10, 1000)
+    noise = random.Random(timestamp).uniform(-0.01, 0.01)
+    return base * (1 + 0.05 * math.sin(timestamp / 86400) + noise)
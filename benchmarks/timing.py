@@ -0,0 +1,17 @@
+"""Time the calls of the benchmarks"""
+
+import time
+from typing import Callable
+
+
+def time_per_call(func: Callable[[], object], number: int = 1, warm_up: bool = False) -> float:
+    """
+    Get the mean seconds of `number` calls of the function, after another call if `warm_up`, e.g.
+    to fill the caches of the timezones.
+    """
+    if warm_up:
+        func()
+    start_time = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start_time) / number
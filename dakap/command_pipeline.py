@@ -0,0 +1,129 @@
+"""Run the commands concurrently across the channels, in order within each, with bounded queues"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, NamedTuple
+from weakref import WeakValueDictionary
+
+MAX_RUNNING_ENV = 'DAKAP_MAX_RUNNING_COMMANDS'
+"""The commands running at the same time in this process"""
+MAX_GUILD_RUNNING_ENV = 'DAKAP_MAX_GUILD_RUNNING_COMMANDS'
+"""The commands running at the same time in a guild, so that a busy guild can't starve others"""
+MAX_QUEUED_ENV = 'DAKAP_MAX_QUEUED_COMMANDS'
+"""The commands waiting to run in this process, beyond which the new ones are shed"""
+DEFAULT_MAX_RUNNING = 16
+DEFAULT_MAX_GUILD_RUNNING = 4
+DEFAULT_MAX_QUEUED = 200
+MAX_CHANNEL_QUEUED = 10
+"""The commands waiting to run in a channel (not counting the running one), beyond which the new
+ones are shed"""
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class _Job(NamedTuple):
+    name: str
+    func: Callable[[], Awaitable[None]]
+    queued_at: float
+
+
+class CommandPipeline:
+    """
+    Queue the commands in a lane per channel, which runs them one by one so that the replies in
+    the channel keep their order, while the lanes run concurrently up to the limits of the guild
+    and of the process. A command is shed instead if its channel or the process has too many
+    waiting.
+    """
+
+    def __init__(
+        self,
+        max_running: int = DEFAULT_MAX_RUNNING,
+        max_guild_running: int = DEFAULT_MAX_GUILD_RUNNING,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        max_channel_queued: int = MAX_CHANNEL_QUEUED,
+        on_wait: Callable[[str, float], None] | None = None,
+    ):
+        """`on_wait`: Called with the name of each command and the seconds it waited to run."""
+        self.max_running = max_running
+        self.max_guild_running = max_guild_running
+        self.max_queued = max_queued
+        self.max_channel_queued = max_channel_queued
+        self.on_wait = on_wait
+        self.depth = 0
+        """The commands waiting to run"""
+        self.running = 0
+        self.shed_count = 0
+        self._semaphore = asyncio.Semaphore(max_running)
+        self._guild_semaphores: WeakValueDictionary[int | None, asyncio.Semaphore] = (
+            WeakValueDictionary()
+        )
+        """Kept while any lane in the guild refers to it"""
+        self._lanes: dict[int, deque[_Job]] = {}
+        """The waiting commands keyed by the channel IDs, kept while the lane is running any"""
+        self._lane_tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> 'CommandPipeline':
+        """Read the limits from `MAX_RUNNING_ENV`, `MAX_GUILD_RUNNING_ENV` and `MAX_QUEUED_ENV`."""
+        return cls(
+            max_running=int(os.environ.get(MAX_RUNNING_ENV, DEFAULT_MAX_RUNNING)),
+            max_guild_running=int(os.environ.get(MAX_GUILD_RUNNING_ENV, DEFAULT_MAX_GUILD_RUNNING)),
+            max_queued=int(os.environ.get(MAX_QUEUED_ENV, DEFAULT_MAX_QUEUED)),
+            **kwargs,
+        )
+
+    def submit(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[None]],
+        channel_id: int,
+        guild_id: int | None,
+    ) -> bool:
+        """Queue the command to run after the previous ones in the channel, or shed it."""
+        lane = self._lanes.get(channel_id)
+        channel_depth = len(lane) if lane is not None else 0
+        if self.depth >= self.max_queued or channel_depth >= self.max_channel_queued:
+            self.shed_count += 1
+            return False
+
+        if lane is None:
+            lane = self._lanes[channel_id] = deque()
+            task = asyncio.create_task(self._drain(channel_id, guild_id, lane))
+            self._lane_tasks.add(task)
+            task.add_done_callback(self._lane_tasks.discard)
+        lane.append(_Job(name, func, time.perf_counter()))
+        self.depth += 1
+        return True
+
+    async def join(self) -> None:
+        """Wait until all the queued commands are finished."""
+        while self._lane_tasks:
+            await asyncio.wait(self._lane_tasks)
+
+    async def _drain(self, channel_id: int, guild_id: int | None, lane: deque[_Job]) -> None:
+        guild_semaphore = self._guild_semaphores.get(guild_id)
+        if guild_semaphore is None:
+            guild_semaphore = self._guild_semaphores[guild_id] = asyncio.Semaphore(
+                self.max_guild_running
+            )
+        try:
+            while lane:
+                # The guild first, not to hold a slot of the process while waiting for it
+                async with guild_semaphore, self._semaphore:
+                    job = lane.popleft()
+                    self.depth -= 1
+                    self.running += 1
+                    if self.on_wait:
+                        self.on_wait(job.name, time.perf_counter() - job.queued_at)
+                    try:
+                        await job.func()
+                    except Exception:  # pylint: disable=broad-except
+                        _logger.exception(f'Failed to run the command {job.name}')
+                    finally:
+                        self.running -= 1
+        finally:
+            # No await between the last check of the lane and this
+            del self._lanes[channel_id]
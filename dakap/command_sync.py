@@ -0,0 +1,86 @@
+"""Sync the application commands only when they are changed"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+import discord
+
+from .common import get_data_path
+
+COMMAND_SYNC_PATH = get_data_path('command-sync.json')
+"""The fingerprints of the last synced commands of each scope"""
+SYNC_GUILD_ENV = 'DAKAP_SYNC_GUILD'
+"""The ID of a guild to sync the commands to instead of globally, which is instant in development"""
+FORCE_SYNC_ENV = 'DAKAP_FORCE_SYNC'
+"""Set to 1 to sync even if the commands are unchanged, e.g. after they are changed elsewhere"""
+
+_GLOBAL_SCOPE = 'global'
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def get_command_fingerprint(
+    tree: discord.app_commands.CommandTree,
+    application_id: int | None,
+    guild: discord.abc.Snowflake | None = None,
+) -> str:
+    """Hash the payload which `tree.sync(guild=guild)` would send for the application."""
+    payload = sorted(
+        (command.to_dict() for command in tree.get_commands(guild=guild)),
+        key=lambda command: (command['type'], command['name']),
+    )
+    return hashlib.sha256(
+        json.dumps([application_id, payload], sort_keys=True).encode()
+    ).hexdigest()
+
+
+async def sync_commands(
+    tree: discord.app_commands.CommandTree,
+    path: str = COMMAND_SYNC_PATH,
+) -> bool:
+    """
+    Sync the commands globally, or to the guild in `SYNC_GUILD_ENV` with the global ones copied,
+    unless they are the same as last synced. Return if they are synced.
+    """
+    guild = None
+    if guild_id := os.environ.get(SYNC_GUILD_ENV):
+        guild = discord.Object(id=int(guild_id))
+        tree.copy_global_to(guild=guild)
+    scope = str(guild.id) if guild else _GLOBAL_SCOPE
+
+    fingerprints = _load_fingerprints(path)
+    fingerprint = get_command_fingerprint(tree, tree.client.application_id, guild=guild)
+    if fingerprints.get(scope) == fingerprint and os.environ.get(FORCE_SYNC_ENV, '0') == '0':
+        _logger.info(f'Skipped syncing the unchanged commands ({scope})')
+        return False
+
+    start_time = time.perf_counter()
+    await tree.sync(guild=guild)
+    _logger.info(f'Synced the commands ({scope}) in {time.perf_counter() - start_time:.2f}s')
+    fingerprints[scope] = fingerprint
+    _save_fingerprints(path, fingerprints)
+    return True
+
+
+def _load_fingerprints(path: str) -> dict[str, str]:
+    try:
+        with open(path, encoding='utf-8') as fingerprints_file:
+            return json.load(fingerprints_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        _logger.warning(f'Failed to load the synced commands from {path}: {error!r}')
+        return {}
+
+
+def _save_fingerprints(path: str, fingerprints: dict[str, str]) -> None:
+    temp_path = f'{path}.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as fingerprints_file:
+            json.dump(fingerprints, fingerprints_file, indent=2)
+        os.replace(temp_path, path)
+    except OSError as error:
+        _logger.warning(f'Failed to save the synced commands into {path}: {error!r}')
@@ -1,13 +1,98 @@
 """Helping functions"""
 
-from typing import Awaitable, Callable, Sequence
+import asyncio
+import importlib
+import logging
+import os
+import time
+from typing import Awaitable, Callable, NamedTuple, Protocol, Sequence
 
 import discord
 
+DATA_DIR_ENV = 'DAKAP_DATA_DIR'
+"""An existing directory for the indexes, the caches and the stores, or the working directory"""
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
 CommandFunc = Callable[[discord.Client, discord.Message, Sequence[str]], Awaitable[None]]
 SupportChannel = discord.TextChannel | discord.VoiceChannel | discord.Thread
 
 
-def is_msg_from_me(client: discord.Client, message: discord.Message) -> bool:
+class ReactionLike(Protocol):
+    @property
+    def emoji(self) -> discord.Emoji | discord.PartialEmoji | str: ...
+
+
+class MessageLike(Protocol):
+    """The fields of `discord.Message` to count its emojis, also provided by lighter copies"""
+
+    @property
+    def id(self) -> int: ...
+
+    @property
+    def author(self) -> discord.abc.Snowflake: ...
+
+    @property
+    def content(self) -> str: ...
+
+    @property
+    def reactions(self) -> Sequence[ReactionLike]: ...
+
+
+class LazyCommandFunc:
+    """
+    A command function which is imported from its module on the first use, so that the heavy
+    modules (e.g. `yfinance` with `pandas`) are not loaded until they are needed.
+    """
+
+    def __init__(self, module_name: str, func_name: str):
+        self.module_name = module_name
+        self.func_name = func_name
+        self._func: CommandFunc | None = None
+
+    @property
+    def loaded(self) -> bool:
+        """If the module has been imported"""
+        return self._func is not None
+
+    def load(self) -> CommandFunc:
+        """Import the module and get the command function."""
+        if self._func is None:
+            start_time = time.perf_counter()
+            module = importlib.import_module(self.module_name)
+            self._func = getattr(module, self.func_name)
+            _logger.info(
+                f'Imported {self.module_name} in {time.perf_counter() - start_time:.3f}s'
+            )
+        return self._func
+
+    async def __call__(
+        self,
+        client: discord.Client,
+        message: discord.Message,
+        arguments: Sequence[str],
+    ) -> None:
+        func = self._func
+        if func is None:
+            # Import in another thread to keep the event loop running
+            func = await asyncio.to_thread(self.load)
+        await func(client, message, arguments)
+
+
+class Command(NamedTuple):
+    names: Sequence[str]
+    """The name and the aliases, e.g. `('yt', 'youtube')`"""
+    func: CommandFunc
+    usage: str
+    """The arguments shown in the help message, e.g. `'<YouTube URL>'`"""
+    description: str
+
+
+def get_data_path(name: str) -> str:
+    """Get the path of a file or a directory of the persistent state in `DATA_DIR_ENV`."""
+    return os.path.join(os.environ.get(DATA_DIR_ENV, ''), name)
+
+
+def is_msg_from_me(client: discord.Client, message: MessageLike) -> bool:
     """Check if the message is sent by this bot."""
-    return message.author == client.user
+    return client.user is not None and message.author.id == client.user.id
@@ -2,26 +2,117 @@
 
 import asyncio
 import logging
+import re
 import unicodedata
 from collections import Counter as counter
 from datetime import datetime, timedelta, timezone
+from functools import partial
 from itertools import zip_longest
 from operator import attrgetter, itemgetter
-from typing import (Collection, Counter, Iterable, Iterator, NamedTuple, Tuple,
-                    TypeVar)
+from typing import (AsyncIterator, Collection, Counter, Iterable, Iterator, NamedTuple,
+                    Sequence, Tuple, TypeVar)
 
 import discord
 
-from .common import SupportChannel, is_msg_from_me
+from .common import MessageLike, SupportChannel, is_msg_from_me
+from .emoji_cube import EmojiCube, get_emoji_cube
+from .emoji_index import (
+    RETENTION_DAYS,
+    EmojiIndex,
+    current_day,
+    get_emoji_index,
+    snowflake_day,
+)
+from .emoji_matcher import DailyEmojiCounts, EmojiMatcher
+from .live_emoji_counter import get_live_emoji_counter
+from .memory import get_memory_config
+from .metrics import get_metrics
+from .packed_output import make_csv_file, send_packed
+from .scan_scheduler import ScanJob, ScanScheduler, ScanStats
+from .single_flight import SingleFlightCache
 
 logger = logging.getLogger(__name__)    # pylint: disable=invalid-name
 logger.setLevel(logging.DEBUG)
 
+SCAN_CONCURRENCY = 8
+"""The maximum number of channels to scan at a time"""
+EMOJI_RESULT_TTL = 60
+"""Seconds to reuse the scanned result of a guild"""
+PROGRESS_DELAY = 1.0
+"""Seconds of scanning before showing the progress, so that a quick scan shows only the result"""
+PROGRESS_EDIT_INTERVAL = 2.0
+"""The minimum seconds between the edits of the progress, to keep the API load low"""
+
+_COUNTING_PERIOD = timedelta(weeks=12)
+_SECONDS_PER_DAY = 24 * 60 * 60
+
+_PERIOD_PATTERN = re.compile(r'(?P<number>\d+)(?P<unit>[dDwW])')
+_PERIOD_UNIT_DAYS = {'d': 1, 'w': 7}
+_CHANNEL_MENTION_PATTERN = re.compile(r'<#(?P<channel_id>\d+)>')
+_TOP_K = 3
+"""The default number of the top emojis of each channel"""
+_HISTORY_PAGE_SIZE = 100
+"""The maximum number of messages per request of the history"""
+
+emoji_results: SingleFlightCache[int, EmojiCube] = SingleFlightCache(ttl=EMOJI_RESULT_TTL)
+"""The scanned results, keyed by the guild IDs"""
+get_metrics().register_cache('emoji_result', emoji_results)
+
+
+class ScanProgress:
+    """The running totals of a scan of a guild, folded in as each channel is done"""
+
+    def __init__(self, channel_count: int):
+        self.channel_count = channel_count
+        self.done_channel_count = 0
+        self.message_count = 0
+        self.last_channel_name: str | None = None
+
+    def add(self, stats: ScanStats) -> None:
+        """Fold in the stats of a channel which is done."""
+        self.done_channel_count += 1
+        self.message_count += stats.message_count
+        self.last_channel_name = stats.channel_name
+
+    def render(self) -> str:
+        lines = [
+            f'Scanning: {self.done_channel_count}/{self.channel_count} channel(s) done, '
+            f'{self.message_count} new message(s) counted'
+        ]
+        if self.last_channel_name is not None:
+            lines.append(f'Last done: #{self.last_channel_name}')
+        return '\n'.join(['```', *lines, '```'])
+
+
+scan_progresses: dict[int, ScanProgress] = {}
+"""The progress of the running scan of each guild"""
+
 
 class EmojiCountResult(NamedTuple):
     channel_name: str
     message_count: int
-    emoji_counter: Counter[discord.Emoji]
+
+
+class _ScannedReaction(NamedTuple):
+    emoji: str
+    """Formatted as `str(discord.PartialEmoji)`"""
+
+
+class _ScannedMessage(NamedTuple):
+    """The fields of a message to count its emojis, as a `MessageLike`"""
+    id: int
+    author: discord.Object
+    content: str
+    reactions: list[_ScannedReaction]
+
+
+class EmojiQuery(NamedTuple):
+    period_days: int
+    channel_ids: set[int]
+    """Empty for all the channels"""
+    top_k: int | None
+    trend_emojis: list[discord.Emoji]
+    trend_bucket_days: int
 
 
 T = TypeVar('T')    # pylint: disable=invalid-name
@@ -39,98 +130,375 @@ def grouper(iterable: Iterable[T], number: int, fillvalue: T = None) -> Iterator
 async def count_emojis(
         client: discord.Client,
         message: discord.Message,
-        _arguments,
+        arguments: Sequence[str],
 ) -> None:
-    """Count the emojis in the guild."""
+    """
+    Count the emojis in the guild, optionally in the period (e.g. `7d`, `4w`), in the mentioned
+    channels, as the `top [<k>]` of each channel, or as the trends of the given emojis.
+
+    Each message is counted once when it is first scanned (or received live), so the later edits,
+    the deletes while offline and the new reactions on the scanned messages are not reflected.
+    """
 
     if not message.guild:
         raise ValueError('Invalid message.guild')
 
-    async with message.channel.typing():
+    emoji_matcher = EmojiMatcher(message.guild.emojis)
+    try:
+        query = _parse_emoji_query(arguments[1:], emoji_matcher)
+    except ValueError as error:
+        await message.reply(f'```{error}```')
+        return
 
-        emoji_counter = counter(message.guild.emojis)
-        """A counter contains all the emojis and starts from 1"""
+    async with message.channel.typing():
 
-        # discord library expects a timezone-naive datetime
-        start_time = datetime.utcnow() - timedelta(weeks=12)
+        # Counted for the queried period from the beginning of the day (in UTC), since the index
+        # is bucketed by day
+        since_day = current_day() - query.period_days
+        start_time = datetime.fromtimestamp(since_day * _SECONDS_PER_DAY, tz=timezone.utc)
 
         channels: list[discord.TextChannel | discord.Thread] = []
         channels += list(message.guild.text_channels)
         channels += list(message.guild.threads)
-
-        counting_tasks = [
-            asyncio.create_task(_count_emojis_in_channel(
-                client=client,
-                channel=channel,
-                emojis=message.guild.emojis,
-                after=start_time,
-            ))
+        channels = [
+            channel
             for channel in channels
             if channel.permissions_for(channel.guild.me).read_message_history
         ]
+        if unknown_channel_ids := query.channel_ids - {channel.id for channel in channels}:
+            await message.reply(f'```Cannot read the channel(s): {sorted(unknown_channel_ids)}```')
+            return
 
-        counting_results: list[EmojiCountResult] = [await task for task in counting_tasks]
-        emoji_counter = sum((result.emoji_counter for result in counting_results), emoji_counter)
+        cube_task = asyncio.ensure_future(
+            _get_emoji_cube(client=client, guild=message.guild, channels=channels)
+        )
+        progress_message = await _stream_scan_progress(
+            guild_id=message.guild.id,
+            cube_task=cube_task,
+            message_to_reply=message,
+        )
+        cube = await cube_task
+        selected_channels = [
+            channel
+            for channel in channels
+            if not query.channel_ids or channel.id in query.channel_ids
+        ]
+        selected_channel_ids = [channel.id for channel in selected_channels]
+        message_counts = cube.get_message_counts(since_day, channel_ids=selected_channel_ids)
+
+        counting_results = [
+            EmojiCountResult(
+                channel_name=channel.name,
+                message_count=message_counts.get(channel.id, 0),
+            )
+            for channel in selected_channels
+        ]
 
         await _send_emoji_count_summary(
             emoji_count_results=counting_results,
             start_time=start_time,
             message_to_reply=message,
+            progress_message=progress_message,
         )
-        await _send_emoji_count_result(
-            emoji_counter=emoji_counter,
-            channel_to_send=message.channel,
-        )
+
+        if query.trend_emojis:
+            await _send_emoji_trends(
+                trend_emojis=query.trend_emojis,
+                trends=cube.get_trends(
+                    emoji_ids=[emoji.id for emoji in query.trend_emojis],
+                    since_day=since_day,
+                    bucket_days=query.trend_bucket_days,
+                    channel_ids=selected_channel_ids,
+                ),
+                bucket_days=query.trend_bucket_days,
+                channel_to_send=message.channel,
+            )
+        elif query.top_k is not None:
+            await _send_top_emojis_per_channel(
+                channels=selected_channels,
+                top_emojis=cube.get_top_emojis_per_channel(
+                    top_k=query.top_k,
+                    since_day=since_day,
+                    channel_ids=selected_channel_ids,
+                ),
+                emojis=message.guild.emojis,
+                channel_to_send=message.channel,
+            )
+        else:
+            emoji_counts = cube.get_emoji_counts(since_day, channel_ids=selected_channel_ids)
+            emoji_counter = counter(message.guild.emojis)
+            """A counter contains all the emojis and starts from 1"""
+            for emoji in message.guild.emojis:
+                emoji_counter[emoji] += emoji_counts.get(emoji.id, 0)
+
+            await _send_emoji_count_result(
+                emoji_counter=emoji_counter,
+                channel_to_send=message.channel,
+            )
+
+
+async def _get_emoji_cube(
+    client: discord.Client,
+    guild: discord.Guild,
+    channels: Sequence[SupportChannel],
+) -> EmojiCube:
+    """
+    Scan the channels and get the cube of the guild. The concurrent calls in the guild share the
+    same scan, and the result is reused for `EMOJI_RESULT_TTL` seconds unless the emojis or the
+    channels have changed (e.g. `on_guild_emojis_update`).
+    """
+    emoji_ids = [emoji.id for emoji in guild.emojis]
+    channel_ids = [channel.id for channel in channels]
+    scan = partial(_scan_guild, client=client, guild=guild, channels=channels)
+
+    cube = await emoji_results.get(guild.id, scan)
+    if not cube.matches(emoji_ids=emoji_ids, channel_ids=channel_ids):
+        emoji_results.invalidate(guild.id)
+        cube = await emoji_results.get(guild.id, scan)
+    return cube
+
+
+async def _scan_guild(
+    client: discord.Client,
+    guild: discord.Guild,
+    channels: Sequence[SupportChannel],
+) -> EmojiCube:
+    """Scan the channels for the new messages into the index, and get the cube of the guild."""
+    emoji_index = get_emoji_index()
+    live_emoji_counter = get_live_emoji_counter()
+    await live_emoji_counter.flush()
+
+    # Scanned for the whole retention period
+    scan_since_day = current_day() - _COUNTING_PERIOD // timedelta(days=1)
+    scan_start_time = datetime.fromtimestamp(scan_since_day * _SECONDS_PER_DAY, tz=timezone.utc)
+    await emoji_index.run(emoji_index.prune, before_day=current_day() - RETENTION_DAYS)
+
+    emoji_matcher = EmojiMatcher(guild.emojis)
+    start_id = discord.utils.time_snowflake(scan_start_time)
+    # The messages since then are counted live, only the gaps before it have to be scanned
+    before_id = live_emoji_counter.get_session_start_id(guild)
+
+    checkpoints = await emoji_index.run(
+        emoji_index.get_checkpoints,
+        [channel.id for channel in channels],
+    )
+    scan_jobs = []
+    for channel in channels:
+        after_id = max(checkpoints.get(channel.id, 0), start_id)
+        if before_id is not None and after_id >= before_id:
+            # No gaps
+            continue
+        if channel.last_message_id is not None and channel.last_message_id <= after_id:
+            # No new messages since the checkpoint
+            if before_id is not None:
+                await emoji_index.run(
+                    emoji_index.move_checkpoint,
+                    guild_id=channel.guild.id,
+                    channel_id=channel.id,
+                    checkpoint=before_id,
+                )
+            continue
+        scan_jobs.append(ScanJob(
+            channel_name=channel.name,
+            expected_size=(channel.last_message_id or after_id) - after_id,
+            scan=partial(
+                _count_emojis_in_channel,
+                client=client,
+                channel=channel,
+                emoji_matcher=emoji_matcher,
+                after_id=after_id,
+                before_id=before_id,
+                emoji_index=emoji_index,
+            ),
+        ))
+
+    scheduler = ScanScheduler(max_concurrency=SCAN_CONCURRENCY)
+    progress = scan_progresses[guild.id] = ScanProgress(channel_count=len(scan_jobs))
+    try:
+        await scheduler.run(scan_jobs, on_done=progress.add)
+    finally:
+        del scan_progresses[guild.id]
+    logger.debug(
+        f'Scanned {len(scan_jobs)} channel(s), rate limited {scheduler.rate_limited_count} time(s)'
+    )
+    # The live counts of the channels without gaps now
+    await live_emoji_counter.flush()
+
+    return await get_emoji_cube(
+        guild_id=guild.id,
+        emoji_ids=[emoji.id for emoji in guild.emojis],
+        channel_ids=[channel.id for channel in channels],
+        emoji_index=emoji_index,
+    )
+
+
+async def _stream_scan_progress(
+    guild_id: int,
+    cube_task: asyncio.Future[EmojiCube],
+    message_to_reply: discord.Message,
+) -> discord.Message | None:
+    """
+    If the scan of the guild takes longer than `PROGRESS_DELAY`, reply with its progress and edit
+    the reply at most every `PROGRESS_EDIT_INTERVAL` until it is done. Return the reply to be
+    edited into the summary.
+    """
+    done, _ = await asyncio.wait({cube_task}, timeout=PROGRESS_DELAY)
+    if done or (progress := scan_progresses.get(guild_id)) is None:
+        return None
+
+    content = progress.render()
+    progress_message = await message_to_reply.reply(content)
+    while not cube_task.done():
+        await asyncio.wait({cube_task}, timeout=PROGRESS_EDIT_INTERVAL)
+        if not cube_task.done() and (new_content := progress.render()) != content:
+            content = new_content
+            await progress_message.edit(content=content)
+    return progress_message
+
+
+def _parse_emoji_query(arguments: Sequence[str], emoji_matcher: EmojiMatcher) -> EmojiQuery:
+    """Parse the arguments of `$emoji`. Raise `ValueError` for an invalid one."""
+    period_days = _COUNTING_PERIOD // timedelta(days=1)
+    channel_ids: set[int] = set()
+    top_k = None
+    trend_emojis: list[discord.Emoji] = []
+
+    arguments = list(arguments)
+    while arguments:
+        argument = arguments.pop(0)
+        if matched := _PERIOD_PATTERN.fullmatch(argument):
+            period_days = int(matched['number']) * _PERIOD_UNIT_DAYS[matched['unit'].lower()]
+            if not 0 < period_days <= RETENTION_DAYS:
+                raise ValueError(f'The period should be within {RETENTION_DAYS} days')
+        elif matched := _CHANNEL_MENTION_PATTERN.fullmatch(argument):
+            channel_ids.add(int(matched['channel_id']))
+        elif argument.lower() == 'top':
+            top_k = int(arguments.pop(0)) if arguments and arguments[0].isdecimal() else _TOP_K
+        elif emoji := emoji_matcher.find(argument):
+            trend_emojis.append(emoji)
+        else:
+            raise ValueError(f'Unknown argument: {argument}')
+
+    return EmojiQuery(
+        period_days=period_days,
+        channel_ids=channel_ids,
+        top_k=top_k,
+        trend_emojis=trend_emojis,
+        # Daily for short periods, otherwise weekly
+        trend_bucket_days=1 if period_days <= 14 else 7,
+    )
 
 
 async def _count_emojis_in_channel(
         client: discord.Client,
         channel: SupportChannel,
-        emojis: Iterable[discord.Emoji],
-        after: datetime,
-) -> EmojiCountResult:
-    """Count emojis in the messages in the channel."""
+        emoji_matcher: EmojiMatcher,
+        after_id: int,
+        before_id: int | None,
+        emoji_index: EmojiIndex,
+) -> int:
+    """
+    Count emojis in the messages between the IDs, and add them to the index.
+    Return the number of the fetched messages.
+    """
 
-    emoji_counter: Counter[discord.Emoji] = counter()
-    message_count = 0
+    fetched_count = 0
+    # From the day of the checkpoint to today (and tomorrow, if it passes midnight meanwhile)
+    daily_counts = DailyEmojiCounts(
+        emoji_matcher=emoji_matcher,
+        first_day=snowflake_day(after_id),
+        last_day=current_day() + 1,
+    )
+    last_message_id = None
 
     logger.debug(f'Start counting in #{channel.name}...')
 
-    async for history_message in channel.history(limit=None, after=after):
+    history = (
+        _stream_history(client, channel, after_id=after_id, before_id=before_id)
+        if get_memory_config().low_memory
+        else channel.history(
+            limit=None,
+            after=discord.Object(id=after_id),
+            before=discord.Object(id=before_id) if before_id is not None else None,
+        )
+    )
+    async for history_message in history:
+        fetched_count += 1
+        last_message_id = history_message.id
         if not is_msg_from_me(client, history_message):
-            message_count += 1
-            emoji_counter += _count_emojis_in_msg(
-                emojis=emojis,
+            _count_emojis_in_msg(
+                daily_counts=daily_counts,
                 message=history_message,
             )
-    logger.debug(f'Finish counting {message_count} message(s) in #{channel.name}...')
 
-    return EmojiCountResult(
-        channel_name=channel.name,
-        message_count=message_count,
-        emoji_counter=emoji_counter,
+    message_counts = daily_counts.get_message_counts()
+    logger.debug(
+        f'Finish counting {sum(message_counts.values())} new message(s) in #{channel.name}...'
+    )
+
+    await emoji_index.run(
+        emoji_index.add_counts,
+        guild_id=channel.guild.id,
+        channel_id=channel.id,
+        message_counts=message_counts,
+        emoji_counts=daily_counts.get_emoji_counts(),
+        checkpoint=before_id if before_id is not None else last_message_id,
     )
+    return fetched_count
 
 
 def _count_emojis_in_msg(
-        emojis: Iterable[discord.Emoji],
-        message: discord.Message,
-) -> Counter[discord.Emoji]:
-    """Count emojis in the message."""
-    emoji_counter: Counter[discord.Emoji] = counter()
-    for emoji in emojis:
-        if str(emoji) in message.content:
-            emoji_counter[emoji] += 1
-        if str(emoji) in [str(reaction.emoji) for reaction in message.reactions]:
-            emoji_counter[emoji] += 1
-    return emoji_counter
+        daily_counts: DailyEmojiCounts,
+        message: MessageLike,
+) -> None:
+    """Count the message and its emojis into the counts of its day."""
+    daily_counts.add_message(message, day=snowflake_day(message.id))
+
+
+async def _stream_history(
+    client: discord.Client,
+    channel: SupportChannel,
+    after_id: int,
+    before_id: int | None,
+) -> AsyncIterator[_ScannedMessage]:
+    """
+    Fetch the messages between the IDs from the oldest, keeping only the fields to count the
+    emojis instead of building `discord.Message`s, and stop at the first page past `before_id`.
+    """
+    while True:
+        raw_messages = await client.http.logs_from(
+            channel.id,
+            limit=_HISTORY_PAGE_SIZE,
+            after=after_id,
+        )
+        # The newest first
+        for raw_message in reversed(raw_messages):
+            message_id = int(raw_message['id'])
+            if before_id is not None and message_id >= before_id:
+                return
+            yield _ScannedMessage(
+                id=message_id,
+                author=discord.Object(id=int(raw_message['author']['id'])),
+                content=raw_message.get('content', ''),
+                reactions=[
+                    _ScannedReaction(
+                        emoji=str(discord.PartialEmoji.from_dict(raw_reaction['emoji']))
+                    )
+                    for raw_reaction in raw_message.get('reactions', ())
+                ],
+            )
+        if len(raw_messages) < _HISTORY_PAGE_SIZE:
+            return
+        after_id = int(raw_messages[0]['id'])
 
 
 async def _send_emoji_count_summary(
     emoji_count_results: Collection[EmojiCountResult],
     start_time: datetime,
     message_to_reply: discord.Message,
+    progress_message: discord.Message | None = None,
 ) -> None:
+    """Reply with the summary, or edit the reply of the progress into it."""
     message_lines = []
 
     # Counted from <UTC+8 datetime>
@@ -157,7 +525,10 @@ async def _send_emoji_count_summary(
         '```',
     ]
 
-    await message_to_reply.reply('\n'.join(message_lines))
+    if progress_message:
+        await progress_message.edit(content='\n'.join(message_lines))
+    else:
+        await message_to_reply.reply('\n'.join(message_lines))
 
 
 async def _send_emoji_count_result(
@@ -165,23 +536,66 @@ async def _send_emoji_count_result(
     channel_to_send: discord.abc.Messageable,
 ) -> None:
 
-    emoji_count_strs = [
-        f'{str(emoji)}: {count - 1 :3}'
-        for emoji, count in sorted(emoji_counter.items(), key=itemgetter(1), reverse=True)
-    ]
+    sorted_emoji_counts = sorted(emoji_counter.items(), key=itemgetter(1), reverse=True)
+    emoji_count_strs = [f'{str(emoji)}: {count - 1 :3}' for emoji, count in sorted_emoji_counts]
 
     if logger.isEnabledFor(logging.DEBUG):
         for emoji_count in emoji_count_strs:
             logger.debug(emoji_count)
 
-    # Counted from <UTC+8 datetime>
     message_lines = [
         '\t'.join(column)
         for column in grouper(emoji_count_strs, number=10, fillvalue='')
     ]
 
-    for message_line in message_lines:
-        await channel_to_send.send(message_line)
+    # One message, or with the whole table attached if it does not fit
+    await send_packed(
+        channel=channel_to_send,
+        lines=message_lines,
+        overflow_file=make_csv_file(
+            filename='emoji-counts.csv',
+            header=('emoji', 'id', 'count'),
+            rows=((emoji.name, emoji.id, count - 1) for emoji, count in sorted_emoji_counts),
+        ),
+    )
+
+
+async def _send_top_emojis_per_channel(
+    channels: Sequence[SupportChannel],
+    top_emojis: dict[int, list[tuple[int, int]]],
+    emojis: Sequence[discord.Emoji],
+    channel_to_send: discord.abc.Messageable,
+) -> None:
+    emojis_by_id = {emoji.id: emoji for emoji in emojis}
+    await send_packed(
+        channel=channel_to_send,
+        lines=[
+            f'#{channel.name}: ' + '\t'.join(
+                f'{str(emojis_by_id[emoji_id])}: {count}'
+                for emoji_id, count in top_emojis.get(channel.id, [])
+            )
+            for channel in channels
+            if top_emojis.get(channel.id)
+        ] or ['No emojis'],
+    )
+
+
+async def _send_emoji_trends(
+    trend_emojis: Sequence[discord.Emoji],
+    trends: dict[int, list[int]],
+    bucket_days: int,
+    channel_to_send: discord.abc.Messageable,
+) -> None:
+    await send_packed(
+        channel=channel_to_send,
+        lines=[
+            f'Per {bucket_days} day(s), oldest first:',
+            *(
+                f'{str(emoji)}: ' + ' '.join(str(count) for count in trends.get(emoji.id, []))
+                for emoji in trend_emojis
+            ),
+        ],
+    )
 
 
 # a ljust() that treat CJK characters as double-width
@@ -1,188 +1,396 @@
-"""A Discord bot made by lcy"""
-
-import asyncio
-import logging
-import shlex
-from typing import List, TypeVar
-
-import discord
-
-from .common import CommandFunc
-from .count_emojis import count_emojis
-from .get_time import get_time
-from .misc import random_choice, show_raw_message
-from .stock import get_stocks_prices
-from .youtube_thumbnail import (
-    parse_and_generate_youtube_thumbnail_url,
-    reply_youtube_thumbnail,
-)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s:%(levelname)-7s:%(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-)
-logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
-
-T = TypeVar('T')  # pylint: disable=invalid-name
-
-
-class DakaP(discord.Client):
-    """A Discord bot made by lcy"""
-
-    def __init__(self, prefix: str = '$'):
-        self.prefix = prefix
-        super().__init__(
-            intents=discord.Intents(
-                guilds=True,
-                emojis_and_stickers=True,
-                guild_messages=True,
-                guild_reactions=True,
-                message_content=True,
-            )
-        )
-        self.tree = discord.app_commands.CommandTree(self)
-
-    async def setup_hook(self) -> None:
-        await self.tree.sync()
-
-    async def on_ready(self) -> None:
-        """Triggered when ready."""
-        if not self.user:
-            raise RuntimeError('User not ready.')
-        logger.info(f'Username   : {self.user.name}')
-        logger.info(f'ID         : {self.user.id}')
-        logger.info(
-            f'In guild(s): {", ".join([f"{guild.name}({guild.id})" for guild in self.guilds])}'
-        )
-
-    async def on_message(self, message: discord.Message) -> None:
-        """Triggered when a message start with specific prefix."""
-
-        if message.author.bot:
-            return
-
-        for message_line in message.content.splitlines():
-            arguments = self._parse_arguments(message_line)
-
-            if arguments:
-                command_func: CommandFunc = self._nope
-                command = arguments[0].lower()
-
-                logger.info(f'{message.guild}-{message.channel}: {command}')
-
-                if command == 'help':
-                    await self._send_help(message)
-
-                # elif command == 'bye':
-                #     await self.close()
-
-                elif command in ('emoji', 'emojis'):
-                    command_func = count_emojis
-
-                elif command == 'raw':
-                    command_func = show_raw_message
-
-                elif command == 'choose':
-                    command_func = random_choice
-
-                elif command == 'time':
-                    command_func = get_time
-
-                elif command in ('yt', 'youtube'):
-                    command_func = reply_youtube_thumbnail
-
-                elif command in ('stock', 'finance'):
-                    command_func = get_stocks_prices
-
-                # elif command == 'clean':
-                #     await self._clean_my_messages(message, arguments)
-
-                await command_func(self, message, arguments)
-
-    @staticmethod
-    async def _nope(_client, _message, _arguments) -> None:
-        pass
-
-    async def _send_help(self, message: discord.Message) -> None:
-        """Send the help message of this bot"""
-        help_msgs = []
-        help_msgs.append('Source: https://github.com/lcy0321/DakaP')
-        help_msgs.append('```')
-        help_msgs.append('help')
-        help_msgs.append('        顯示說明')
-        help_msgs.append('emoji/emojis')
-        help_msgs.append('        計算伺服器內一定時間內各個 emoji 的數量')
-        help_msgs.append('raw <content>')
-        help_msgs.append('        顯示該則訊息在被格式化前的型態')
-        help_msgs.append('choose <item1> [<item2>...]')
-        help_msgs.append('        隨機選擇其中一個項目')
-        help_msgs.append('time [<time>]')
-        help_msgs.append('        顯示不同時區中的現在時間或特定時間')
-        help_msgs.append('yt/youtube <YouTube URL>')
-        help_msgs.append('        顯示該 YouTube 影片最新的縮圖')
-        help_msgs.append('stock/finance <stock symbol>')
-        help_msgs.append('        顯示該股票的最新價格（延遲）')
-        help_msgs.append('```')
-
-        await message.reply('\n'.join(help_msgs))
-
-    def _parse_arguments(self, message_line: str) -> List[str]:
-        """Parse the arguments in the message if it starts with the prefix"""
-
-        message_stripped = message_line.strip()
-
-        if not message_stripped.startswith(self.prefix):
-            return []
-
-        arguments = shlex.split(message_stripped)
-
-        if arguments[0] == '$':
-            # e.g. $ command arg1 arg2
-            arguments = arguments[1:]
-        else:
-            # e.g. $command arg1 arg2
-            arguments[0] = arguments[0][1:]
-
-        return arguments
-
-
-client = DakaP()
-
-
-@discord.app_commands.guild_only()
-@discord.app_commands.default_permissions(
-    send_messages=True,
-    send_messages_in_threads=True,
-)
-@client.tree.context_menu(name='擷取 YT 預覽圖')
-async def context_menu_reply_youtube_thumbnail(
-    interaction: discord.Interaction,
-    message: discord.Message,
-) -> None:
-    for message_line in message.content.splitlines():
-        try:
-            thumbnail_url = parse_and_generate_youtube_thumbnail_url(
-                yt_url=message_line,
-            )
-        except ValueError:
-            continue
-        else:
-            return await interaction.response.send_message(content=thumbnail_url)
-    return await interaction.response.send_message(
-        content='No YouTube URL found in the message.',
-        ephemeral=True,
-    )
-
-
-def main():
-    """Run the bot with the token."""
-
-    with open('bot-token', encoding='utf-8') as token_file:
-        token = token_file.read().strip()
-
-    asyncio.run(client.start(token))
-
-
-if __name__ == "__main__":
-    main()
+"""A Discord bot made by lcy"""
+
+import asyncio
+import importlib
+import logging
+import os
+import re
+import shlex
+import signal
+import sys
+import time
+from functools import partial
+from typing import List, Sequence, TypeVar, cast
+
+import discord
+
+from .command_pipeline import CommandPipeline
+from .command_sync import sync_commands
+from .common import Command, LazyCommandFunc
+from .event_recorder import RECORD_EVENTS_ENV, EventRecorder, get_record_path
+from .http_trace import create_trace_config
+from .live_emoji_counter import LIVE_FLUSH_INTERVAL, get_live_emoji_counter
+from .memory import get_memory_config
+from .metrics import METRICS_PORT_ENV, get_metrics
+from .shards import (SHARD_COUNT_ENV, SHARD_PROCESSES_ENV, Supervisor,
+                     get_recommended_shard_count, use_discord_endpoints)
+from .stock_watch_store import get_stock_watch_store, has_stock_watch_store
+from .youtube_thumbnail import MAX_THUMBNAILS, generate_youtube_thumbnail_urls
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s:%(levelname)-7s:%(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S',
+)
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+_STARTED_AT = time.perf_counter()
+
+T = TypeVar('T')  # pylint: disable=invalid-name
+
+COMMANDS = [
+    Command(
+        names=('emoji', 'emojis'),
+        func=LazyCommandFunc(f'{__package__}.count_emojis', 'count_emojis'),
+        usage='[<N>d|<N>w] [#<channel>...] [top [<k>] | <emoji>...]',
+        description=(
+            '計算伺服器內一定時間內各個 emoji 的數量'
+            '（訊息只在第一次掃描時計數，之後的編輯、離線時的刪除及舊訊息的新反應不會更新）'
+        ),
+    ),
+    Command(
+        names=('raw',),
+        func=LazyCommandFunc(f'{__package__}.misc', 'show_raw_message'),
+        usage='<content>',
+        description='顯示該則訊息在被格式化前的型態',
+    ),
+    Command(
+        names=('choose',),
+        func=LazyCommandFunc(f'{__package__}.misc', 'random_choice'),
+        usage='<item1> [<item2>...]',
+        description='隨機選擇其中一個項目',
+    ),
+    Command(
+        names=('time',),
+        func=LazyCommandFunc(f'{__package__}.get_time', 'get_time'),
+        usage='[<time>]',
+        description='顯示不同時區中的現在時間或特定時間',
+    ),
+    Command(
+        names=('yt', 'youtube'),
+        func=LazyCommandFunc(f'{__package__}.youtube_thumbnail', 'reply_youtube_thumbnail'),
+        usage='<YouTube URL>...',
+        description='顯示該 YouTube 影片最新的縮圖',
+    ),
+    Command(
+        names=('stock', 'finance'),
+        func=LazyCommandFunc(f'{__package__}.stock_watch', 'stock_command'),
+        usage=(
+            '<stock symbol>... | watch [<stock symbol>...] | unwatch [<stock symbol>...]'
+            ' | alert <stock symbol> <|> <price>'
+        ),
+        description='顯示該股票的最新價格（延遲），或在此頻道追蹤價格及設定到價提醒',
+    ),
+    Command(
+        names=('stats',),
+        func=LazyCommandFunc(f'{__package__}.metrics', 'send_stats'),
+        usage='',
+        description='顯示 bot 的統計數據（限擁有者）',
+    ),
+]
+"""The commands other than `help`, which is generated from them"""
+
+
+class DakaP(discord.AutoShardedClient):
+    """A Discord bot made by lcy"""
+
+    def __init__(
+        self,
+        prefix: str = '$',
+        commands: Sequence[Command] = COMMANDS,
+        warm_commands: bool = True,
+        shard_ids: Sequence[int] | None = None,
+        shard_count: int | None = None,
+    ):
+        """
+        `warm_commands`: Import the modules of the commands in the background after ready,
+        instead of on their first use.
+        `shard_ids`: The shards to run in this process, or all of them if not given, in which
+        case `shard_count` is the recommended one if not given.
+        """
+        self.prefix = prefix
+        self.warm_commands = warm_commands
+        self.event_recorder: EventRecorder | None = None
+        self.commands = [
+            Command(names=('help',), func=DakaP._send_help, usage='', description='顯示說明'),
+            *commands,
+        ]
+        self._command_table = {
+            name: command
+            for command in self.commands
+            for name in command.names
+        }
+        self._command_pattern = re.compile(rf'\s*{re.escape(prefix)}\s*(\S+)')
+        super().__init__(
+            intents=discord.Intents(
+                guilds=True,
+                emojis_and_stickers=True,
+                guild_messages=True,
+                guild_reactions=True,
+                message_content=True,
+            ),
+            http_trace=create_trace_config(),
+            # For `on_socket_raw_receive`
+            enable_debug_events=bool(os.environ.get(RECORD_EVENTS_ENV)),
+            shard_ids=list(shard_ids) if shard_ids is not None else None,
+            shard_count=shard_count,
+            **get_memory_config().get_client_options(),
+        )
+        self.tree = discord.app_commands.CommandTree(self)
+        self.tree.add_command(discord.app_commands.ContextMenu(
+            name='擷取 YT 預覽圖',
+            callback=context_menu_reply_youtube_thumbnail,
+        ))
+        # Observe the responses of the Discord API from the start
+        metrics = get_metrics()
+        self.command_pipeline = CommandPipeline.from_env(on_wait=metrics.observe_command_wait)
+        metrics.register_queue('commands', self.command_pipeline)
+
+    async def setup_hook(self) -> None:
+        logger.info(f'Logged in {time.perf_counter() - _STARTED_AT:.2f}s since imported')
+        first_shard_id = self.shard_ids[0] if self.shard_ids else 0
+        # Once for all the worker processes of the shards
+        if first_shard_id == 0:
+            await sync_commands(self.tree)
+        self.loop.create_task(self._flush_live_emoji_counts())
+        if metrics_port := os.environ.get(METRICS_PORT_ENV):
+            # A port for each worker process of the shards
+            await get_metrics().start_server(port=int(metrics_port) + first_shard_id)
+        if record_path := os.environ.get(RECORD_EVENTS_ENV):
+            self.event_recorder = EventRecorder(get_record_path(record_path, first_shard_id))
+
+    async def close(self) -> None:
+        await get_live_emoji_counter().flush()
+        # Only if the emoji command has built any cubes
+        if emoji_cube := sys.modules.get(f'{__package__}.emoji_cube'):
+            await emoji_cube.save_emoji_cubes()
+        if self.event_recorder:
+            self.event_recorder.close()
+        await super().close()
+
+    async def _flush_live_emoji_counts(self) -> None:
+        """Persist the live emoji counts from time to time."""
+        while not self.is_closed():
+            await asyncio.sleep(LIVE_FLUSH_INTERVAL)
+            await get_live_emoji_counter().flush()
+
+    async def on_ready(self) -> None:
+        """Triggered when ready."""
+        if not self.user:
+            raise RuntimeError('User not ready.')
+        logger.info(f'Username   : {self.user.name}')
+        logger.info(f'ID         : {self.user.id}')
+        logger.info(
+            f'In guild(s): {", ".join([f"{guild.name}({guild.id})" for guild in self.guilds])}'
+        )
+        logger.info(f'Ready in {time.perf_counter() - _STARTED_AT:.2f}s since imported')
+
+        if self.warm_commands:
+            self.loop.create_task(self._warm_commands())
+        self.loop.create_task(self._start_stock_watcher())
+
+    async def on_shard_ready(self, shard_id: int) -> None:
+        """Triggered when a shard has started a new session, including after identifying again."""
+        await get_live_emoji_counter().start_session(shard_id)
+        logger.info(f'Shard {shard_id} ready')
+
+    async def on_shard_resumed(self, shard_id: int) -> None:
+        """Triggered when a shard has resumed its session, which replays the missed events."""
+        logger.info(f'Shard {shard_id} resumed')
+
+    async def _warm_commands(self) -> None:
+        """Import the modules of the commands in another thread."""
+        for command in self.commands:
+            if isinstance(command.func, LazyCommandFunc) and not command.func.loaded:
+                await asyncio.to_thread(command.func.load)
+
+    async def _start_stock_watcher(self) -> None:
+        """
+        Poll the watched stocks of the channels if there are any, importing the module in another
+        thread. Otherwise it is started by the first `$stock watch` or `$stock alert`.
+        """
+        if not has_stock_watch_store():
+            return
+        store = get_stock_watch_store()
+        if not await store.run(store.has_subscriptions):
+            return
+        stock_watch = await asyncio.to_thread(importlib.import_module, f'{__package__}.stock_watch')
+        stock_watch.get_stock_watcher().start(self)
+
+    async def on_socket_raw_receive(self, raw_message: str) -> None:
+        """Triggered for each message of the gateway if `RECORD_EVENTS_ENV` is set."""
+        if self.event_recorder:
+            self.event_recorder.record(raw_message)
+
+    async def on_message(self, message: discord.Message) -> None:
+        """Triggered when a message start with specific prefix."""
+
+        get_live_emoji_counter().on_message(self, message)
+
+        if message.author.bot:
+            return
+
+        # Most of the messages are not commands
+        if self.prefix not in message.content:
+            return
+
+        for message_line in message.content.splitlines():
+            if not (command := self._match_command(message_line)):
+                continue
+
+            arguments = self._parse_arguments(message_line)
+            if not arguments:
+                continue
+            logger.info(f'{message.guild}-{message.channel}: {arguments[0].lower()}')
+            # Run after the previous commands in the channel, without blocking the other channels
+            if not self.command_pipeline.submit(
+                name=command.names[0],
+                func=partial(self._run_command, command, message, arguments),
+                channel_id=message.channel.id,
+                guild_id=message.guild.id if message.guild else None,
+            ):
+                logger.warning(f'Shed {arguments[0].lower()} in {message.channel.id}')
+                await message.reply('```Too busy now, please try again later```')
+                return
+
+    async def _run_command(
+        self,
+        command: Command,
+        message: discord.Message,
+        arguments: Sequence[str],
+    ) -> None:
+        """Run the command and record its latency."""
+        start_time = time.perf_counter()
+        failed = True
+        try:
+            await command.func(self, message, arguments)
+            failed = False
+        finally:
+            get_metrics().observe_command(
+                command_name=command.names[0],
+                seconds=time.perf_counter() - start_time,
+                failed=failed,
+            )
+
+    async def on_message_delete(self, message: discord.Message) -> None:
+        """Triggered when a cached message is deleted."""
+        await get_live_emoji_counter().on_message_delete(self, message)
+
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
+        """Triggered when a reaction is added to a message."""
+        if payload.guild_id and (guild := self.get_guild(payload.guild_id)):
+            get_live_emoji_counter().on_raw_reaction_add(guild, payload)
+
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent) -> None:
+        """Triggered when a reaction is removed from a message."""
+        if payload.guild_id and (guild := self.get_guild(payload.guild_id)):
+            get_live_emoji_counter().on_raw_reaction_remove(guild, payload)
+
+    async def on_guild_emojis_update(
+        self,
+        guild: discord.Guild,
+        _before: Sequence[discord.Emoji],
+        _after: Sequence[discord.Emoji],
+    ) -> None:
+        """Triggered when the emojis of a guild are changed."""
+        get_live_emoji_counter().invalidate_emojis(guild.id)
+
+    @staticmethod
+    async def _send_help(
+        client: discord.Client,
+        message: discord.Message,
+        _arguments: Sequence[str],
+    ) -> None:
+        """Send the help message of this bot"""
+        help_msgs = []
+        help_msgs.append('Source: https://github.com/lcy0321/DakaP')
+        help_msgs.append('```')
+        # Registered as a `CommandFunc` of the bot itself
+        for command in cast(DakaP, client).commands:
+            help_msgs.append(' '.join(filter(None, ['/'.join(command.names), command.usage])))
+            help_msgs.append(f'        {command.description}')
+        help_msgs.append('```')
+
+        await message.reply('\n'.join(help_msgs))
+
+    def _match_command(self, message_line: str) -> Command | None:
+        """Find the command if the line starts with the prefix and a command name"""
+        if not (matched := self._command_pattern.match(message_line)):
+            return None
+        return self._command_table.get(matched[1].lower())
+
+    def _parse_arguments(self, message_line: str) -> List[str]:
+        """Parse the arguments in the message if it starts with the prefix"""
+
+        message_stripped = message_line.strip()
+
+        if not message_stripped.startswith(self.prefix):
+            return []
+
+        arguments = shlex.split(message_stripped)
+
+        if arguments[0] == '$':
+            # e.g. $ command arg1 arg2
+            arguments = arguments[1:]
+        else:
+            # e.g. $command arg1 arg2
+            arguments[0] = arguments[0][1:]
+
+        return arguments
+
+
+@discord.app_commands.guild_only()
+@discord.app_commands.default_permissions(
+    send_messages=True,
+    send_messages_in_threads=True,
+)
+async def context_menu_reply_youtube_thumbnail(
+    interaction: discord.Interaction,
+    message: discord.Message,
+) -> None:
+    if thumbnail_urls := generate_youtube_thumbnail_urls(message.content):
+        return await interaction.response.send_message(
+            content='\n'.join(thumbnail_urls[:MAX_THUMBNAILS]),
+        )
+    return await interaction.response.send_message(
+        content='No YouTube URL found in the message.',
+        ephemeral=True,
+    )
+
+
+def run(token: str, shard_ids: Sequence[int] | None = None, shard_count: int | None = None):
+    """Run the bot on the shard IDs, or on all the shards if not given, until it is closed."""
+    use_discord_endpoints()
+    client = DakaP(shard_ids=shard_ids, shard_count=shard_count)
+    asyncio.run(client.start(token))
+
+
+def main():
+    """Run the bot with the token, in the worker processes of the shards if configured."""
+
+    with open('bot-token', encoding='utf-8') as token_file:
+        token = token_file.read().strip()
+
+    shard_count = int(os.environ[SHARD_COUNT_ENV]) if SHARD_COUNT_ENV in os.environ else None
+    process_count = int(os.environ.get(SHARD_PROCESSES_ENV, 1))
+    if process_count <= 1:
+        run(token, shard_count=shard_count)
+        return
+
+    if shard_count is None:
+        use_discord_endpoints()
+        shard_count = max(asyncio.run(get_recommended_shard_count(token)), process_count)
+    supervisor = Supervisor(
+        runner=partial(run, token),
+        shard_count=shard_count,
+        process_count=process_count,
+    )
+    signal.signal(signal.SIGTERM, lambda _signal_number, _frame: supervisor.stop())
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""A SQLite database shared by the processes of the shards, queried off the event loop"""
+
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar
+
+T = TypeVar('T')  # pylint: disable=invalid-name
+
+
+class Database:
+    """
+    A connection in WAL mode, which is opened and whose blocking methods are called through `run`
+    in a thread of its own. Another process may hold the lock for up to the busy timeout, which
+    must not stall the event loop (and the heartbeats of the gateway), and a single thread keeps
+    the transactions of the connection from interleaving.
+    """
+
+    def __init__(self, path: str, timeout: float, schema: str):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+        # Before any call through `run`
+        self._opened = self._executor.submit(_open, path, timeout, schema)
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # Only waits out of the thread, e.g. when called directly in the tests
+        return self._opened.result()
+
+    def close(self) -> None:
+        """Close the underlying database after the pending calls."""
+        self._executor.shutdown()
+        self._connection.close()
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Call a blocking method of the database in its thread, e.g. `run(db.get, key)`."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            partial(func, *args, **kwargs),
+        )
+
+
+def _open(path: str, timeout: float, schema: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+    # Let the readers go on while a process is writing
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.executescript(schema)
+    return connection
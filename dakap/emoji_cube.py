@@ -0,0 +1,410 @@
+"""An in-memory emoji × channel × day cube of the emoji counts, for fast window queries"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Collection, Iterable, Sequence
+from typing import Literal
+
+import numpy as np
+
+from .common import get_data_path
+from .emoji_index import RETENTION_DAYS, EmojiIndex, current_day
+from .memory import get_memory_config
+
+EMOJI_CUBE_DIR = get_data_path('emoji-cube')
+"""The directory to save the cube of each guild in, to be memory-mapped after restarting"""
+EMOJI_CUBE_SAVE_INTERVAL = 60 * 60
+"""The minimum seconds between the saves of the rebuilt cubes of a guild, besides shutting down"""
+
+_COUNT_DTYPE = np.int32
+_EMOJI_COUNTS_FILENAME = 'emoji_counts.npy'
+_MESSAGE_COUNTS_FILENAME = 'message_counts.npy'
+_META_FILENAME = 'meta.json'
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+_cubes: OrderedDict[int, 'EmojiCube'] = OrderedDict()
+"""The latest cubes of the recently used guilds, the least recently used first"""
+_unsaved_guild_ids: set[int] = set()
+"""The guilds whose cubes in `_cubes` are newer than the saved ones"""
+_last_saved: dict[int, float] = {}
+"""The `time.monotonic()` when the cube of each guild was last saved"""
+
+
+class EmojiCube:
+    """
+    The counts of a guild from `first_day` to `last_day` as arrays, where the emojis and the
+    channels are sorted by ID:
+    - `emoji_counts[emoji slot, channel slot, day - first_day]`
+    - `message_counts[channel slot, day - first_day]`
+
+    It is a snapshot of the counts of the guild in the index at `revision`.
+    """
+
+    def __init__(
+        self,
+        emoji_ids: Iterable[int],
+        channel_ids: Iterable[int],
+        first_day: int,
+        emoji_counts: np.ndarray,
+        message_counts: np.ndarray,
+        revision: int,
+    ):
+        self.emoji_ids = np.array(sorted(emoji_ids), dtype=np.int64)
+        self.channel_ids = np.array(sorted(channel_ids), dtype=np.int64)
+        self.first_day = first_day
+        self.emoji_counts = emoji_counts
+        self.message_counts = message_counts
+        self.revision = revision
+
+        expected_shape = (len(self.emoji_ids), len(self.channel_ids))
+        if emoji_counts.shape[:2] != expected_shape or message_counts.shape != (
+            len(self.channel_ids),
+            emoji_counts.shape[2],
+        ):
+            raise ValueError(f'Mismatched shapes: {emoji_counts.shape}, {message_counts.shape}')
+
+    @property
+    def last_day(self) -> int:
+        return self.first_day + self.emoji_counts.shape[2] - 1
+
+    @classmethod
+    def build(
+        cls,
+        emoji_ids: Collection[int],
+        channel_ids: Collection[int],
+        first_day: int,
+        last_day: int,
+        daily_emoji_counts: Sequence[tuple[int, int, int, int]],
+        daily_message_counts: Sequence[tuple[int, int, int]],
+        revision: int,
+    ) -> 'EmojiCube':
+        """
+        Build the cube from the `(channel_id, day, emoji_id, count)` and the
+        `(channel_id, day, count)` rows. The rows of the other emojis, channels or days are ignored.
+        """
+        cube = cls(
+            emoji_ids=emoji_ids,
+            channel_ids=channel_ids,
+            first_day=first_day,
+            emoji_counts=np.zeros(
+                (len(emoji_ids), len(channel_ids), last_day - first_day + 1),
+                dtype=_COUNT_DTYPE,
+            ),
+            message_counts=np.zeros(
+                (len(channel_ids), last_day - first_day + 1),
+                dtype=_COUNT_DTYPE,
+            ),
+            revision=revision,
+        )
+
+        if daily_emoji_counts:
+            channel_col, day_col, emoji_col, count_col = np.array(
+                daily_emoji_counts,
+                dtype=np.int64,
+            ).T
+            emoji_slots, emoji_known = _to_slots(cube.emoji_ids, emoji_col)
+            channel_slots, channel_known = _to_slots(cube.channel_ids, channel_col)
+            day_slots, day_known = cube._to_day_slots(day_col)
+            known = emoji_known & channel_known & day_known
+            np.add.at(
+                cube.emoji_counts,
+                (emoji_slots[known], channel_slots[known], day_slots[known]),
+                count_col[known],
+            )
+
+        if daily_message_counts:
+            channel_col, day_col, count_col = np.array(daily_message_counts, dtype=np.int64).T
+            channel_slots, channel_known = _to_slots(cube.channel_ids, channel_col)
+            day_slots, day_known = cube._to_day_slots(day_col)
+            known = channel_known & day_known
+            np.add.at(
+                cube.message_counts,
+                (channel_slots[known], day_slots[known]),
+                count_col[known],
+            )
+
+        return cube
+
+    def matches(self, emoji_ids: Collection[int], channel_ids: Collection[int]) -> bool:
+        """If the cube is of the same emojis and channels."""
+        return (
+            len(emoji_ids) == len(self.emoji_ids)
+            and len(channel_ids) == len(self.channel_ids)
+            and bool(np.all(self.emoji_ids == sorted(emoji_ids)))
+            and bool(np.all(self.channel_ids == sorted(channel_ids)))
+        )
+
+    def get_emoji_counts(
+        self,
+        since_day: int,
+        channel_ids: Collection[int] | None = None,
+    ) -> dict[int, int]:
+        """Get the count of each emoji (by ID) in the channels (or all) since the day."""
+        counts = self._select_emoji_counts(since_day, channel_ids).sum(axis=(1, 2))
+        return dict(zip(self.emoji_ids.tolist(), counts.tolist()))
+
+    def get_message_counts(
+        self,
+        since_day: int,
+        channel_ids: Collection[int] | None = None,
+    ) -> dict[int, int]:
+        """Get the number of messages in each channel (or all) since the day."""
+        channel_slots = self._select_channel_slots(channel_ids)
+        counts = self.message_counts[channel_slots, self._day_slice(since_day)].sum(axis=1)
+        return dict(zip(self.channel_ids[channel_slots].tolist(), counts.tolist()))
+
+    def get_top_emojis_per_channel(
+        self,
+        top_k: int,
+        since_day: int,
+        channel_ids: Collection[int] | None = None,
+    ) -> dict[int, list[tuple[int, int]]]:
+        """
+        Get the `top_k` `(emoji_id, count)` with positive counts in each channel since the day.
+        """
+        channel_slots = self._select_channel_slots(channel_ids)
+        # [emoji slot, channel slot]
+        counts = self._select_emoji_counts(since_day, channel_ids).sum(axis=2)
+        top_k = min(top_k, len(self.emoji_ids))
+        if not top_k:
+            return {int(channel_id): [] for channel_id in self.channel_ids[channel_slots]}
+
+        # The top k of each channel in any order, then sorted by the counts
+        top_slots = np.argpartition(-counts, top_k - 1, axis=0)[:top_k]
+        top_counts = np.take_along_axis(counts, top_slots, axis=0)
+        order = np.argsort(-top_counts, axis=0, kind='stable')
+        top_slots = np.take_along_axis(top_slots, order, axis=0)
+        top_counts = np.take_along_axis(top_counts, order, axis=0)
+
+        return {
+            int(channel_id): [
+                (int(self.emoji_ids[emoji_slot]), int(count))
+                for emoji_slot, count in zip(top_slots[:, column], top_counts[:, column])
+                if count > 0
+            ]
+            for column, channel_id in enumerate(self.channel_ids[channel_slots])
+        }
+
+    def get_trends(
+        self,
+        emoji_ids: Collection[int],
+        since_day: int,
+        bucket_days: int,
+        channel_ids: Collection[int] | None = None,
+    ) -> dict[int, list[int]]:
+        """
+        Get the counts of each emoji (by ID) in every `bucket_days` days since the day, oldest
+        first. The last bucket ends at `last_day`, and the first one may be shorter.
+        """
+        emoji_slots, known = _to_slots(self.emoji_ids, np.array(list(emoji_ids), dtype=np.int64))
+        emoji_slots = emoji_slots[known]
+        day_slice = self._day_slice(since_day)
+        # [emoji, day]
+        daily_counts = (
+            self.emoji_counts[emoji_slots][:, self._select_channel_slots(channel_ids), day_slice]
+            .sum(axis=1)
+        )
+        day_count = daily_counts.shape[1]
+        if not day_count:
+            return {int(self.emoji_ids[emoji_slot]): [] for emoji_slot in emoji_slots}
+
+        bucket_starts = np.arange(day_count - bucket_days, -bucket_days, -bucket_days)[::-1]
+        bucket_starts[0] = max(bucket_starts[0], 0)
+        bucket_counts = np.add.reduceat(daily_counts, bucket_starts, axis=1)
+        return {
+            int(self.emoji_ids[emoji_slot]): counts.tolist()
+            for emoji_slot, counts in zip(emoji_slots, bucket_counts)
+        }
+
+    def save(self, directory: str) -> None:
+        """Save the cube into the directory, in the format which can be memory-mapped."""
+        os.makedirs(directory, exist_ok=True)
+        for filename, array in [
+            (_EMOJI_COUNTS_FILENAME, self.emoji_counts),
+            (_MESSAGE_COUNTS_FILENAME, self.message_counts),
+        ]:
+            temp_path = os.path.join(directory, f'.{filename}')
+            with open(temp_path, 'wb') as array_file:
+                np.save(array_file, array)
+            os.replace(temp_path, os.path.join(directory, filename))
+
+        # The metadata is written last, so a partly saved cube has the previous revision
+        temp_path = os.path.join(directory, f'.{_META_FILENAME}')
+        with open(temp_path, 'w', encoding='utf-8') as meta_file:
+            json.dump(
+                {
+                    'emoji_ids': self.emoji_ids.tolist(),
+                    'channel_ids': self.channel_ids.tolist(),
+                    'first_day': self.first_day,
+                    'revision': self.revision,
+                },
+                meta_file,
+            )
+        os.replace(temp_path, os.path.join(directory, _META_FILENAME))
+
+    @classmethod
+    def load(
+        cls,
+        directory: str,
+        mmap_mode: Literal['r', 'r+', 'c'] | None = 'r',
+    ) -> 'EmojiCube':
+        """
+        Load the cube saved in the directory, and memory-map the counts (read-only by default)
+        unless `mmap_mode` is None.
+        """
+        with open(os.path.join(directory, _META_FILENAME), encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        return cls(
+            emoji_ids=meta['emoji_ids'],
+            channel_ids=meta['channel_ids'],
+            first_day=meta['first_day'],
+            emoji_counts=np.load(os.path.join(directory, _EMOJI_COUNTS_FILENAME), mmap_mode),
+            message_counts=np.load(os.path.join(directory, _MESSAGE_COUNTS_FILENAME), mmap_mode),
+            revision=meta['revision'],
+        )
+
+    def _to_day_slots(self, days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        day_slots = days - self.first_day
+        return day_slots, (day_slots >= 0) & (day_slots < self.emoji_counts.shape[2])
+
+    def _day_slice(self, since_day: int) -> slice:
+        return slice(max(since_day - self.first_day, 0), None)
+
+    def _select_channel_slots(self, channel_ids: Collection[int] | None) -> np.ndarray:
+        if channel_ids is None:
+            return np.arange(len(self.channel_ids))
+        channel_slots, known = _to_slots(
+            self.channel_ids,
+            np.array(list(channel_ids), dtype=np.int64),
+        )
+        return channel_slots[known]
+
+    def _select_emoji_counts(
+        self,
+        since_day: int,
+        channel_ids: Collection[int] | None,
+    ) -> np.ndarray:
+        if channel_ids is None:
+            return self.emoji_counts[:, :, self._day_slice(since_day)]
+        return self.emoji_counts[
+            :,
+            self._select_channel_slots(channel_ids),
+            self._day_slice(since_day),
+        ]
+
+
+def _to_slots(sorted_ids: np.ndarray, ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Get the slots of the IDs in the sorted IDs, and a mask of the IDs found."""
+    slots = np.searchsorted(sorted_ids, ids)
+    slots[slots == len(sorted_ids)] = 0
+    known = sorted_ids[slots] == ids if len(sorted_ids) else np.zeros(len(ids), dtype=bool)
+    return slots, known
+
+
+async def get_emoji_cube(
+    guild_id: int,
+    emoji_ids: Collection[int],
+    channel_ids: Collection[int],
+    emoji_index: EmojiIndex,
+) -> EmojiCube:
+    """
+    Get the cube of the guild for the retention period up to today. It is reused while the counts
+    of the guild in the index are unchanged, and loaded from `EMOJI_CUBE_DIR` after restarting;
+    otherwise it is rebuilt from the index, and saved in another thread unless it has been saved
+    within `EMOJI_CUBE_SAVE_INTERVAL` seconds.
+    """
+    today = current_day()
+    revision = await emoji_index.run(emoji_index.get_revision, guild_id)
+    directory = _get_directory(guild_id)
+
+    def _is_valid(cube: EmojiCube | None) -> bool:
+        return (
+            cube is not None
+            and cube.revision == revision
+            and cube.last_day == today
+            and cube.matches(emoji_ids, channel_ids)
+        )
+
+    cube = _cubes.get(guild_id)
+    if cube is None and os.path.exists(directory):
+        try:
+            cube = EmojiCube.load(directory)
+            _logger.info(f'Loaded the emoji cube of guild {guild_id} (revision {cube.revision})')
+        except (OSError, ValueError, KeyError) as error:
+            _logger.warning(f'Failed to load the emoji cube of guild {guild_id}: {error!r}')
+    if _is_valid(cube):
+        assert cube is not None
+        _put_cube(guild_id, cube)
+        return cube
+
+    first_day = today - RETENTION_DAYS
+    cube = EmojiCube.build(
+        emoji_ids=emoji_ids,
+        channel_ids=channel_ids,
+        first_day=first_day,
+        last_day=today,
+        daily_emoji_counts=await emoji_index.run(
+            emoji_index.get_daily_emoji_counts,
+            channel_ids,
+            since_day=first_day,
+        ),
+        daily_message_counts=await emoji_index.run(
+            emoji_index.get_daily_message_counts,
+            channel_ids,
+            since_day=first_day,
+        ),
+        revision=revision,
+    )
+    _logger.debug(f'Built the emoji cube of guild {guild_id}: {cube.emoji_counts.shape}')
+    _put_cube(guild_id, cube)
+    _unsaved_guild_ids.add(guild_id)
+
+    last_saved = _last_saved.get(guild_id)
+    if last_saved is not None and time.monotonic() - last_saved < EMOJI_CUBE_SAVE_INTERVAL:
+        # The live counts change the revision every few minutes
+        return cube
+    if await _save_cube(guild_id, cube) and get_memory_config().low_memory:
+        # Keep the counts in the page cache instead of the heap
+        cube = EmojiCube.load(directory)
+        _put_cube(guild_id, cube)
+    return cube
+
+
+async def save_emoji_cubes() -> None:
+    """Save the cubes newer than the saved ones, e.g. before shutting down."""
+    for guild_id in list(_unsaved_guild_ids):
+        if cube := _cubes.get(guild_id):
+            await _save_cube(guild_id, cube)
+
+
+def _get_directory(guild_id: int) -> str:
+    return os.path.join(EMOJI_CUBE_DIR, str(guild_id))
+
+
+def _put_cube(guild_id: int, cube: EmojiCube) -> None:
+    """Keep the cube as the most recently used one, and drop the least recently used ones."""
+    _cubes[guild_id] = cube
+    _cubes.move_to_end(guild_id)
+    while len(_cubes) > get_memory_config().max_emoji_cubes:
+        # Rebuilt from the index if used again
+        dropped_guild_id, _ = _cubes.popitem(last=False)
+        _unsaved_guild_ids.discard(dropped_guild_id)
+
+
+async def _save_cube(guild_id: int, cube: EmojiCube) -> bool:
+    """Save the cube in another thread, and tell if it is saved."""
+    try:
+        # Tens of MB for a large guild
+        await asyncio.to_thread(cube.save, _get_directory(guild_id))
+    except OSError as error:
+        _logger.warning(f'Failed to save the emoji cube of guild {guild_id}: {error!r}')
+        return False
+    _last_saved[guild_id] = time.monotonic()
+    if _cubes.get(guild_id) is cube:
+        _unsaved_guild_ids.discard(guild_id)
+    return True
@@ -0,0 +1,242 @@
+"""A local on-disk index of the emoji counts in the guilds"""
+
+import logging
+import time
+from collections.abc import Collection, Mapping
+from functools import lru_cache
+
+import discord
+
+from .common import get_data_path
+from .database import Database
+
+EMOJI_INDEX_PATH = get_data_path('emoji-index.sqlite3')
+EMOJI_INDEX_TIMEOUT = 30.0
+"""Seconds to wait for the other processes writing to the index"""
+RETENTION_DAYS = 12 * 7
+"""The counts older than this are dropped"""
+
+_MS_PER_DAY = 24 * 60 * 60 * 1000
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS emoji_counts (
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    emoji_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, day, emoji_id)
+);
+CREATE TABLE IF NOT EXISTS message_counts (
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, day)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    channel_id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    last_message_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    guild_id INTEGER PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+'''
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+def current_day() -> int:
+    """Get today (days since the Unix epoch, in UTC)."""
+    return int(time.time() * 1000) // _MS_PER_DAY
+
+
+def snowflake_day(snowflake: int) -> int:
+    """Get the day (days since the Unix epoch, in UTC) when the snowflake was created."""
+    return ((snowflake >> 22) + discord.utils.DISCORD_EPOCH) // _MS_PER_DAY
+
+
+class EmojiIndex(Database):
+    """
+    Per-channel, per-day emoji counts and message counts, plus a checkpoint of the last message
+    scanned in each channel, so that only the newer messages have to be fetched next time. The
+    messages before the checkpoints are never scanned again.
+    """
+
+    def __init__(self, path: str = EMOJI_INDEX_PATH):
+        super().__init__(path, timeout=EMOJI_INDEX_TIMEOUT, schema=_SCHEMA)
+
+    def get_revision(self, guild_id: int) -> int:
+        """Get a number of the guild which is increased whenever its counts are changed."""
+        row = self._connection.execute(
+            'SELECT revision FROM revisions WHERE guild_id = ?',
+            (guild_id,),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_checkpoint(self, channel_id: int) -> int | None:
+        """Get the ID of the last scanned message in the channel."""
+        row = self._connection.execute(
+            'SELECT last_message_id FROM checkpoints WHERE channel_id = ?',
+            (channel_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_checkpoints(self, channel_ids: Collection[int]) -> dict[int, int]:
+        """Get the IDs of the last scanned messages in the channels which have been scanned."""
+        return dict(
+            self._connection.execute(
+                f'''
+                SELECT channel_id, last_message_id FROM checkpoints
+                WHERE channel_id IN ({_placeholders(channel_ids)})
+                ''',
+                tuple(channel_ids),
+            )
+        )
+
+    def add_counts(
+        self,
+        guild_id: int,
+        channel_id: int,
+        message_counts: Mapping[int, int],
+        emoji_counts: Mapping[tuple[int, int], int],
+        checkpoint: int | None,
+    ) -> None:
+        """
+        Add the counts of the newly scanned messages and move the checkpoint of the channel.
+        `message_counts` is keyed by day, and `emoji_counts` is keyed by `(day, emoji_id)`.
+        """
+        with self._connection:
+            self._connection.executemany(
+                '''
+                INSERT INTO message_counts (guild_id, channel_id, day, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (channel_id, day) DO UPDATE SET count = count + excluded.count
+                ''',
+                ((guild_id, channel_id, day, count) for day, count in message_counts.items()),
+            )
+            self._connection.executemany(
+                '''
+                INSERT INTO emoji_counts (guild_id, channel_id, day, emoji_id, count)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (channel_id, day, emoji_id) DO UPDATE SET count = count + excluded.count
+                ''',
+                (
+                    (guild_id, channel_id, day, emoji_id, count)
+                    for (day, emoji_id), count in emoji_counts.items()
+                ),
+            )
+            if message_counts or emoji_counts:
+                self._bump_revisions([guild_id])
+            if checkpoint is not None:
+                self.move_checkpoint(
+                    guild_id=guild_id,
+                    channel_id=channel_id,
+                    checkpoint=checkpoint,
+                )
+
+    def move_checkpoint(self, guild_id: int, channel_id: int, checkpoint: int) -> None:
+        """Move the checkpoint of the channel forward to the message ID."""
+        with self._connection:
+            self._connection.execute(
+                '''
+                INSERT INTO checkpoints (channel_id, guild_id, last_message_id) VALUES (?, ?, ?)
+                ON CONFLICT (channel_id) DO UPDATE
+                SET last_message_id = max(last_message_id, excluded.last_message_id)
+                ''',
+                (channel_id, guild_id, checkpoint),
+            )
+
+    def get_message_counts(self, channel_ids: Collection[int], since_day: int) -> dict[int, int]:
+        """Get the number of messages in each channel since the day."""
+        return dict(
+            self._connection.execute(
+                f'''
+                SELECT channel_id, sum(count) FROM message_counts
+                WHERE day >= ? AND channel_id IN ({_placeholders(channel_ids)})
+                GROUP BY channel_id
+                ''',
+                (since_day, *channel_ids),
+            )
+        )
+
+    def get_emoji_counts(self, channel_ids: Collection[int], since_day: int) -> dict[int, int]:
+        """Get the count of each emoji (by ID) in the channels since the day."""
+        return dict(
+            self._connection.execute(
+                f'''
+                SELECT emoji_id, sum(count) FROM emoji_counts
+                WHERE day >= ? AND channel_id IN ({_placeholders(channel_ids)})
+                GROUP BY emoji_id
+                ''',
+                (since_day, *channel_ids),
+            )
+        )
+
+    def get_daily_message_counts(
+        self,
+        channel_ids: Collection[int],
+        since_day: int,
+    ) -> list[tuple[int, int, int]]:
+        """Get the `(channel_id, day, count)` of the messages in the channels since the day."""
+        return self._connection.execute(
+            f'''
+            SELECT channel_id, day, count FROM message_counts
+            WHERE day >= ? AND channel_id IN ({_placeholders(channel_ids)})
+            ''',
+            (since_day, *channel_ids),
+        ).fetchall()
+
+    def get_daily_emoji_counts(
+        self,
+        channel_ids: Collection[int],
+        since_day: int,
+    ) -> list[tuple[int, int, int, int]]:
+        """
+        Get the `(channel_id, day, emoji_id, count)` of the emojis in the channels since the day.
+        """
+        return self._connection.execute(
+            f'''
+            SELECT channel_id, day, emoji_id, count FROM emoji_counts
+            WHERE day >= ? AND channel_id IN ({_placeholders(channel_ids)})
+            ''',
+            (since_day, *channel_ids),
+        ).fetchall()
+
+    def prune(self, before_day: int) -> None:
+        """Drop the counts older than the day."""
+        with self._connection:
+            guild_ids = [
+                guild_id
+                for guild_id, in self._connection.execute(
+                    '''
+                    SELECT guild_id FROM message_counts WHERE day < ?
+                    UNION SELECT guild_id FROM emoji_counts WHERE day < ?
+                    ''',
+                    (before_day, before_day),
+                )
+            ]
+            self._connection.execute('DELETE FROM message_counts WHERE day < ?', (before_day,))
+            self._connection.execute('DELETE FROM emoji_counts WHERE day < ?', (before_day,))
+            self._bump_revisions(guild_ids)
+
+    def _bump_revisions(self, guild_ids: Collection[int]) -> None:
+        self._connection.executemany(
+            '''
+            INSERT INTO revisions (guild_id, revision) VALUES (?, 1)
+            ON CONFLICT (guild_id) DO UPDATE SET revision = revision + 1
+            ''',
+            ((guild_id,) for guild_id in guild_ids),
+        )
+
+
+def _placeholders(values: Collection) -> str:
+    return ', '.join('?' * len(values))
+
+
+@lru_cache(maxsize=None)
+def get_emoji_index(path: str = EMOJI_INDEX_PATH) -> EmojiIndex:
+    """Get the shared index stored in the path, and open it for the first time."""
+    _logger.info(f'Open the emoji index in {path}')
+    return EmojiIndex(path)
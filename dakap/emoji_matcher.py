@@ -0,0 +1,106 @@
+"""Match the custom emojis of the guild in the messages"""
+
+import re
+from array import array
+from typing import Iterable
+
+import discord
+
+from .common import MessageLike, ReactionLike
+
+# e.g. <:name:123456789012345678> or <a:name:123456789012345678>
+_EMOJI_PATTERN = re.compile(r'<a?:\w+:\d+>')
+
+
+class EmojiMatcher:
+    """
+    Find the emojis used in a message with a single pass over its content and a lookup for each of
+    its reactions, instead of searching for every emoji of the guild.
+    """
+
+    def __init__(self, emojis: Iterable[discord.Emoji]):
+        self.emojis = list(emojis)
+        """The emojis by their slots"""
+        self._slots = {str(emoji): slot for slot, emoji in enumerate(self.emojis)}
+        """Slots keyed by the formatted strings of the emojis, as they appear in the messages"""
+
+    def find(self, emoji_str: str) -> discord.Emoji | None:
+        """Find the emoji by its formatted string, e.g. `str(reaction.emoji)`."""
+        slot = self._slots.get(emoji_str)
+        return self.emojis[slot] if slot is not None else None
+
+    def find_in_content(self, content: str) -> set[discord.Emoji]:
+        """Find the emojis in the content of a message."""
+        return {self.emojis[slot] for slot in self.find_slots_in_content(content)}
+
+    def find_in_reactions(self, reactions: Iterable[discord.Reaction]) -> set[discord.Emoji]:
+        """Find the emojis in the reactions of a message."""
+        return {self.emojis[slot] for slot in self.find_slots_in_reactions(reactions)}
+
+    def find_slots_in_content(self, content: str) -> set[int]:
+        """Find the slots of the emojis in the content of a message."""
+        if '<' not in content:
+            return set()
+        slots = self._slots
+        return {slots[token] for token in _EMOJI_PATTERN.findall(content) if token in slots}
+
+    def find_slots_in_reactions(self, reactions: Iterable[ReactionLike]) -> set[int]:
+        """Find the slots of the emojis in the reactions of a message."""
+        slots = self._slots
+        return {
+            slots[reaction_str]
+            for reaction_str in (str(reaction.emoji) for reaction in reactions)
+            if reaction_str in slots
+        }
+
+
+class DailyEmojiCounts:
+    """
+    The message counts and the emoji counts (by the slots of a matcher) of each day from
+    `first_day` to `last_day`, in flat arrays instead of a `Counter` per message.
+    """
+
+    def __init__(self, emoji_matcher: EmojiMatcher, first_day: int, last_day: int):
+        self.emoji_matcher = emoji_matcher
+        self.first_day = first_day
+        self.last_day = last_day
+        day_count = last_day - first_day + 1
+        self.message_counts = array('I', bytes(4 * day_count))
+        """Indexed by `day - first_day`"""
+        self.emoji_counts = array('I', bytes(4 * day_count * len(emoji_matcher.emojis)))
+        """Indexed by `(day - first_day) * <number of emojis> + slot`"""
+
+    def add_message(self, message: MessageLike, day: int) -> None:
+        """
+        Count the message and its emojis of the day: 1 if it is in the content, and 1 more if it
+        is in the reactions. Raise `IndexError` if the day is out of the range.
+        """
+        if not self.first_day <= day <= self.last_day:
+            raise IndexError(f'Day {day} is not in [{self.first_day}, {self.last_day}]')
+        day_slot = day - self.first_day
+        self.message_counts[day_slot] += 1
+
+        emoji_counts = self.emoji_counts
+        offset = day_slot * len(self.emoji_matcher.emojis)
+        for slot in self.emoji_matcher.find_slots_in_content(message.content):
+            emoji_counts[offset + slot] += 1
+        if message.reactions:
+            for slot in self.emoji_matcher.find_slots_in_reactions(message.reactions):
+                emoji_counts[offset + slot] += 1
+
+    def get_message_counts(self) -> dict[int, int]:
+        """Get the non-zero message counts keyed by day."""
+        return {
+            self.first_day + day_slot: count
+            for day_slot, count in enumerate(self.message_counts)
+            if count
+        }
+
+    def get_emoji_counts(self) -> dict[tuple[int, int], int]:
+        """Get the non-zero emoji counts keyed by `(day, emoji_id)`."""
+        emojis = self.emoji_matcher.emojis
+        return {
+            (self.first_day + index // len(emojis), emojis[index % len(emojis)].id): count
+            for index, count in enumerate(self.emoji_counts)
+            if count
+        }
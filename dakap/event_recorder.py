@@ -0,0 +1,69 @@
+"""Record the gateway events which drive the bot, to be replayed by `benchmarks.bench_replay`"""
+
+import json
+import logging
+import time
+from typing import IO, Any
+
+RECORD_EVENTS_ENV = 'DAKAP_RECORD_EVENTS'
+"""
+The JSONL file to append the received events to, which is off if not set. Note that it contains
+the content of the messages.
+"""
+RECORDED_EVENTS = frozenset({
+    'READY',
+    'GUILD_CREATE',
+    'GUILD_EMOJIS_UPDATE',
+    'MESSAGE_CREATE',
+    'MESSAGE_DELETE',
+    'MESSAGE_REACTION_ADD',
+    'MESSAGE_REACTION_REMOVE',
+})
+"""The events used by the bot, where `READY` and `GUILD_CREATE` are for the state to replay on"""
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class EventRecorder:
+    """
+    Append the dispatched events in `RECORDED_EVENTS` to a JSONL file as
+    `{"at": <seconds since started>, "t": <event>, "d": <payload>}`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.event_count = 0
+        self._file: IO[str] = open(  # pylint: disable=consider-using-with
+            path, 'a', encoding='utf-8'
+        )
+        self._started_at = time.perf_counter()
+        _logger.info(f'Recording the events into {path}')
+
+    def record(self, raw_message: str | dict[str, Any]) -> None:
+        """Record a message of the gateway, which is ignored unless it is a recorded event."""
+        message = json.loads(raw_message) if isinstance(raw_message, str) else raw_message
+        if message.get('op') != 0 or message.get('t') not in RECORDED_EVENTS:
+            return
+        data = message['d']
+        if message['t'] == 'READY':
+            # Not the session
+            data = {'user': data['user']}
+        self._file.write(json.dumps({
+            'at': round(time.perf_counter() - self._started_at, 6),
+            't': message['t'],
+            'd': data,
+        }, ensure_ascii=False) + '\n')
+        self.event_count += 1
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+            _logger.info(f'Recorded {self.event_count} event(s) into {self.path}')
+
+
+def get_record_path(path: str, first_shard_id: int) -> str:
+    """A file for each worker process of the shards, e.g. `events.jsonl` and `events.4.jsonl`."""
+    if first_shard_id == 0:
+        return path
+    stem, dot, extension = path.rpartition('.')
+    return f'{stem}.{first_shard_id}.{extension}' if dot else f'{path}.{first_shard_id}'
@@ -1,11 +1,16 @@
 """Get time in different time zones"""
 
-from datetime import datetime
+import json
+import logging
+import os
+import re
+from datetime import datetime, tzinfo
+from functools import lru_cache
 from typing import Sequence
 
 import discord
 from dateutil import parser
-from dateutil.tz import UTC, gettz
+from dateutil.tz import UTC, enfold, gettz
 
 # TIME_FORMAT = '%Y-%m-%d %I:%M:%S%p'
 TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
@@ -15,6 +20,26 @@ TIMEZONE_NAMES = [
     'America/New_York',
 ]
 DEFAULT_TIMEZONE_NAME = 'Asia/Taipei'
+GUILD_TIMEZONES_PATH = 'guild-timezones.json'
+"""An optional JSON object of the timezone names of each guild, e.g. `{"<guild ID>": [...]}`"""
+
+_TIMEZONE_ALIASES = {
+    **dict.fromkeys(['US', 'ET'], 'America/New_York'),
+    **dict.fromkeys(['JP', 'JPN', 'JAPAN', 'JST'], 'Asia/Tokyo'),
+    **dict.fromkeys(['TW', 'TWN', 'TAIPEI', 'TPE', 'NST', 'CST'], 'Asia/Taipei'),
+}
+
+_FAST_TZNAMES = {*_TIMEZONE_ALIASES, 'UTC', 'GMT'}
+"""The timezone names known not to be other words (e.g. 'PM', 'MON') to `dateutil.parser`"""
+
+# e.g. '21:30', '2023-01-02 21:30:00', '21:30 JST'
+_TIME_PATTERN = re.compile(
+    r'(?:(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2}) )?'
+    r'(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?'
+    r'(?: (?P<tzname>[A-Z]{1,5}))?'
+)
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
 async def get_time(
@@ -38,7 +63,8 @@ async def get_time(
             return
 
     # `datetime`s in each timezone
-    time_in_tzs = [utc_time.astimezone(gettz(timezone)) for timezone in TIMEZONE_NAMES]
+    timezones = _get_timezones(message.guild.id if message.guild else None)
+    time_in_tzs = [utc_time.astimezone(timezone) for timezone in timezones]
 
     msg = []
     msg.append('```')
@@ -61,25 +87,95 @@ def _get_from_time(specific_time_str: str) -> datetime:
     """Get specific time from a string. May raise `parser.ParserError`"""
 
     # default datetime: Precise to the minutes with Asia/Taipei timezone
-    default_dt = datetime.now(tz=gettz(DEFAULT_TIMEZONE_NAME)).replace(second=0, microsecond=0)
-
-    def tzinfo_func(tzname: str, tzoffset: int):
-        """Identify the timezone"""
-        if tzoffset:
-            return tzoffset
-
-        iana_tz = gettz(tzname)
-        if iana_tz:
-            return iana_tz
-
-        # Aliases
-        if tzname in ['US', 'ET']:
-            return gettz('America/New_York')
-        if tzname in ['JP', 'JPN', 'JAPAN', 'JST']:
-            return gettz('Asia/Tokyo')
-        if tzname in ['TW', 'TWN', 'TAIPEI', 'TPE', 'NST', 'CST']:
-            return gettz('Asia/Taipei')
-
-        return gettz(DEFAULT_TIMEZONE_NAME)
-
-    return parser.parse(specific_time_str, default=default_dt, tzinfos=tzinfo_func)
+    default_dt = datetime.now(tz=_get_timezone(DEFAULT_TIMEZONE_NAME)).replace(
+        second=0,
+        microsecond=0,
+    )
+
+    if (specific_time := _parse_common_time(specific_time_str, default_dt)) is not None:
+        return specific_time
+
+    return parser.parse(specific_time_str, default=default_dt, tzinfos=_get_tzinfo)
+
+
+def _parse_common_time(specific_time_str: str, default_dt: datetime) -> datetime | None:
+    """
+    Parse the common formats faster, the same as `dateutil.parser` would.
+    Return None if it is not one of them.
+    """
+    if not (matched := _TIME_PATTERN.fullmatch(specific_time_str)):
+        return None
+
+    year, month, day, hour, minute, second, tzname = matched.groups()
+    if tzname is not None and tzname not in _FAST_TZNAMES:
+        return None
+
+    try:
+        naive = default_dt.replace(
+            hour=int(hour),
+            minute=int(minute),
+            second=int(second) if second else default_dt.second,
+        )
+        if year:
+            naive = naive.replace(year=int(year), month=int(month), day=int(day))
+    except ValueError:
+        # Let `dateutil.parser` raise the error
+        return None
+
+    aware = naive.replace(tzinfo=_get_named_timezone(tzname))
+    # Choose the ambiguous time by the timezone name, e.g. 'EDT' or 'EST'
+    if aware.tzname() != tzname and (folded := enfold(aware, fold=1)).tzname() == tzname:
+        return folded
+    return aware
+
+
+def _get_tzinfo(tzname: str | None, tzoffset: int | None) -> tzinfo | int:
+    """Identify the timezone, as `tzinfos` of `dateutil.parser`"""
+    if tzoffset:
+        return tzoffset
+    return _get_named_timezone(tzname)
+
+
+@lru_cache(maxsize=None)
+def _get_named_timezone(tzname: str | None) -> tzinfo:
+    """
+    Identify the timezone by its name or alias, or fall back to the default one. Without a name,
+    it is the local timezone.
+    """
+    iana_tz = gettz(tzname)
+    if iana_tz:
+        return iana_tz
+
+    # Aliases
+    if tzname in _TIMEZONE_ALIASES:
+        return _get_timezone(_TIMEZONE_ALIASES[tzname])
+
+    return _get_timezone(DEFAULT_TIMEZONE_NAME)
+
+
+@lru_cache(maxsize=None)
+def _get_timezone(timezone_name: str) -> tzinfo:
+    if not (timezone := gettz(timezone_name)):
+        raise ValueError(f'Unknown timezone: {timezone_name}')
+    return timezone
+
+
+@lru_cache(maxsize=None)
+def _get_timezones(guild_id: int | None) -> list[tzinfo]:
+    """Get the timezones to show in the guild."""
+    timezone_names = _load_guild_timezone_names().get(guild_id, TIMEZONE_NAMES)
+    return [_get_timezone(timezone_name) for timezone_name in timezone_names]
+
+
+@lru_cache(maxsize=None)
+def _load_guild_timezone_names() -> dict[int | None, list[str]]:
+    if not os.path.exists(GUILD_TIMEZONES_PATH):
+        return {}
+
+    with open(GUILD_TIMEZONES_PATH, encoding='utf-8') as guild_timezones_file:
+        guild_timezone_names: dict[int | None, list[str]] = {
+            int(guild_id): timezone_names
+            for guild_id, timezone_names in json.load(guild_timezones_file).items()
+        }
+    _logger.info(f'Loaded the timezones of {len(guild_timezone_names)} guild(s)')
+    return guild_timezone_names
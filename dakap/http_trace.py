@@ -0,0 +1,42 @@
+"""Observe the responses of the HTTP requests to the Discord API"""
+
+from typing import Callable
+
+import aiohttp
+import yarl
+
+ResponseListener = Callable[[str, yarl.URL, int], None]
+"""Called with the method, the URL and the status of each response"""
+
+_listeners: list[ResponseListener] = []
+
+
+def create_trace_config() -> aiohttp.TraceConfig:
+    """Create the trace config to be passed as `http_trace` to `discord.Client`."""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_end.append(_on_request_end)
+    return trace_config
+
+
+def add_response_listener(listener: ResponseListener) -> None:
+    """Start calling the listener for each response."""
+    _listeners.append(listener)
+
+
+def remove_response_listener(listener: ResponseListener) -> None:
+    """Stop calling the listener."""
+    _listeners.remove(listener)
+
+
+def notify_response(method: str, url: yarl.URL, status: int) -> None:
+    """Call the listeners with the response."""
+    for listener in list(_listeners):
+        listener(method, url, status)
+
+
+async def _on_request_end(
+    _session: aiohttp.ClientSession,
+    _trace_config_ctx,
+    params: aiohttp.TraceRequestEndParams,
+) -> None:
+    notify_response(params.method, params.url, params.response.status)
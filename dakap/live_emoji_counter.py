@@ -0,0 +1,260 @@
+"""Count the emojis from the gateway events as they happen"""
+
+import logging
+from collections import Counter as counter
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Counter
+
+import discord
+
+from .common import is_msg_from_me
+from .emoji_index import (
+    RETENTION_DAYS,
+    EmojiIndex,
+    current_day,
+    get_emoji_index,
+    snowflake_day,
+)
+from .emoji_matcher import EmojiMatcher
+from .memory import DEFAULT_MAX_LIVE_REACTIONS, get_memory_config
+
+LIVE_FLUSH_INTERVAL = 5 * 60
+"""Seconds between persisting the live counts into the index"""
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class _ChannelCounts:
+    """Counts of a channel not added to the index yet"""
+
+    def __init__(self, guild_id: int, shard_id: int):
+        self.guild_id = guild_id
+        self.shard_id = shard_id
+        self.message_counts: Counter[int] = counter()
+        self.emoji_counts: Counter[tuple[int, int]] = counter()
+        self.last_message_id: int | None = None
+
+
+class LiveEmojiCounter:
+    """
+    Count the emojis of the messages and the reactions received since the gateway session of
+    their shard started, which is marked by `session_start_ids`.
+
+    The counts of a channel are added to the index only after the history before the session has
+    been scanned up to the start of the session, so that the messages in the gap (e.g. the
+    downtime, or the reconnection of the shard) are neither missed nor counted twice.
+
+    At most `max_reactions` reactions are remembered. Beyond that, the reactions of the oldest
+    messages are forgotten and no longer counted, like those of the scanned messages.
+    """
+
+    def __init__(self, max_reactions: int = DEFAULT_MAX_LIVE_REACTIONS):
+        self.session_start_ids: dict[int, int] = {}
+        """The ID (a snowflake of the time) where the session of each shard started"""
+        self.max_reactions = max_reactions
+        self._pending: dict[int, _ChannelCounts] = {}
+        self._reactions: dict[tuple[int, int], int] = {}
+        """Number of the reactions of each `(message_id, emoji_id)` of the live messages"""
+        self._forgotten_message_id = 0
+        """The reactions of the messages up to it have been forgotten"""
+        self._my_message_ids: set[int] = set()
+        self._matchers: dict[int, EmojiMatcher] = {}
+
+    async def start_session(self, shard_id: int) -> None:
+        """
+        Start counting the guilds of the shard from now, e.g. after it has identified again. The
+        counts of the shard which cannot be added to the index are dropped, since those messages
+        will be scanned from the history again.
+        """
+        await self.flush()
+        if dropped_channel_ids := [
+            channel_id
+            for channel_id, channel_counts in self._pending.items()
+            if channel_counts.shard_id == shard_id
+        ]:
+            _logger.info(
+                f'Drop the live counts of {len(dropped_channel_ids)} channel(s) with a gap '
+                f'in the shard {shard_id}'
+            )
+            for channel_id in dropped_channel_ids:
+                del self._pending[channel_id]
+        # The reactions of the previous session are left to the retention, since its messages are
+        # no longer live
+        self.session_start_ids[shard_id] = discord.utils.time_snowflake(
+            datetime.now(tz=timezone.utc)
+        )
+
+    def get_session_start_id(self, guild: discord.Guild) -> int | None:
+        """Get where the session of the shard of the guild started, or `None` if not yet."""
+        return self.session_start_ids.get(guild.shard_id)
+
+    def invalidate_emojis(self, guild_id: int) -> None:
+        """Forget the emojis of the guild after they have been changed."""
+        self._matchers.pop(guild_id, None)
+
+    def on_message(self, client: discord.Client, message: discord.Message) -> None:
+        """Count a new message."""
+        if not message.guild or not self._is_live(message.guild, message.id):
+            return
+        if is_msg_from_me(client, message):
+            self._my_message_ids.add(message.id)
+            return
+
+        day = snowflake_day(message.id)
+        channel_counts = self._get_channel_counts(message.guild, message.channel.id)
+        channel_counts.message_counts[day] += 1
+        for emoji in self._get_matcher(message.guild).find_in_content(message.content):
+            channel_counts.emoji_counts[day, emoji.id] += 1
+        channel_counts.last_message_id = message.id
+
+    async def on_message_delete(self, client: discord.Client, message: discord.Message) -> None:
+        """Uncount a deleted message if it has been counted."""
+        if (
+            not message.guild
+            or self.get_session_start_id(message.guild) is None
+            or is_msg_from_me(client, message)
+        ):
+            return
+        is_live = self._is_live(message.guild, message.id)
+        if not is_live:
+            emoji_index = get_emoji_index()
+            checkpoint = await emoji_index.run(emoji_index.get_checkpoint, message.channel.id)
+            if checkpoint is None or message.id > checkpoint:
+                # Not scanned yet
+                return
+
+        day = snowflake_day(message.id)
+        channel_counts = self._get_channel_counts(message.guild, message.channel.id)
+        channel_counts.message_counts[day] -= 1
+
+        matcher = self._get_matcher(message.guild)
+        emoji_counter = counter(matcher.find_in_content(message.content))
+        if is_live:
+            # Only the reactions counted live
+            for emoji in message.guild.emojis:
+                if self._reactions.pop((message.id, emoji.id), 0):
+                    emoji_counter[emoji] += 1
+        else:
+            emoji_counter.update(matcher.find_in_reactions(message.reactions))
+        for emoji, count in emoji_counter.items():
+            channel_counts.emoji_counts[day, emoji.id] -= count
+
+    def on_raw_reaction_add(
+        self,
+        guild: discord.Guild,
+        payload: discord.RawReactionActionEvent,
+    ) -> None:
+        """Count the emoji if it is the first reaction of it on a live message."""
+        if (
+            not self._is_live(guild, payload.message_id)
+            or payload.message_id <= self._forgotten_message_id
+            or payload.message_id in self._my_message_ids
+        ):
+            return
+        if not (emoji := self._get_matcher(guild).find(str(payload.emoji))):
+            return
+
+        key = (payload.message_id, emoji.id)
+        self._reactions[key] = self._reactions.get(key, 0) + 1
+        if self._reactions[key] == 1:
+            channel_counts = self._get_channel_counts(guild, payload.channel_id)
+            channel_counts.emoji_counts[snowflake_day(payload.message_id), emoji.id] += 1
+            if len(self._reactions) > self.max_reactions:
+                self._forget_oldest_reactions()
+
+    def on_raw_reaction_remove(
+        self,
+        guild: discord.Guild,
+        payload: discord.RawReactionActionEvent,
+    ) -> None:
+        """Uncount the emoji if it was the last reaction of it on a live message."""
+        if not self._is_live(guild, payload.message_id):
+            return
+        if not (emoji := self._get_matcher(guild).find(str(payload.emoji))):
+            return
+
+        key = (payload.message_id, emoji.id)
+        if not (reaction_count := self._reactions.get(key)):
+            return
+        if reaction_count > 1:
+            self._reactions[key] = reaction_count - 1
+            return
+        del self._reactions[key]
+        channel_counts = self._get_channel_counts(guild, payload.channel_id)
+        channel_counts.emoji_counts[snowflake_day(payload.message_id), emoji.id] -= 1
+
+    async def flush(self) -> None:
+        """Add the counts to the index for the channels without a gap before the session."""
+        if not self.session_start_ids:
+            return
+
+        emoji_index = get_emoji_index()
+        checkpoints = await emoji_index.run(emoji_index.get_checkpoints, list(self._pending))
+        # Taken out before adding them, since the events may go on counting meanwhile
+        flushed = {
+            channel_id: self._pending.pop(channel_id)
+            for channel_id, checkpoint in checkpoints.items()
+            if channel_id in self._pending
+            and checkpoint >= self.session_start_ids[self._pending[channel_id].shard_id]
+        }
+        if flushed:
+            await emoji_index.run(_add_counts, emoji_index, flushed)
+            _logger.debug(f'Flushed the live counts of {len(flushed)} channel(s)')
+
+        # Forget the reactions of the messages out of the retention
+        oldest_day = current_day() - RETENTION_DAYS
+        for key in [key for key in self._reactions if snowflake_day(key[0]) < oldest_day]:
+            del self._reactions[key]
+        self._my_message_ids = {
+            message_id
+            for message_id in self._my_message_ids
+            if snowflake_day(message_id) >= oldest_day
+        }
+
+    def _forget_oldest_reactions(self) -> None:
+        """Forget the reactions of the oldest quarter of the messages with reactions."""
+        message_ids = sorted({message_id for message_id, _ in self._reactions})
+        self._forgotten_message_id = message_ids[len(message_ids) // 4]
+        self._reactions = {
+            key: reaction_count
+            for key, reaction_count in self._reactions.items()
+            if key[0] > self._forgotten_message_id
+        }
+        _logger.debug(f'Forgot the reactions of the messages up to {self._forgotten_message_id}')
+
+    def _is_live(self, guild: discord.Guild, message_id: int) -> bool:
+        session_start_id = self.get_session_start_id(guild)
+        return session_start_id is not None and message_id > session_start_id
+
+    def _get_channel_counts(self, guild: discord.Guild, channel_id: int) -> _ChannelCounts:
+        try:
+            return self._pending[channel_id]
+        except KeyError:
+            return self._pending.setdefault(
+                channel_id,
+                _ChannelCounts(guild_id=guild.id, shard_id=guild.shard_id),
+            )
+
+    def _get_matcher(self, guild: discord.Guild) -> EmojiMatcher:
+        try:
+            return self._matchers[guild.id]
+        except KeyError:
+            return self._matchers.setdefault(guild.id, EmojiMatcher(guild.emojis))
+
+
+def _add_counts(emoji_index: EmojiIndex, flushed: dict[int, _ChannelCounts]) -> None:
+    for channel_id, channel_counts in flushed.items():
+        emoji_index.add_counts(
+            guild_id=channel_counts.guild_id,
+            channel_id=channel_id,
+            message_counts=channel_counts.message_counts,
+            emoji_counts=channel_counts.emoji_counts,
+            checkpoint=channel_counts.last_message_id,
+        )
+
+
+@lru_cache(maxsize=None)
+def get_live_emoji_counter() -> LiveEmojiCounter:
+    """Get the counter shared by the client and the commands."""
+    return LiveEmojiCounter(max_reactions=get_memory_config().max_live_reactions)
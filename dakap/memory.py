@@ -0,0 +1,117 @@
+"""Bound the memory used by the caches, and report it"""
+
+import os
+import resource
+import tracemalloc
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+import discord
+
+LOW_MEMORY_ENV = 'DAKAP_LOW_MEMORY'
+"""Set to 1 to run with small caches and scan the history without building `discord.Message`s"""
+MAX_MESSAGES_ENV = 'DAKAP_MAX_MESSAGES'
+"""The size of the message cache of discord.py, or 0 to disable it"""
+DEFAULT_MAX_MESSAGES = 1000
+"""The default of discord.py"""
+LOW_MEMORY_MAX_MESSAGES = 100
+MAX_LIVE_REACTIONS_ENV = 'DAKAP_MAX_LIVE_REACTIONS'
+"""The number of the `(message, emoji)` reactions of the live messages to remember"""
+DEFAULT_MAX_LIVE_REACTIONS = 50_000
+LOW_MEMORY_MAX_LIVE_REACTIONS = 5_000
+MAX_EMOJI_CUBES_ENV = 'DAKAP_MAX_EMOJI_CUBES'
+"""The number of the guilds whose emoji cubes are kept in memory"""
+DEFAULT_MAX_EMOJI_CUBES = 16
+LOW_MEMORY_MAX_EMOJI_CUBES = 2
+
+
+class MemoryConfig(NamedTuple):
+    low_memory: bool = False
+    max_messages: int | None = DEFAULT_MAX_MESSAGES
+    """None to disable the message cache"""
+    max_live_reactions: int = DEFAULT_MAX_LIVE_REACTIONS
+    max_emoji_cubes: int = DEFAULT_MAX_EMOJI_CUBES
+
+    @classmethod
+    def from_env(cls) -> 'MemoryConfig':
+        """Read the config from the `DAKAP_*` environment variables."""
+        low_memory = os.environ.get(LOW_MEMORY_ENV, '') not in ('', '0')
+        max_messages = int(
+            os.environ.get(
+                MAX_MESSAGES_ENV,
+                LOW_MEMORY_MAX_MESSAGES if low_memory else DEFAULT_MAX_MESSAGES,
+            )
+        )
+        max_live_reactions = int(
+            os.environ.get(
+                MAX_LIVE_REACTIONS_ENV,
+                LOW_MEMORY_MAX_LIVE_REACTIONS if low_memory else DEFAULT_MAX_LIVE_REACTIONS,
+            )
+        )
+        max_emoji_cubes = int(
+            os.environ.get(
+                MAX_EMOJI_CUBES_ENV,
+                LOW_MEMORY_MAX_EMOJI_CUBES if low_memory else DEFAULT_MAX_EMOJI_CUBES,
+            )
+        )
+        return cls(
+            low_memory=low_memory,
+            max_messages=max_messages or None,
+            max_live_reactions=max_live_reactions,
+            max_emoji_cubes=max_emoji_cubes,
+        )
+
+    def get_client_options(self) -> dict[str, Any]:
+        """The options of `discord.Client` for the caches."""
+        options: dict[str, Any] = {'max_messages': self.max_messages}
+        if self.low_memory:
+            # Only the members seen in the events are needed, and they are not kept
+            options['member_cache_flags'] = discord.MemberCacheFlags.none()
+            options['chunk_guilds_at_startup'] = False
+        return options
+
+
+@lru_cache(maxsize=None)
+def get_memory_config() -> MemoryConfig:
+    """Get the config of this process."""
+    return MemoryConfig.from_env()
+
+
+class MemoryUsage(NamedTuple):
+    max_rss_bytes: int
+    traced_bytes: int | None
+    """None if `tracemalloc` is off"""
+    traced_peak_bytes: int | None
+
+
+def get_memory_usage() -> MemoryUsage:
+    """Get the peak RSS, and the current and the peak memory traced by `tracemalloc` if it is on."""
+    # In KiB on Linux
+    max_rss_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if not tracemalloc.is_tracing():
+        return MemoryUsage(max_rss_bytes, None, None)
+    return MemoryUsage(max_rss_bytes, *tracemalloc.get_traced_memory())
+
+
+def get_memory_report(top: int = 5) -> list[str]:
+    """
+    Report the memory usage, with the top allocation sites if `tracemalloc` is on (e.g. with
+    `PYTHONTRACEMALLOC=1`).
+    """
+    usage = get_memory_usage()
+    lines = [f'Max RSS: {usage.max_rss_bytes / 2**20:.1f} MiB']
+    if usage.traced_bytes is None or usage.traced_peak_bytes is None:
+        lines.append('tracemalloc: off')
+        return lines
+
+    lines.append(
+        f'tracemalloc: {usage.traced_bytes / 2**20:.1f} MiB now, '
+        f'{usage.traced_peak_bytes / 2**20:.1f} MiB at peak'
+    )
+    for statistic in tracemalloc.take_snapshot().statistics('lineno')[:top]:
+        frame = statistic.traceback[0]
+        lines.append(
+            f'  {frame.filename}:{frame.lineno}: {statistic.size / 2**10:.1f} KiB '
+            f'in {statistic.count} block(s)'
+        )
+    return lines
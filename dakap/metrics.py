@@ -0,0 +1,327 @@
+"""Collect the metrics of the commands, the Discord API and the caches"""
+
+import bisect
+import logging
+import re
+import time
+from collections import Counter as counter
+from collections.abc import Sequence
+from functools import lru_cache
+from typing import Counter, Protocol
+
+import discord
+import yarl
+from aiohttp import web
+
+from .http_trace import add_response_listener
+from .memory import get_memory_report, get_memory_usage
+
+METRICS_PORT_ENV = 'DAKAP_METRICS_PORT'
+"""The environment variable of the local port to serve the metrics on, which is off if not set"""
+METRICS_HOST = '127.0.0.1'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""The upper bounds (in seconds) of the latency histograms, plus infinity"""
+
+_TOKEN_PATTERN = re.compile(r'/(interactions|webhooks)/\d+/[^/]+')
+"""The tokens of the interactions and the webhooks follow their IDs, e.g. in `.../callback`"""
+_ID_PATTERN = re.compile(r'/\d+')
+_REACTION_PATTERN = re.compile(r'/reactions/[^/]+')
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class CacheStats(Protocol):
+    hits: int
+    misses: int
+
+
+class QueueStats(Protocol):
+    depth: int
+    running: int
+    shed_count: int
+
+
+class Histogram:
+    """Counts of the observed values in the buckets, as a Prometheus histogram"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        """Non-cumulative, and the last one is for infinity"""
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, quantile: float) -> float:
+        """Estimate the quantile with the upper bound of the bucket it falls in."""
+        rank = quantile * self.count
+        cumulative_count = 0
+        for upper_bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            cumulative_count += bucket_count
+            if cumulative_count >= rank:
+                return upper_bound
+        return float('inf')
+
+
+class Metrics:
+    """The metrics of this process"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.command_latencies: dict[str, Histogram] = {}
+        self.command_errors: Counter[str] = counter()
+        self.command_waits: dict[str, Histogram] = {}
+        """Seconds from queued to started"""
+        self.api_responses: Counter[tuple[str, str, int]] = counter()
+        """Keyed by the method, the route and the status"""
+        self.scanned_messages = 0
+        self.scan_seconds = 0.0
+        self.last_scan_rate = 0.0
+        """Messages scanned per second in the last scan"""
+        self.caches: dict[str, CacheStats] = {}
+        self.queues: dict[str, QueueStats] = {}
+
+    def observe_command(self, command_name: str, seconds: float, failed: bool = False) -> None:
+        """Record the latency of a command."""
+        try:
+            histogram = self.command_latencies[command_name]
+        except KeyError:
+            histogram = self.command_latencies.setdefault(command_name, Histogram())
+        histogram.observe(seconds)
+        if failed:
+            self.command_errors[command_name] += 1
+
+    def observe_command_wait(self, command_name: str, seconds: float) -> None:
+        """Record the time a command waited in the queue."""
+        try:
+            histogram = self.command_waits[command_name]
+        except KeyError:
+            histogram = self.command_waits.setdefault(command_name, Histogram())
+        histogram.observe(seconds)
+
+    def on_response(self, method: str, url: yarl.URL, status: int) -> None:
+        """Count a response of the Discord API, as a listener of `http_trace`."""
+        self.api_responses[method, _get_route(url), status] += 1
+
+    def record_scan(self, message_count: int, seconds: float) -> None:
+        """Record the messages scanned in a scan of the history."""
+        self.scanned_messages += message_count
+        self.scan_seconds += seconds
+        if seconds:
+            self.last_scan_rate = message_count / seconds
+
+    def register_cache(self, name: str, cache: CacheStats) -> None:
+        """Report the hits and the misses of the cache."""
+        self.caches[name] = cache
+
+    def register_queue(self, name: str, queue: QueueStats) -> None:
+        """Report the depth, the running and the shed items of the queue."""
+        self.queues[name] = queue
+
+    @property
+    def api_request_count(self) -> int:
+        return sum(self.api_responses.values())
+
+    @property
+    def rate_limited_count(self) -> int:
+        return sum(count for (_, _, status), count in self.api_responses.items() if status == 429)
+
+    def render_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text format."""
+        lines = [
+            '# HELP dakap_uptime_seconds Seconds since the process started.',
+            '# TYPE dakap_uptime_seconds gauge',
+            f'dakap_uptime_seconds {time.time() - self.started_at}',
+            '# HELP dakap_command_duration_seconds Latency of the commands.',
+            '# TYPE dakap_command_duration_seconds histogram',
+            *_render_histograms('dakap_command_duration_seconds', self.command_latencies),
+            '# HELP dakap_command_wait_seconds Time the commands waited in the queue.',
+            '# TYPE dakap_command_wait_seconds histogram',
+            *_render_histograms('dakap_command_wait_seconds', self.command_waits),
+        ]
+
+        lines += [
+            '# HELP dakap_command_errors_total Commands which raised an exception.',
+            '# TYPE dakap_command_errors_total counter',
+            *(
+                f'dakap_command_errors_total{{command="{_escape(command_name)}"}} {count}'
+                for command_name, count in sorted(self.command_errors.items())
+            ),
+            '# HELP dakap_discord_api_responses_total Responses of the Discord API.',
+            '# TYPE dakap_discord_api_responses_total counter',
+            *(
+                f'dakap_discord_api_responses_total{{method="{method}",route="{_escape(route)}",'
+                f'status="{status}"}} {count}'
+                for (method, route, status), count in sorted(self.api_responses.items())
+            ),
+            '# HELP dakap_discord_api_rate_limited_total Responses of the Discord API with 429.',
+            '# TYPE dakap_discord_api_rate_limited_total counter',
+            f'dakap_discord_api_rate_limited_total {self.rate_limited_count}',
+            '# HELP dakap_scanned_messages_total Messages scanned from the history.',
+            '# TYPE dakap_scanned_messages_total counter',
+            f'dakap_scanned_messages_total {self.scanned_messages}',
+            '# HELP dakap_scan_seconds_total Seconds spent in scanning the history.',
+            '# TYPE dakap_scan_seconds_total counter',
+            f'dakap_scan_seconds_total {self.scan_seconds}',
+            '# HELP dakap_last_scan_messages_per_second Messages scanned per second last time.',
+            '# TYPE dakap_last_scan_messages_per_second gauge',
+            f'dakap_last_scan_messages_per_second {self.last_scan_rate}',
+        ]
+
+        for attr_name in ('hits', 'misses'):
+            lines += [
+                f'# HELP dakap_cache_{attr_name}_total Cache {attr_name}.',
+                f'# TYPE dakap_cache_{attr_name}_total counter',
+                *(
+                    f'dakap_cache_{attr_name}_total{{cache="{_escape(cache_name)}"}} '
+                    f'{getattr(cache, attr_name)}'
+                    for cache_name, cache in sorted(self.caches.items())
+                ),
+            ]
+
+        for attr_name, metric_name, metric_type, help_text in (
+            ('depth', 'queue_depth', 'gauge', 'Items waiting in the queue.'),
+            ('running', 'queue_running', 'gauge', 'Items of the queue running.'),
+            ('shed_count', 'queue_shed_total', 'counter', 'Items shed as the queue was full.'),
+        ):
+            lines += [
+                f'# HELP dakap_{metric_name} {help_text}',
+                f'# TYPE dakap_{metric_name} {metric_type}',
+                *(
+                    f'dakap_{metric_name}{{queue="{_escape(queue_name)}"}} '
+                    f'{getattr(queue, attr_name)}'
+                    for queue_name, queue in sorted(self.queues.items())
+                ),
+            ]
+
+        memory_usage = get_memory_usage()
+        lines += [
+            '# HELP dakap_max_rss_bytes Peak resident set size.',
+            '# TYPE dakap_max_rss_bytes gauge',
+            f'dakap_max_rss_bytes {memory_usage.max_rss_bytes}',
+        ]
+        if memory_usage.traced_bytes is not None:
+            lines += [
+                '# HELP dakap_traced_memory_bytes Memory allocated by Python, by tracemalloc.',
+                '# TYPE dakap_traced_memory_bytes gauge',
+                f'dakap_traced_memory_bytes {memory_usage.traced_bytes}',
+                '# HELP dakap_traced_memory_peak_bytes Peak memory allocated by Python.',
+                '# TYPE dakap_traced_memory_peak_bytes gauge',
+                f'dakap_traced_memory_peak_bytes {memory_usage.traced_peak_bytes}',
+            ]
+
+        return '\n'.join(lines) + '\n'
+
+    def render_summary(self) -> list[str]:
+        """Render the metrics as lines for humans."""
+        uptime = time.time() - self.started_at
+        lines = [
+            f'Uptime: {uptime / 3600:.1f}h',
+            'Commands (count, p50, p95, errors, p95 wait):',
+        ]
+        for command_name, histogram in sorted(self.command_latencies.items()):
+            wait_histogram = self.command_waits.get(command_name)
+            lines.append(
+                f'  {command_name}: {histogram.count}, <={histogram.quantile(0.5)}s, '
+                f'<={histogram.quantile(0.95)}s, {self.command_errors[command_name]}, '
+                f'<={wait_histogram.quantile(0.95) if wait_histogram else 0}s'
+            )
+        lines += [
+            f'Queue {queue_name}: {queue.depth} waiting, {queue.running} running, '
+            f'{queue.shed_count} shed'
+            for queue_name, queue in sorted(self.queues.items())
+        ]
+        lines.append(
+            f'Discord API: {self.api_request_count} request(s), '
+            f'{self.rate_limited_count} rate limited'
+        )
+        route_counts: Counter[str] = counter()
+        for (method, route, _status), count in self.api_responses.items():
+            route_counts[f'{method} {route}'] += count
+        lines += [f'  {route}: {count}' for route, count in route_counts.most_common(5)]
+        lines.append(
+            f'Scanned: {self.scanned_messages} message(s) in {self.scan_seconds:.1f}s, '
+            f'last {self.last_scan_rate:.1f} msg/s'
+        )
+        lines.append('Caches (hit rate):')
+        for cache_name, cache in sorted(self.caches.items()):
+            lookups = cache.hits + cache.misses
+            hit_rate = f'{cache.hits / lookups:.1%}' if lookups else '-'
+            lines.append(f'  {cache_name}: {hit_rate} of {lookups}')
+        lines += ['Memory:', *(f'  {line}' for line in get_memory_report())]
+        return lines
+
+    async def start_server(self, port: int, host: str = METRICS_HOST) -> web.AppRunner:
+        """Serve the metrics at `/metrics` in the Prometheus text format."""
+
+        async def handle_metrics(_request: web.Request) -> web.Response:
+            return web.Response(text=self.render_prometheus(), content_type='text/plain')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        _logger.info(f'Serving the metrics on http://{host}:{port}/metrics')
+        return runner
+
+
+@lru_cache(maxsize=None)
+def get_metrics() -> Metrics:
+    """Get the metrics of this process, which observe the responses of the Discord API."""
+    metrics = Metrics()
+    add_response_listener(metrics.on_response)
+    return metrics
+
+
+async def send_stats(
+    client: discord.Client,
+    message: discord.Message,
+    _arguments: Sequence[str],
+) -> None:
+    """Send the metrics to the owner of the bot."""
+    # Fetched when logging in
+    application_info = client.application or await client.application_info()
+    owner_ids = (
+        {member.id for member in application_info.team.members}
+        if application_info.team
+        else {application_info.owner.id}
+    )
+    if message.author.id not in owner_ids:
+        return
+
+    await message.reply('\n'.join(['```', *get_metrics().render_summary(), '```']))
+
+
+def _get_route(url: yarl.URL) -> str:
+    """
+    The path without the IDs, the tokens and the emojis, e.g. `/api/v10/channels/{id}/messages`
+    and `/api/v10/interactions/{id}/{token}/callback`
+    """
+    path = _TOKEN_PATTERN.sub(r'/\1/{id}/{token}', url.path)
+    return _ID_PATTERN.sub('/{id}', _REACTION_PATTERN.sub('/reactions/{emoji}', path))
+
+
+def _render_histograms(metric_name: str, histograms: dict[str, Histogram]) -> list[str]:
+    """Render the histograms of the commands, without the HELP and the TYPE."""
+    lines = []
+    for command_name, histogram in sorted(histograms.items()):
+        labels = f'command="{_escape(command_name)}"'
+        cumulative_count = 0
+        for upper_bound, bucket_count in zip(
+            [*map(str, histogram.buckets), '+Inf'],
+            histogram.bucket_counts,
+        ):
+            cumulative_count += bucket_count
+            lines.append(f'{metric_name}_bucket{{{labels},le="{upper_bound}"}} {cumulative_count}')
+        lines.append(f'{metric_name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{metric_name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def _escape(label_value: str) -> str:
+    return label_value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
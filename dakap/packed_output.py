@@ -0,0 +1,112 @@
+"""Pack many lines of output into as few Discord messages as possible"""
+
+import csv
+import io
+from typing import Iterable, NamedTuple, Sequence
+
+import discord
+
+MESSAGE_LIMIT = 2000
+"""Characters allowed in the content of a message"""
+EMBED_DESCRIPTION_LIMIT = 4096
+"""Characters allowed in the description of an embed"""
+EMBEDS_TOTAL_LIMIT = 6000
+"""Characters allowed in all the embeds of a message"""
+MAX_EMBEDS = 10
+"""Embeds allowed in a message"""
+
+
+class PackedMessage(NamedTuple):
+    content: str
+    embeds: list[discord.Embed]
+    overflow_lines: list[str]
+    """The lines which do not fit in the message"""
+
+
+def pack_lines(lines: Iterable[str], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Join the lines into as few chunks of at most `limit` characters as possible, in order.
+    A line longer than the limit is split.
+    """
+    lines = _split_long_lines(lines, limit)
+    chunks = []
+    while lines:
+        line_count = _count_fitting_lines(lines, limit)
+        chunks.append('\n'.join(lines[:line_count]))
+        lines = lines[line_count:]
+    return chunks
+
+
+def pack_message(lines: Iterable[str]) -> PackedMessage:
+    """
+    Pack the lines into the content and then the embeds of one message, in order.
+    The lines which do not fit are returned as `overflow_lines`.
+    """
+    lines = _split_long_lines(lines, MESSAGE_LIMIT)
+    line_count = _count_fitting_lines(lines, MESSAGE_LIMIT)
+    content = '\n'.join(lines[:line_count])
+    lines = lines[line_count:]
+
+    embeds: list[discord.Embed] = []
+    embeds_len = 0
+    while lines and len(embeds) < MAX_EMBEDS:
+        limit = min(EMBED_DESCRIPTION_LIMIT, EMBEDS_TOTAL_LIMIT - embeds_len)
+        if not (line_count := _count_fitting_lines(lines, limit)):
+            break
+        description = '\n'.join(lines[:line_count])
+        embeds.append(discord.Embed(description=description))
+        embeds_len += len(description)
+        lines = lines[line_count:]
+
+    return PackedMessage(content=content, embeds=embeds, overflow_lines=lines)
+
+
+def make_csv_file(filename: str, header: Sequence[str], rows: Iterable[Sequence]) -> discord.File:
+    """Make a CSV attachment of the rows."""
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return discord.File(io.BytesIO(text.getvalue().encode('utf-8')), filename=filename)
+
+
+async def send_packed(
+    channel: discord.abc.Messageable,
+    lines: Sequence[str],
+    overflow_file: discord.File | None = None,
+) -> None:
+    """
+    Send the lines with one message if they fit in its content and embeds. Otherwise, attach
+    `overflow_file` (e.g. the whole table as CSV) to that message, or send the rest of the lines
+    with as few messages as possible if there is no such file.
+    """
+    content, embeds, overflow_lines = pack_message(lines)
+    if not content:
+        return
+
+    if overflow_lines and overflow_file:
+        await channel.send(content, embeds=embeds, file=overflow_file)
+        return
+
+    await channel.send(content, embeds=embeds)
+    # In order, while `discord.py` waits for the rate limit of the channel if needed
+    for chunk in pack_lines(overflow_lines):
+        await channel.send(chunk)
+
+
+def _split_long_lines(lines: Iterable[str], limit: int) -> list[str]:
+    return [
+        line[start:start + limit]
+        for line in lines
+        for start in range(0, max(len(line), 1), limit)
+    ]
+
+
+def _count_fitting_lines(lines: Sequence[str], limit: int) -> int:
+    """Count the leading lines which fit in the limit when joined with newlines."""
+    total_len = -1
+    for line_count, line in enumerate(lines):
+        total_len += len(line) + 1
+        if total_len > limit:
+            return line_count
+    return len(lines)
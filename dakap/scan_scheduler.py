@@ -0,0 +1,124 @@
+"""Schedule the history scans of the channels under the rate limits of the Discord API"""
+
+import asyncio
+import logging
+import time
+from operator import attrgetter
+from typing import Awaitable, Callable, Iterable, NamedTuple
+
+import yarl
+
+from .http_trace import add_response_listener, remove_response_listener
+from .metrics import get_metrics
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class ScanJob(NamedTuple):
+    channel_name: str
+    expected_size: int
+    """Used to scan the larger channels first, e.g. the number of messages since the checkpoint"""
+    scan: Callable[[], Awaitable[int]]
+    """Scan the channel and return the number of the fetched messages"""
+
+
+class ScanStats(NamedTuple):
+    channel_name: str
+    message_count: int
+    elapsed: float
+    """In seconds"""
+
+    @property
+    def throughput(self) -> float:
+        """Fetched messages per second"""
+        return self.message_count / self.elapsed if self.elapsed else 0.0
+
+
+class ScanScheduler:
+    """
+    Run the scans with a bounded number of them at a time, starting from the largest ones.
+
+    The limit is halved each time the history requests are rate limited (429), and grows back by
+    one each time a scan finishes without being rate limited, up to `max_concurrency`.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1):
+        if not 1 <= min_concurrency <= max_concurrency:
+            raise ValueError('Invalid concurrency')
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max_concurrency
+        self.rate_limited_count = 0
+
+        self._running = 0
+        self._condition = asyncio.Condition()
+
+    async def run(
+        self,
+        jobs: Iterable[ScanJob],
+        on_done: Callable[[ScanStats], None] | None = None,
+    ) -> list[ScanStats]:
+        """
+        Run the jobs and return their stats, ordered by the expected sizes.
+        `on_done`: Called with the stats of each job as soon as it is done.
+        """
+        add_response_listener(self._on_response)
+        start_time = time.perf_counter()
+        try:
+            all_stats = await asyncio.gather(*(
+                self._run_job(job, on_done)
+                for job in sorted(jobs, key=attrgetter('expected_size'), reverse=True)
+            ))
+        finally:
+            remove_response_listener(self._on_response)
+
+        if all_stats:
+            get_metrics().record_scan(
+                message_count=sum(stats.message_count for stats in all_stats),
+                seconds=time.perf_counter() - start_time,
+            )
+        return all_stats
+
+    async def _run_job(
+        self,
+        job: ScanJob,
+        on_done: Callable[[ScanStats], None] | None,
+    ) -> ScanStats:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._running < self.concurrency)
+            self._running += 1
+
+        rate_limited_count = self.rate_limited_count
+        start_time = time.perf_counter()
+        try:
+            message_count = await job.scan()
+        finally:
+            async with self._condition:
+                self._running -= 1
+                if (
+                    self.rate_limited_count == rate_limited_count
+                    and self.concurrency < self.max_concurrency
+                ):
+                    self.concurrency += 1
+                self._condition.notify_all()
+
+        stats = ScanStats(
+            channel_name=job.channel_name,
+            message_count=message_count,
+            elapsed=time.perf_counter() - start_time,
+        )
+        _logger.debug(
+            f'Fetched {stats.message_count} message(s) from #{stats.channel_name} '
+            f'in {stats.elapsed:.2f}s ({stats.throughput:.1f} msg/s)'
+        )
+        if on_done:
+            on_done(stats)
+        return stats
+
+    def _on_response(self, method: str, url: yarl.URL, status: int) -> None:
+        if status != 429 or method != 'GET' or not url.path.endswith('/messages'):
+            return
+        self.rate_limited_count += 1
+        if self.concurrency > self.min_concurrency:
+            self.concurrency = max(self.concurrency // 2, self.min_concurrency)
+            _logger.info(f'Rate limited, scanning {self.concurrency} channel(s) at a time')
@@ -0,0 +1,165 @@
+"""Run the shards in worker processes under a supervisor which restarts them"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections.abc import Callable, Sequence
+from multiprocessing.connection import wait
+from multiprocessing.process import BaseProcess
+from typing import cast
+
+import discord
+import yarl
+from discord.gateway import DiscordWebSocket
+from discord.http import Route
+
+SHARD_COUNT_ENV = 'DAKAP_SHARD_COUNT'
+"""The total number of the shards, which is recommended by Discord if not set"""
+SHARD_PROCESSES_ENV = 'DAKAP_SHARD_PROCESSES'
+"""The number of the worker processes to split the shards into, or 1 (no workers) if not set"""
+DISCORD_API_ENV = 'DAKAP_DISCORD_API'
+"""The base URL of the Discord API instead of Discord's, e.g. of a local fake"""
+DISCORD_GATEWAY_ENV = 'DAKAP_DISCORD_GATEWAY'
+"""The URL of the gateway instead of Discord's, e.g. of a local fake"""
+RESTART_DELAY = 1.0
+"""Seconds to wait before restarting a worker, doubled each time it exits again soon"""
+MAX_RESTART_DELAY = 60.0
+STABLE_SECONDS = 60.0
+"""A worker running longer than this is restarted without the backoff"""
+
+ShardRunner = Callable[[Sequence[int], int], None]
+"""Run the bot on the shard IDs of the total shard count until it is closed"""
+
+_POLL_INTERVAL = 0.5
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class ShardWorker:
+    """A worker process running a group of the shards"""
+
+    def __init__(self, shard_ids: Sequence[int]):
+        self.shard_ids = list(shard_ids)
+        self.process: BaseProcess | None = None
+        self.started_at = 0.0
+        self.restart_count = 0
+        self.restart_delay = RESTART_DELAY
+        self.restart_at: float | None = None
+        """When to restart it after it exits, or None if it is running"""
+
+
+class Supervisor:
+    """
+    Split the shards into the worker processes, start them, and restart each one which exits,
+    with an exponential backoff if it keeps exiting.
+    """
+
+    def __init__(self, runner: ShardRunner, shard_count: int, process_count: int):
+        """`runner`: A picklable function, which is called in each worker process."""
+        self.runner = runner
+        self.shard_count = shard_count
+        self.workers = [
+            ShardWorker(shard_ids)
+            for shard_ids in split_shards(shard_count, process_count)
+        ]
+        self._context = multiprocessing.get_context('spawn')
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        """Start the workers, and keep them running until stopped."""
+        _logger.info(
+            f'Running {self.shard_count} shard(s) in {len(self.workers)} worker process(es)'
+        )
+        for worker in self.workers:
+            self._start(worker)
+        try:
+            while not self._stopping.is_set():
+                self._monitor()
+        finally:
+            self._stop_workers()
+
+    def stop(self) -> None:
+        """Stop the workers and return from `run()`, e.g. in a signal handler or another thread."""
+        self._stopping.set()
+
+    def _monitor(self) -> None:
+        running_processes = {
+            worker.process.sentinel: worker
+            for worker in self.workers
+            if worker.process and worker.restart_at is None
+        }
+        for sentinel in wait(list(running_processes), timeout=_POLL_INTERVAL):
+            # The sentinels given are returned
+            worker = running_processes[cast(int, sentinel)]
+            assert worker.process is not None
+            worker.process.join()
+            if time.monotonic() - worker.started_at > STABLE_SECONDS:
+                worker.restart_delay = RESTART_DELAY
+            _logger.warning(
+                f'Worker of shard(s) {worker.shard_ids} exited with {worker.process.exitcode}, '
+                f'restarting in {worker.restart_delay:.1f}s'
+            )
+            worker.restart_at = time.monotonic() + worker.restart_delay
+            worker.restart_delay = min(worker.restart_delay * 2, MAX_RESTART_DELAY)
+
+        for worker in self.workers:
+            if worker.restart_at is not None and worker.restart_at <= time.monotonic():
+                worker.restart_count += 1
+                self._start(worker)
+
+    def _start(self, worker: ShardWorker) -> None:
+        worker.process = self._context.Process(
+            target=self.runner,
+            args=(worker.shard_ids, self.shard_count),
+            name=f'dakap-shards-{worker.shard_ids[0]}-{worker.shard_ids[-1]}',
+            daemon=True,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        _logger.info(f'Started the worker of shard(s) {worker.shard_ids} ({worker.process.pid})')
+
+    def _stop_workers(self) -> None:
+        processes = [worker.process for worker in self.workers if worker.process]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+def split_shards(shard_count: int, process_count: int) -> list[list[int]]:
+    """Split the shard IDs into contiguous groups of similar sizes, one for each process."""
+    process_count = max(1, min(process_count, shard_count))
+    return [
+        list(range(
+            shard_count * index // process_count,
+            shard_count * (index + 1) // process_count,
+        ))
+        for index in range(process_count)
+    ]
+
+
+def use_discord_endpoints() -> None:
+    """Connect to the endpoints in `DISCORD_API_ENV` and `DISCORD_GATEWAY_ENV` if they are set."""
+    if api_url := os.environ.get(DISCORD_API_ENV):
+        Route.BASE = api_url.rstrip('/')
+    if gateway_url := os.environ.get(DISCORD_GATEWAY_ENV):
+        DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(gateway_url)
+
+
+async def get_recommended_shard_count(token: str) -> int:
+    """Get the number of the shards recommended by Discord for the bot."""
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shard_count, _gateway_url = await http.get_bot_gateway()
+    finally:
+        await http.close()
+    return shard_count
@@ -0,0 +1,74 @@
+"""A local on-disk key-value store with expiration, shared by the processes of the shards"""
+
+import json
+import logging
+import time
+from collections.abc import Collection, Mapping
+from functools import lru_cache
+from typing import Any
+
+from .common import get_data_path
+from .database import Database
+
+SHARED_STORE_PATH = get_data_path('shared-store.sqlite3')
+SHARED_STORE_TIMEOUT = 30.0
+"""Seconds to wait for the other processes writing to the store"""
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+'''
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class SharedStore(Database):
+    """
+    JSON values keyed by `(namespace, key)`, which expire after their TTL by the wall clock, so
+    that the processes can reuse what the others have fetched.
+    """
+
+    def __init__(self, path: str = SHARED_STORE_PATH):
+        super().__init__(path, timeout=SHARED_STORE_TIMEOUT, schema=_SCHEMA)
+
+    def get_many(self, namespace: str, keys: Collection[str]) -> dict[str, Any]:
+        """Get the values of the keys which have not expired."""
+        if not keys:
+            return {}
+        rows = self._connection.execute(
+            f'''
+            SELECT key, value FROM entries
+            WHERE namespace = ? AND key IN ({', '.join('?' * len(keys))}) AND expires_at > ?
+            ''',
+            (namespace, *keys, time.time()),
+        )
+        return {key: json.loads(value) for key, value in rows}
+
+    def put_many(self, namespace: str, values: Mapping[str, Any], ttl: float) -> None:
+        """Store the values of the keys for `ttl` seconds, and drop the expired values."""
+        expires_at = time.time() + ttl
+        with self._connection:
+            self._connection.execute('DELETE FROM entries WHERE expires_at <= ?', (time.time(),))
+            self._connection.executemany(
+                '''
+                INSERT INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (namespace, key) DO UPDATE
+                SET value = excluded.value, expires_at = excluded.expires_at
+                ''',
+                (
+                    (namespace, key, json.dumps(value), expires_at)
+                    for key, value in values.items()
+                ),
+            )
+
+
+@lru_cache(maxsize=None)
+def get_shared_store(path: str = SHARED_STORE_PATH) -> SharedStore:
+    """Get the store in the path, and open it for the first time."""
+    _logger.info(f'Open the shared store in {path}')
+    return SharedStore(path)
@@ -0,0 +1,131 @@
+"""Share the results of the same calls among the callers"""
+
+import asyncio
+import time
+from functools import partial
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, Mapping, TypeVar
+
+K = TypeVar('K', bound=Hashable)  # pylint: disable=invalid-name
+V = TypeVar('V')  # pylint: disable=invalid-name
+
+
+class SingleFlightCache(Generic[K, V]):
+    """
+    Reuse the result of a key for `ttl` seconds, and let the concurrent callers of the same key
+    wait for the same in-flight call instead of starting their own.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        """Number of the callers waiting for an in-flight call"""
+
+        self._values: dict[K, tuple[float, V]] = {}
+        """Expiration time (of `time.monotonic()`) and the result of each key"""
+        self._in_flight: dict[K, asyncio.Future[V]] = {}
+
+    async def get(self, key: K, fetch: Callable[[], Awaitable[V]]) -> V:
+        """Get the result of the key, and call `fetch` for it if it is not cached or in flight."""
+        if (entry := self._values.get(key)) and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        if future := self._in_flight.get(key):
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            future = asyncio.ensure_future(fetch())
+            self._in_flight[key] = future
+            future.add_done_callback(partial(self._on_done, key))
+
+        # A cancelled caller (e.g. timed out) should not cancel the others
+        return await asyncio.shield(future)
+
+    def get_many(
+        self,
+        keys: Iterable[K],
+        fetch: Callable[[list[K]], Awaitable[Mapping[K, V]]],
+    ) -> dict[K, asyncio.Future[V]]:
+        """
+        Get the futures of the results of the keys, and call `fetch` once for all the keys which
+        are neither cached nor in flight. The future of a key missing from the fetched results
+        raises `KeyError`.
+        """
+        loop = asyncio.get_running_loop()
+        futures: dict[K, asyncio.Future[V]] = {}
+        missing_futures: dict[K, asyncio.Future[V]] = {}
+
+        for key in keys:
+            if key in futures:
+                continue
+            if (entry := self._values.get(key)) and entry[0] > time.monotonic():
+                self.hits += 1
+                futures[key] = loop.create_future()
+                futures[key].set_result(entry[1])
+            elif future := self._in_flight.get(key):
+                self.coalesced += 1
+                futures[key] = future
+            else:
+                self.misses += 1
+                futures[key] = missing_futures[key] = loop.create_future()
+                self._in_flight[key] = futures[key]
+                futures[key].add_done_callback(partial(self._on_done, key))
+
+        if missing_futures:
+            batch = asyncio.ensure_future(fetch(list(missing_futures)))
+            batch.add_done_callback(partial(_set_batch_results, missing_futures))
+
+        return futures
+
+    def get_cached(self, key: K) -> V | None:
+        """Get the cached result of the key without fetching it, or `None`."""
+        if (entry := self._values.get(key)) and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def put(self, key: K, value: V) -> None:
+        """Cache the result of the key, e.g. which is fetched with other data."""
+        self._store(key, value)
+
+    def invalidate(self, key: K | None = None) -> None:
+        """Drop the cached result of the key, or all of them."""
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
+
+    def _on_done(self, key: K, future: asyncio.Future[V]) -> None:
+        del self._in_flight[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._store(key, future.result())
+
+    def _store(self, key: K, value: V) -> None:
+        now = time.monotonic()
+        if len(self._values) >= self.max_size:
+            self._values = {
+                cached_key: entry
+                for cached_key, entry in self._values.items()
+                if entry[0] > now
+            }
+        if len(self._values) < self.max_size:
+            self._values[key] = (now + self.ttl, value)
+
+
+def _set_batch_results(
+    futures: Mapping[K, asyncio.Future[V]],
+    batch: asyncio.Future[Mapping[K, V]],
+) -> None:
+    for key, future in futures.items():
+        if batch.cancelled():
+            future.cancel()
+        elif (exception := batch.exception()) is not None:
+            future.set_exception(exception)
+        elif key in batch.result():
+            future.set_result(batch.result()[key])
+        else:
+            future.set_exception(KeyError(key))
@@ -1,10 +1,27 @@
 """Get market data from Yahoo! Finance's API"""
 
+import asyncio
 import logging
+import os
+import time
 from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import NamedTuple
+from urllib.parse import urlsplit
 
 import discord
+import numpy as np
+import requests
 import yfinance
+from requests.adapters import HTTPAdapter
+from yfinance.data import YfData
+
+from .metrics import get_metrics
+from .shared_store import get_shared_store
+from .single_flight import SingleFlightCache
+from .stock_history import (HISTORY_DAYS, HISTORY_INTERVAL, PriceHistory,
+                            get_price_history_store, is_valid_symbol, render_sparkline)
 
 _ALIASES = {
     'COVER': '5253.t',
@@ -12,44 +29,287 @@ _ALIASES = {
     'TRENDMICRO': '4704.t',
 }
 
+STOCK_WORKERS_ENV = 'DAKAP_STOCK_WORKERS'
+"""The number of the threads fetching from Yahoo! Finance"""
+DEFAULT_STOCK_WORKERS = 4
+STOCK_WORKERS = int(os.environ.get(STOCK_WORKERS_ENV, DEFAULT_STOCK_WORKERS))
+STOCK_TIMEOUT = 10.0
+"""Seconds to wait for each symbol"""
+STOCK_INFO_TTL = 60 * 60
+"""Seconds to reuse the slow-changing info, i.e. the name, the currency and the previous close"""
+STOCK_PRICE_TTL = 60
+"""Seconds to reuse the last price"""
+STOCK_HISTORY_TTL = 10 * 60
+"""Seconds to reuse the bars, which only changes the last one meanwhile"""
+STOCK_QUOTE_URL = 'https://query2.finance.yahoo.com/v7/finance/quote'
+"""The endpoint to get the quotes of multiple symbols in bulk"""
+STOCK_QUOTE_NAMESPACE = 'stock_quote'
+"""The namespace of the quotes in the shared store"""
+STOCK_CHART_URL = 'https://query2.finance.yahoo.com/v8/finance/chart/{symbol}'
+"""The endpoint to get the bars of a symbol in a period"""
+
 _logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+# `yfinance` is blocking, so it is run in the threads with a shared connection pool
+_executor = ThreadPoolExecutor(max_workers=STOCK_WORKERS, thread_name_prefix='stock')
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_maxsize=STOCK_WORKERS))
+
+
+class StockInfo(NamedTuple):
+    name: str
+    symbol: str
+    currency: str
+    previous_close: float
+
+
+class Quote(NamedTuple):
+    info: StockInfo
+    last_price: float
+
+
+info_cache: SingleFlightCache[str, StockInfo] = SingleFlightCache(ttl=STOCK_INFO_TTL)
+"""Keyed by the resolved symbols"""
+price_cache: SingleFlightCache[str, float] = SingleFlightCache(ttl=STOCK_PRICE_TTL)
+"""Keyed by the resolved symbols"""
+quote_cache: SingleFlightCache[str, Quote] = SingleFlightCache(ttl=STOCK_PRICE_TTL)
+"""The quotes fetched in bulk, keyed by the resolved symbols"""
+history_cache: SingleFlightCache[str, PriceHistory] = SingleFlightCache(ttl=STOCK_HISTORY_TTL)
+"""The bars of the last `HISTORY_DAYS`, keyed by the resolved symbols"""
+get_metrics().register_cache('stock_info', info_cache)
+get_metrics().register_cache('stock_price', price_cache)
+get_metrics().register_cache('stock_quote', quote_cache)
+get_metrics().register_cache('stock_history', history_cache)
+
 
 async def get_stocks_prices(
     _client: discord.Client,
     message: discord.Message,
     arguments: Sequence[str],
 ) -> None:
-    """Get stocks prices from Yahoo! Finance's API"""
-    if arguments[1:]:
-        async with message.channel.typing():
-            embeds = []
-            # Discord only allows 10 embeds per message
-            for arg in arguments[1:11]:
-                try:
-                    embeds.append(_get_discord_embed_for_stock_price(symbol=arg))
-                except Exception:  # pylint: disable=broad-except
-                    _logger.exception(f'Failed to get stock price for {arg}')
-
-            if embeds:
-                await message.reply(embeds=embeds)
-
-
-def _get_discord_embed_for_stock_price(symbol: str) -> discord.Embed:
+    """
+    Get stocks prices from Yahoo! Finance's API, and add the sparklines of the histories which
+    are not cached to the reply after it is sent.
+    """
+    if not arguments[1:]:
+        return
+
+    async with message.channel.typing():
+        # Discord only allows 10 embeds per message
+        symbols = arguments[1:11]
+        quotes: list[Quote] = []
+        for arg, result in zip(symbols, await get_quotes(symbols=symbols)):
+            if isinstance(result, asyncio.TimeoutError):
+                _logger.warning(f'Timed out getting stock price for {arg}')
+            elif isinstance(result, KeyError):
+                _logger.warning(f'No stock price for {arg}')
+            elif isinstance(result, BaseException):
+                _logger.error(f'Failed to get stock price for {arg}', exc_info=result)
+            else:
+                quotes.append(result)
+        if not quotes:
+            return
+
+        histories = [history_cache.get_cached(quote.info.symbol.upper()) for quote in quotes]
+        reply = await message.reply(embeds=[
+            get_discord_embed_for_stock_price(quote=quote, history=history)
+            for quote, history in zip(quotes, histories)
+        ])
+
+    missing_indexes = [index for index, history in enumerate(histories) if history is None]
+    fetched_histories = await asyncio.gather(
+        *(get_price_history(quotes[index].info.symbol) for index in missing_indexes),
+        return_exceptions=True,
+    )
+    has_sparklines = False
+    for index, history in zip(missing_indexes, fetched_histories):
+        if isinstance(history, BaseException):
+            # Only the price without the history
+            symbol = quotes[index].info.symbol
+            _logger.warning(f'Failed to get the history of {symbol}: {history!r}')
+        else:
+            histories[index] = history
+            has_sparklines = has_sparklines or len(history.closes) > 1
+    if has_sparklines:
+        await reply.edit(embeds=[
+            get_discord_embed_for_stock_price(quote=quote, history=history)
+            for quote, history in zip(quotes, histories)
+        ])
+
+
+async def get_quotes(symbols: Sequence[str]) -> list[Quote | BaseException]:
+    """
+    Get the quotes of the symbols, and fetch the ones not cached with one bulk request.
+    The result of each symbol is either the quote or the exception, within the timeout.
+    """
+    actual_symbols = [resolve_symbol(symbol) for symbol in symbols]
+    futures = quote_cache.get_many(
+        (actual_symbol.upper() for actual_symbol in actual_symbols),
+        _get_shared_quotes,
+    )
+    return await asyncio.gather(
+        *(
+            _wait_for_quote(actual_symbol, futures[actual_symbol.upper()])
+            for actual_symbol in actual_symbols
+        ),
+        return_exceptions=True,
+    )
+
+
+async def _wait_for_quote(actual_symbol: str, future: asyncio.Future[Quote]) -> Quote:
+    try:
+        quote = await asyncio.wait_for(asyncio.shield(future), timeout=STOCK_TIMEOUT)
+    except (requests.RequestException, ValueError) as error:
+        # The bulk request failed, e.g. the endpoint is not available
+        _logger.warning(f'Failed to get the quote of {actual_symbol} in bulk: {error!r}')
+        return await asyncio.wait_for(get_quote(actual_symbol), timeout=STOCK_TIMEOUT)
+
+    info_cache.put(actual_symbol.upper(), quote.info)
+    return quote
+
+
+async def get_quote(symbol: str) -> Quote:
+    """Get the quote of a symbol from the caches, or fetch it in the thread pool."""
+    actual_symbol = resolve_symbol(symbol)
+    key = actual_symbol.upper()
+    loop = asyncio.get_running_loop()
+    info, last_price = await asyncio.gather(
+        info_cache.get(key, partial(loop.run_in_executor, _executor, _fetch_info, actual_symbol)),
+        price_cache.get(
+            key,
+            partial(loop.run_in_executor, _executor, _fetch_last_price, actual_symbol),
+        ),
+    )
+    return Quote(info=info, last_price=last_price)
+
+
+async def get_price_history(symbol: str) -> PriceHistory:
+    """Get the bars of the last `HISTORY_DAYS`, with only the new bars fetched into the cache."""
+    key = resolve_symbol(symbol).upper()
+    if not is_valid_symbol(key):
+        raise ValueError(f'Invalid symbol: {symbol!r}')
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(
+        history_cache.get(
+            key,
+            partial(loop.run_in_executor, _executor, _update_price_history, key),
+        ),
+        timeout=STOCK_TIMEOUT,
+    )
+
+
+def resolve_symbol(symbol: str) -> str:
+    """Resolve the aliases, e.g. `COVER` to `5253.t`."""
     try:
-        actual_symbol = _ALIASES[symbol.upper()]
+        return _ALIASES[symbol.upper()]
     except KeyError:
-        actual_symbol = symbol
+        return symbol
+
+
+async def _get_shared_quotes(keys: Sequence[str]) -> dict[str, Quote]:
+    """
+    Get the quotes which the other processes have fetched from the shared store, and fetch the
+    rest with one request into the store.
+    """
+    shared_store = get_shared_store()
+    shared_quotes = await shared_store.run(shared_store.get_many, STOCK_QUOTE_NAMESPACE, keys)
+    quotes = {
+        key: Quote(info=StockInfo(*info), last_price=last_price)
+        for key, (info, last_price) in shared_quotes.items()
+    }
+    if missing_keys := [key for key in keys if key not in quotes]:
+        fetched_quotes = await asyncio.get_running_loop().run_in_executor(
+            _executor,
+            _fetch_quotes,
+            missing_keys,
+        )
+        await shared_store.run(
+            shared_store.put_many,
+            STOCK_QUOTE_NAMESPACE,
+            fetched_quotes,
+            ttl=STOCK_PRICE_TTL,
+        )
+        quotes.update(fetched_quotes)
+    return quotes
+
+
+def _fetch_quotes(keys: Sequence[str]) -> dict[str, Quote]:
+    """Fetch the quotes of the symbols with one request, keyed by the upper-cased symbols."""
+    response_json = _fetch_json(STOCK_QUOTE_URL, params={'symbols': ','.join(keys)})
+    quotes = {}
+    for result in response_json['quoteResponse']['result']:
+        try:
+            quotes[result['symbol'].upper()] = Quote(
+                info=StockInfo(
+                    name=result.get('longName') or result['shortName'],
+                    symbol=result['symbol'],
+                    currency=result['currency'],
+                    previous_close=result['regularMarketPreviousClose'],
+                ),
+                last_price=result['regularMarketPrice'],
+            )
+        except KeyError:
+            _logger.warning(f'Incomplete quote of {result.get("symbol")}')
+    return quotes
+
+
+def _update_price_history(key: str) -> PriceHistory:
+    """
+    Fetch the bars since the last stored one (which may be still open) into the store, where
+    the directory of the symbol is only created once there are bars.
+    """
+    window_start = int(time.time()) - HISTORY_DAYS * 24 * 60 * 60
+    history_store = get_price_history_store()
+    stored = history_store.load(key)
+    period_start = window_start
+    if len(stored.timestamps) and stored.timestamps[-1] > window_start:
+        period_start = int(stored.timestamps[-1])
+    response_json = _fetch_json(
+        STOCK_CHART_URL.format(symbol=key),
+        params={
+            'interval': HISTORY_INTERVAL,
+            'period1': period_start,
+            'period2': int(time.time()),
+        },
+    )
+    if not len((history := PriceHistory.from_chart(response_json)).timestamps):
+        return stored.since(window_start)
+    with history_store.lock(key):
+        history_store.merge(key, history)
+        return history_store.load(key).since(window_start)
+
+
+def _fetch_json(url: str, params: dict) -> dict:
+    if (urlsplit(url).hostname or '').endswith('.yahoo.com'):
+        # With the cookie and the crumb required by Yahoo!
+        return YfData(session=_session).get_raw_json(url, params=params)
+    response = _session.get(url, params=params, timeout=STOCK_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def _fetch_info(actual_symbol: str) -> StockInfo:
+    info = yfinance.Ticker(ticker=actual_symbol, session=_session).get_info()
+    return StockInfo(
+        name=info['longName'],
+        symbol=info['symbol'],
+        currency=info['currency'],
+        previous_close=info['previousClose'],
+    )
+
+
+def _fetch_last_price(actual_symbol: str) -> float:
+    fast_info = yfinance.Ticker(ticker=actual_symbol, session=_session).get_fast_info()
+    return fast_info['lastPrice']
 
-    ticker = yfinance.Ticker(ticker=actual_symbol)
-    info = ticker.get_info()
-    fast_info = ticker.get_fast_info()
 
-    name = info['longName']
-    symbol = info['symbol']
-    currency = info['currency']
-    previous_close = info['previousClose']
-    last_price = fast_info['lastPrice']
+def get_discord_embed_for_stock_price(
+    quote: Quote,
+    history: PriceHistory | None = None,
+) -> discord.Embed:
+    """Show the price and its change since the previous close, and the sparklines of the history."""
+    name, symbol, currency, previous_close = quote.info
+    last_price = quote.last_price
 
     delta = last_price - previous_close
     delta_percent = delta / previous_close * 100
@@ -72,4 +332,15 @@ def _get_discord_embed_for_stock_price(symbol: str) -> discord.Embed:
         ),
         color=delta_color,
     )
+    if history is not None and len(history.closes) > 1:
+        for period, bars in [('1D', history.last_session()), (f'{HISTORY_DAYS}D', history)]:
+            embed.add_field(
+                name=period,
+                value=(
+                    # The lows and the highs of the halted bars are NaN
+                    f'`{render_sparkline(bars.closes)}`\n'
+                    f'{np.nanmin(bars.lows):,.2f} – {np.nanmax(bars.highs):,.2f}'
+                ),
+                inline=False,
+            )
     return embed
@@ -0,0 +1,208 @@
+"""An on-disk cache of the OHLC bars of the stocks, extended with only the missing bars"""
+
+import fcntl
+import os
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import NamedTuple
+from urllib.parse import quote as quote_url
+
+import numpy as np
+
+from .common import get_data_path
+
+STOCK_HISTORY_DIR = get_data_path('stock-history')
+"""The directory of the columns of each symbol, to be memory-mapped"""
+HISTORY_INTERVAL = '30m'
+"""The interval of the bars, which Yahoo! Finance keeps for 60 days"""
+HISTORY_INTERVAL_SECONDS = 30 * 60
+HISTORY_DAYS = 7
+"""The calendar days of the bars to fetch and to show, i.e. about 5 trading days"""
+MAX_HISTORY_BARS = 4096
+"""Beyond which the columns are rewritten with only the bars of the last `HISTORY_DAYS`"""
+SPARKLINE_WIDTH = 24
+SPARKLINE_LEVELS = np.array(list('▁▂▃▄▅▆▇█'))
+
+_COLUMNS = {
+    'timestamps': np.dtype('<i8'),
+    'opens': np.dtype('<f8'),
+    'highs': np.dtype('<f8'),
+    'lows': np.dtype('<f8'),
+    'closes': np.dtype('<f8'),
+    'volumes': np.dtype('<f8'),
+}
+"""The file names and the types of the raw columns, which are appended to"""
+_LOCK_FILENAME = '.lock'
+_SYMBOL_PATTERN = re.compile(r'\^?[A-Z0-9][A-Z0-9.=-]{0,31}')
+"""e.g. `AAPL`, `BRK-B`, `5253.T`, `^N225` and `EURUSD=X`, but neither `.` nor `..`"""
+
+
+class PriceHistory(NamedTuple):
+    """The bars in the order of time, where the timestamps are the Unix times of their starts"""
+
+    timestamps: np.ndarray
+    opens: np.ndarray
+    highs: np.ndarray
+    lows: np.ndarray
+    closes: np.ndarray
+    volumes: np.ndarray
+
+    @classmethod
+    def empty(cls) -> 'PriceHistory':
+        return cls(*(np.empty(0, dtype=dtype) for dtype in _COLUMNS.values()))
+
+    @classmethod
+    def from_chart(cls, response_json: dict) -> 'PriceHistory':
+        """Parse the response of `/v8/finance/chart`, without the bars which have no close."""
+        results = response_json['chart']['result'] or [{}]
+        timestamps = np.array(results[0].get('timestamp') or [], dtype=np.int64)
+        if not len(timestamps):
+            # e.g. no trade in the period
+            return cls.empty()
+        result = results[0]
+        [quote] = result['indicators']['quote']
+        columns = [
+            np.array(
+                [np.nan if value is None else value for value in quote[name]],
+                dtype=np.float64,
+            )
+            for name in ('open', 'high', 'low', 'close', 'volume')
+        ]
+        has_close = ~np.isnan(columns[3])
+        return cls(timestamps[has_close], *(column[has_close] for column in columns))
+
+    def since(self, timestamp: int) -> 'PriceHistory':
+        """The bars starting from the timestamp."""
+        start = int(np.searchsorted(self.timestamps, timestamp))
+        return PriceHistory(*(column[start:] for column in self))
+
+    def last_session(self, gap_seconds: int = 4 * 60 * 60) -> 'PriceHistory':
+        """
+        The bars after the last gap longer than the seconds, i.e. the last trading session, and
+        within a day of the last bar for the markets which never close.
+        """
+        if not len(self.timestamps):
+            return self
+        gaps = np.flatnonzero(np.diff(self.timestamps) > gap_seconds)
+        start = max(
+            int(gaps[-1]) + 1 if len(gaps) else 0,
+            int(np.searchsorted(self.timestamps, self.timestamps[-1] - 24 * 60 * 60, 'right')),
+        )
+        return PriceHistory(*(column[start:] for column in self))
+
+
+class PriceHistoryStore:
+    """
+    The bars of each symbol as raw little-endian columns in `<directory>/<symbol>/`, which are
+    appended to and memory-mapped. They never shrink in place, so the mapped bars stay valid.
+    A lock file serializes the writers across the processes.
+    """
+
+    def __init__(self, directory: str = STOCK_HISTORY_DIR):
+        self.directory = directory
+
+    def load(self, symbol: str) -> PriceHistory:
+        """Memory-map the bars of the symbol (read-only), or return an empty history."""
+        symbol_directory = self._get_symbol_directory(symbol)
+        columns = []
+        for filename, dtype in _COLUMNS.items():
+            path = os.path.join(symbol_directory, filename)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            columns.append(
+                np.memmap(path, dtype=dtype, mode='r', shape=(size // dtype.itemsize,))
+                if size >= dtype.itemsize
+                else np.empty(0, dtype=dtype)
+            )
+        # A column may be longer if the process stopped while appending
+        row_count = min(len(column) for column in columns)
+        return PriceHistory(*(column[:row_count] for column in columns))
+
+    def merge(self, symbol: str, history: PriceHistory) -> None:
+        """
+        Replace the stored bars from the first timestamp of the history with it, which only
+        overwrites the last bars if they were still open, and appends the rest. Hold
+        `lock(symbol)` around it.
+        """
+        if not len(history.timestamps):
+            return
+        symbol_directory = self._get_symbol_directory(symbol)
+        stored = self.load(symbol)
+        keep_count = int(np.searchsorted(stored.timestamps, history.timestamps[0]))
+        row_count = keep_count + len(history.timestamps)
+        if row_count > MAX_HISTORY_BARS or row_count < len(stored.timestamps):
+            # Into new files, since the mapped ones must not shrink
+            cutoff = int(history.timestamps[-1]) - HISTORY_DAYS * 24 * 60 * 60
+            self._rewrite(symbol_directory, _concat(stored, keep_count, history).since(cutoff))
+            return
+
+        for filename, column in zip(_COLUMNS, history):
+            path = os.path.join(symbol_directory, filename)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as column_file:
+                column_file.seek(keep_count * _COLUMNS[filename].itemsize)
+                column_file.write(np.asarray(column, dtype=_COLUMNS[filename]).tobytes())
+
+    @contextmanager
+    def lock(self, symbol: str) -> Iterator[None]:
+        """Hold the lock of the symbol across the processes, which creates its directory."""
+        symbol_directory = self._get_symbol_directory(symbol)
+        os.makedirs(symbol_directory, exist_ok=True)
+        with open(os.path.join(symbol_directory, _LOCK_FILENAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_symbol_directory(self, symbol: str) -> str:
+        if not is_valid_symbol(symbol):
+            # Not to escape the directory of the store
+            raise ValueError(f'Invalid symbol: {symbol!r}')
+        # e.g. `^N225` and `EURUSD=X`
+        return os.path.join(self.directory, quote_url(symbol.upper(), safe=''))
+
+    @staticmethod
+    def _rewrite(symbol_directory: str, history: PriceHistory) -> None:
+        for filename, column in zip(_COLUMNS, history):
+            temp_path = os.path.join(symbol_directory, f'.{filename}')
+            with open(temp_path, 'wb') as column_file:
+                column_file.write(np.asarray(column, dtype=_COLUMNS[filename]).tobytes())
+            os.replace(temp_path, os.path.join(symbol_directory, filename))
+
+
+@lru_cache(maxsize=None)
+def get_price_history_store(directory: str = STOCK_HISTORY_DIR) -> PriceHistoryStore:
+    """Get the store in the directory."""
+    return PriceHistoryStore(directory)
+
+
+def is_valid_symbol(symbol: str) -> bool:
+    """Whether the symbol looks like one of Yahoo! Finance, which is safe in a path."""
+    return _SYMBOL_PATTERN.fullmatch(symbol.upper()) is not None
+
+
+def render_sparkline(values: np.ndarray, width: int = SPARKLINE_WIDTH) -> str:
+    """
+    Render the values as a line of block characters, with the last value of each of the `width`
+    buckets in time, scaled between the minimum and the maximum.
+    """
+    if not len(values):
+        return ''
+    # The last value of each bucket
+    bucket_edges = np.ceil(np.linspace(0, len(values), width + 1)[1:]).astype(np.int64)
+    bucket_ends = np.unique(bucket_edges - 1)
+    sampled = np.asarray(values)[bucket_ends]
+    low, high = sampled.min(), sampled.max()
+    if high == low:
+        levels = np.full(len(sampled), (len(SPARKLINE_LEVELS) - 1) // 2)
+    else:
+        levels = ((sampled - low) / (high - low) * (len(SPARKLINE_LEVELS) - 1)).round()
+    return ''.join(SPARKLINE_LEVELS[levels.astype(np.int64)])
+
+
+def _concat(stored: PriceHistory, keep_count: int, history: PriceHistory) -> PriceHistory:
+    return PriceHistory(*(
+        np.concatenate([stored_column[:keep_count], column])
+        for stored_column, column in zip(stored, history)
+    ))
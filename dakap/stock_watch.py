@@ -0,0 +1,276 @@
+"""Watch the stocks and alert on the prices for the channels, with one batched poll for all"""
+
+import asyncio
+import logging
+import math
+from collections.abc import Sequence
+from functools import lru_cache
+
+import discord
+
+from .stock import (Quote, get_discord_embed_for_stock_price, get_quotes, get_stocks_prices,
+                    resolve_symbol)
+from .stock_watch_store import Alert, StockWatchStore, get_stock_watch_store
+
+STOCK_WATCH_INTERVAL = 60.0
+"""Seconds between the polls, which is the TTL of the cached prices"""
+MAX_WATCHES_PER_CHANNEL = 10
+"""Discord only allows 10 embeds per message"""
+MAX_ALERTS_PER_CHANNEL = 25
+
+_DIRECTIONS = {'>': 'above', '>=': 'above', '<': 'below', '<=': 'below'}
+
+_logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class StockWatcher:
+    """
+    Poll the prices of all the symbols watched or alerted in the channels of the client with one
+    batched fetch per interval. Update a message of the watched prices in each channel, and send
+    only the alerts which are crossed.
+    """
+
+    def __init__(self, store: StockWatchStore, interval: float = STOCK_WATCH_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self.poll_count = 0
+        self.sent_alert_count = 0
+        self._watch_messages: dict[int, discord.Message] = {}
+        """The message of the watched prices in each channel, to be edited"""
+        self._watch_prices: dict[int, list[float]] = {}
+        """The prices in the message of each channel"""
+        self._task: asyncio.Task | None = None
+
+    def start(self, client: discord.Client) -> None:
+        """Start polling in the background, unless it is already started."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(client))
+
+    async def poll(self, client: discord.Client) -> None:
+        """Fetch the prices of the symbols in the channels of the client, and notify them."""
+        # Only the channels in the shards of this process
+        watches = {
+            channel_id: symbols
+            for channel_id, symbols in (await self.store.run(self.store.get_watches)).items()
+            if _get_messageable(client, channel_id)
+        }
+        alerts = [
+            alert
+            for alert in await self.store.run(self.store.get_alerts)
+            if _get_messageable(client, alert.channel_id)
+        ]
+        symbols = sorted({
+            *(symbol for channel_symbols in watches.values() for symbol in channel_symbols),
+            *(alert.symbol for alert in alerts),
+        })
+        if not symbols:
+            return
+
+        self.poll_count += 1
+        quotes = {
+            symbol: result
+            for symbol, result in zip(symbols, await get_quotes(symbols))
+            if isinstance(result, Quote)
+        }
+
+        crossed_alerts = [
+            alert
+            for alert in alerts
+            if alert.symbol in quotes and alert.is_crossed(quotes[alert.symbol].last_price)
+        ]
+        # Removed first, so that an alert is sent at most once
+        await self.store.run(
+            self.store.remove_alerts,
+            [alert.alert_id for alert in crossed_alerts],
+        )
+        results = await asyncio.gather(
+            *(
+                self._update_watch_message(client, channel_id, channel_symbols, quotes)
+                for channel_id, channel_symbols in watches.items()
+            ),
+            *(self._send_alert(client, alert, quotes[alert.symbol]) for alert in crossed_alerts),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                _logger.warning(f'Failed to notify the watched stocks: {result!r}')
+
+    async def _run(self, client: discord.Client) -> None:
+        while not client.is_closed():
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll(client)
+            except Exception:  # pylint: disable=broad-except
+                _logger.exception('Failed to poll the watched stocks')
+
+    async def _update_watch_message(
+        self,
+        client: discord.Client,
+        channel_id: int,
+        symbols: Sequence[str],
+        quotes: dict[str, Quote],
+    ) -> None:
+        channel_quotes = [quotes[symbol] for symbol in symbols if symbol in quotes]
+        prices = [quote.last_price for quote in channel_quotes]
+        if not channel_quotes or prices == self._watch_prices.get(channel_id):
+            return
+
+        embeds = [get_discord_embed_for_stock_price(quote=quote) for quote in channel_quotes]
+        try:
+            if watch_message := self._watch_messages.get(channel_id):
+                try:
+                    await watch_message.edit(embeds=embeds)
+                    self._watch_prices[channel_id] = prices
+                    return
+                except discord.NotFound:
+                    # Deleted, so send a new one
+                    pass
+
+            channel = _get_messageable(client, channel_id)
+            assert channel
+            self._watch_messages[channel_id] = await channel.send(embeds=embeds)
+            self._watch_prices[channel_id] = prices
+        except (discord.Forbidden, discord.NotFound) as error:
+            # The channel is gone or closed to the bot, which would fail on every poll
+            _logger.warning(f'Dropped the watches and the alerts of {channel_id}: {error!r}')
+            self._watch_messages.pop(channel_id, None)
+            self._watch_prices.pop(channel_id, None)
+            await self.store.run(self.store.remove_watches, channel_id)
+
+    async def _send_alert(self, client: discord.Client, alert: Alert, quote: Quote) -> None:
+        channel = _get_messageable(client, alert.channel_id)
+        assert channel
+        await channel.send(
+            f'<@{alert.user_id}> {quote.info.symbol} is {alert.direction} {alert.threshold:,.2f}',
+            embed=get_discord_embed_for_stock_price(quote=quote),
+        )
+        self.sent_alert_count += 1
+
+
+@lru_cache(maxsize=None)
+def get_stock_watcher() -> StockWatcher:
+    """Get the watcher of this process, with the subscriptions in the shared store."""
+    return StockWatcher(get_stock_watch_store())
+
+
+async def stock_command(
+    client: discord.Client,
+    message: discord.Message,
+    arguments: Sequence[str],
+) -> None:
+    """
+    Get the prices of the stocks, or manage the subscriptions of the channel:
+    - `watch [<symbol>...]`: Show the prices in a message updated every interval, or list them
+    - `unwatch [<symbol>...]`: Stop watching and alerting the symbols, or all of them
+    - `alert <symbol> <|> <price>`: Notify the author once when the price is crossed
+    """
+    sub_command = arguments[1].lower() if arguments[1:] else ''
+    try:
+        if sub_command == 'watch':
+            await _watch(message, arguments[2:])
+            get_stock_watcher().start(client)
+        elif sub_command == 'unwatch':
+            await _unwatch(message, arguments[2:])
+        elif sub_command == 'alert':
+            await _add_alert(message, arguments[2:])
+            get_stock_watcher().start(client)
+        else:
+            await get_stocks_prices(client, message, arguments)
+    except ValueError as error:
+        await message.reply(f'```{error}```')
+
+
+async def _watch(message: discord.Message, symbols: Sequence[str]) -> None:
+    store = get_stock_watcher().store
+    watched_symbols = (await store.run(store.get_watches)).get(message.channel.id, [])
+    if not symbols:
+        await message.reply(
+            f'```Watching: {", ".join(watched_symbols)}```' if watched_symbols
+            else '```Not watching any stocks```'
+        )
+        return
+
+    new_symbols = list(await _get_valid_quotes(symbols))
+    if len({*watched_symbols, *new_symbols}) > MAX_WATCHES_PER_CHANNEL:
+        raise ValueError(f'At most {MAX_WATCHES_PER_CHANNEL} stocks can be watched in a channel')
+    await store.run(store.add_watches, message.channel.id, new_symbols)
+    await message.reply(
+        f'```Watching {", ".join(new_symbols)} here, updated every '
+        f'{STOCK_WATCH_INTERVAL:.0f}s```'
+    )
+
+
+async def _unwatch(message: discord.Message, symbols: Sequence[str]) -> None:
+    store = get_stock_watcher().store
+    removed_count = await store.run(
+        store.remove_watches,
+        message.channel.id,
+        [resolve_symbol(symbol).upper() for symbol in symbols] if symbols else None,
+    )
+    await message.reply(f'```Removed {removed_count} watch(es) and alert(s)```')
+
+
+async def _add_alert(message: discord.Message, arguments: Sequence[str]) -> None:
+    try:
+        symbol, operator, threshold_str = arguments
+        direction = _DIRECTIONS[operator]
+        threshold = float(threshold_str.replace(',', ''))
+        if not math.isfinite(threshold):
+            raise ValueError(f'Invalid price: {threshold_str}')
+    except (ValueError, KeyError) as error:
+        raise ValueError('Usage: alert <symbol> <|> <price>') from error
+
+    store = get_stock_watcher().store
+    channel_alerts = [
+        alert
+        for alert in await store.run(store.get_alerts)
+        if alert.channel_id == message.channel.id
+    ]
+    if len(channel_alerts) >= MAX_ALERTS_PER_CHANNEL:
+        raise ValueError(f'At most {MAX_ALERTS_PER_CHANNEL} alerts can be set in a channel')
+    [(actual_symbol, quote)] = (await _get_valid_quotes([symbol])).items()
+    alert = Alert(
+        alert_id=0,
+        channel_id=message.channel.id,
+        user_id=message.author.id,
+        symbol=actual_symbol,
+        direction=direction,
+        threshold=threshold,
+    )
+    if alert.is_crossed(quote.last_price):
+        # Otherwise it would be sent by the next poll without crossing the threshold
+        raise ValueError(
+            f'{actual_symbol} is already {direction} {threshold:,.2f} '
+            f'({quote.last_price:,.2f})'
+        )
+    await store.run(
+        store.add_alert,
+        channel_id=alert.channel_id,
+        user_id=alert.user_id,
+        symbol=alert.symbol,
+        direction=alert.direction,
+        threshold=alert.threshold,
+    )
+    await message.reply(f'```Alert when {actual_symbol} is {direction} {threshold:,.2f}```')
+
+
+async def _get_valid_quotes(symbols: Sequence[str]) -> dict[str, Quote]:
+    """
+    Get the quotes keyed by the resolved and upper-cased symbols in order, or raise `ValueError`
+    if any has no quote.
+    """
+    actual_symbols = list(dict.fromkeys(resolve_symbol(symbol).upper() for symbol in symbols))
+    results = await get_quotes(actual_symbols)
+    if unknown_symbols := [
+        symbol
+        for symbol, result in zip(actual_symbols, results)
+        if not isinstance(result, Quote)
+    ]:
+        raise ValueError(f'Unknown stock(s): {", ".join(unknown_symbols)}')
+    return dict(zip(actual_symbols, results))  # type: ignore[arg-type]
+
+
+def _get_messageable(client: discord.Client, channel_id: int) -> discord.abc.Messageable | None:
+    channel = client.get_channel(channel_id)
+    # Not `isinstance`, since the channels can be private or partial
+    return channel if hasattr(channel, 'send') else None  # type: ignore[return-value]
@@ -0,0 +1,144 @@
+"""The watched stocks and the price alerts of the channels, kept across the restarts"""
+
+import os
+from collections.abc import Iterable, Sequence
+from functools import lru_cache
+from typing import NamedTuple
+
+from .common import get_data_path
+from .database import Database
+
+STOCK_WATCH_PATH = get_data_path('stock-watch.sqlite3')
+STOCK_WATCH_TIMEOUT = 30.0
+"""Seconds to wait for the other processes writing to the subscriptions"""
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS watches (
+    channel_id INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    PRIMARY KEY (channel_id, symbol)
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    alert_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    threshold REAL NOT NULL
+);
+'''
+
+
+class Alert(NamedTuple):
+    alert_id: int
+    channel_id: int
+    user_id: int
+    symbol: str
+    """Resolved and upper-cased"""
+    direction: str
+    """`above` or `below`"""
+    threshold: float
+
+    def is_crossed(self, price: float) -> bool:
+        """
+        If the price is on the alerted side of the threshold, which means it has been crossed,
+        since an alert can only be set on the other side.
+        """
+        if self.direction == 'above':
+            return price >= self.threshold
+        return price <= self.threshold
+
+
+class StockWatchStore(Database):
+    """The watched symbols and the alerts of the channels, kept across the restarts"""
+
+    def __init__(self, path: str = STOCK_WATCH_PATH):
+        super().__init__(path, timeout=STOCK_WATCH_TIMEOUT, schema=_SCHEMA)
+
+    def has_subscriptions(self) -> bool:
+        """If any channel has watched a stock or set an alert."""
+        return self._connection.execute(
+            'SELECT EXISTS (SELECT 1 FROM watches) OR EXISTS (SELECT 1 FROM alerts)'
+        ).fetchone()[0] == 1
+
+    def get_watches(self) -> dict[int, list[str]]:
+        """Get the watched symbols keyed by the channel IDs."""
+        watches: dict[int, list[str]] = {}
+        for channel_id, symbol in self._connection.execute(
+            'SELECT channel_id, symbol FROM watches ORDER BY channel_id, rowid'
+        ):
+            watches.setdefault(channel_id, []).append(symbol)
+        return watches
+
+    def add_watches(self, channel_id: int, symbols: Iterable[str]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO watches (channel_id, symbol) VALUES (?, ?)',
+                ((channel_id, symbol) for symbol in symbols),
+            )
+
+    def remove_watches(self, channel_id: int, symbols: Sequence[str] | None = None) -> int:
+        """Remove the watches and the alerts of the symbols, or all of them, in the channel."""
+        with self._connection:
+            removed_count = 0
+            for table in ('watches', 'alerts'):
+                if symbols is None:
+                    removed_count += self._connection.execute(
+                        f'DELETE FROM {table} WHERE channel_id = ?',
+                        (channel_id,),
+                    ).rowcount
+                else:
+                    removed_count += self._connection.execute(
+                        f'''
+                        DELETE FROM {table}
+                        WHERE channel_id = ? AND symbol IN ({', '.join('?' * len(symbols))})
+                        ''',
+                        (channel_id, *symbols),
+                    ).rowcount
+            return removed_count
+
+    def get_alerts(self) -> list[Alert]:
+        return [
+            Alert(*row)
+            for row in self._connection.execute(
+                '''
+                SELECT alert_id, channel_id, user_id, symbol, direction, threshold FROM alerts
+                ORDER BY alert_id
+                '''
+            )
+        ]
+
+    def add_alert(
+        self,
+        channel_id: int,
+        user_id: int,
+        symbol: str,
+        direction: str,
+        threshold: float,
+    ) -> None:
+        with self._connection:
+            self._connection.execute(
+                '''
+                INSERT INTO alerts (channel_id, user_id, symbol, direction, threshold)
+                VALUES (?, ?, ?, ?, ?)
+                ''',
+                (channel_id, user_id, symbol, direction, threshold),
+            )
+
+    def remove_alerts(self, alert_ids: Iterable[int]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                'DELETE FROM alerts WHERE alert_id = ?',
+                ((alert_id,) for alert_id in alert_ids),
+            )
+
+
+@lru_cache(maxsize=None)
+def get_stock_watch_store(path: str = STOCK_WATCH_PATH) -> StockWatchStore:
+    """Get the store in the path, which is opened in its thread."""
+    return StockWatchStore(path)
+
+
+def has_stock_watch_store(path: str = STOCK_WATCH_PATH) -> bool:
+    """If any channel may have watched the stocks, without creating the store."""
+    return os.path.exists(path)
@@ -8,34 +8,52 @@ from typing import Sequence
 
 import discord
 
+MAX_THUMBNAILS = 5
+"""The maximum number of the thumbnails in a reply, which Discord previews all of"""
+
+_TOKEN_PATTERN = re.compile(r'\S+')
+_HOST_PATTERN = re.compile(r'youtu\.be/|youtube(?:-nocookie)?\.com/', re.IGNORECASE)
+# The prefixes are fixed-length and the IDs are 11 characters, so each attempt takes constant time
+_VIDEO_ID_PATTERN = re.compile(
+    r'(?:youtu\.be/|/(?:v|vi|e|embed|live|shorts)/|/u/\w/|[?&]vi?=)([\w-]{11})(?![\w-])'
+)
+
 
 async def reply_youtube_thumbnail(
         _client: discord.Client,
         message: discord.Message,
         arguments: Sequence[str],
 ) -> None:
-    """Reply with the latest YouTube thumbnail"""
-    try:
-        yt_url = arguments[1]
-    except IndexError:
-        return
+    """Reply with the latest thumbnails of the YouTube videos"""
+    if thumbnail_urls := generate_youtube_thumbnail_urls(' '.join(arguments[1:])):
+        await message.reply('\n'.join(thumbnail_urls[:MAX_THUMBNAILS]))
+
+
+def find_youtube_video_ids(text: str) -> list[str]:
+    """
+    Find the IDs of the videos in the YouTube URLs in the text without duplicates, in one pass
+    (in linear time) over the text.
+    """
+    video_ids: dict[str, None] = {}
+    for token in _TOKEN_PATTERN.finditer(text):
+        url = token.group()
+        if _HOST_PATTERN.search(url):
+            video_ids.update(dict.fromkeys(_VIDEO_ID_PATTERN.findall(url)))
+    return list(video_ids)
+
 
-    try:
-        await message.reply(
-            parse_and_generate_youtube_thumbnail_url(yt_url=yt_url)
-        )
-    except ValueError:
-        pass
+def generate_youtube_thumbnail_urls(text: str) -> list[str]:
+    """Generate the URLs of the latest thumbnails of the YouTube videos in the text."""
+    return [
+        _generate_youtube_thumbnail_url(youtube_video_id=video_id)
+        for video_id in find_youtube_video_ids(text)
+    ]
 
 
 def parse_and_generate_youtube_thumbnail_url(yt_url: str) -> str:
-    # pattern modified from:
-    #   https://stackoverflow.com/questions/3452546/how-do-i-get-the-youtube-video-id-from-a-url#comment80849763_27728417
-    if matched := re.fullmatch(
-        r'^.*(?:(?:youtu\.be\/|v\/|vi\/|u\/\w\/|embed\/|live\/)|(?:(?:watch)?\?v(?:i)?=|\&v(?:i)?=))([^#\&\?]+).*',
-        yt_url,
-    ):
-        return _generate_youtube_thumbnail_url(youtube_video_id=matched.groups()[0])
+    """Generate the thumbnail URL of the first YouTube video in the text, or raise `ValueError`."""
+    if video_ids := find_youtube_video_ids(yt_url):
+        return _generate_youtube_thumbnail_url(youtube_video_id=video_ids[0])
     raise ValueError()
 
 
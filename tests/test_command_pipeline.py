@@ -0,0 +1,142 @@
+import asyncio
+from types import SimpleNamespace
+
+from dakap.command_pipeline import CommandPipeline
+from dakap.common import Command
+from dakap.dakap import DakaP
+
+
+def test_commands_run_in_order_within_each_channel():
+    finished = []
+
+    def make_command(channel_id, index, delay):
+        async def command():
+            await asyncio.sleep(delay)
+            finished.append((channel_id, index))
+        return command
+
+    async def main():
+        pipeline = CommandPipeline(max_running=4, max_guild_running=4)
+        for index, delay in enumerate([0.03, 0.0, 0.01]):
+            for channel_id in (1, 2):
+                command = make_command(channel_id, index, delay)
+                assert pipeline.submit('test', command, channel_id, guild_id=1)
+        assert pipeline.depth == 6
+        await pipeline.join()
+        assert (pipeline.depth, pipeline.running, pipeline.shed_count) == (0, 0, 0)
+
+    asyncio.run(main())
+    for channel_id in (1, 2):
+        assert [index for channel, index in finished if channel == channel_id] == [0, 1, 2]
+
+
+def test_channels_of_a_guild_share_its_limit():
+    running = []
+    max_running = 0
+
+    async def command():
+        nonlocal max_running
+        running.append(None)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+
+    async def main():
+        pipeline = CommandPipeline(max_running=4, max_guild_running=2)
+        for channel_id in range(4):
+            pipeline.submit('test', command, channel_id, 1)
+        await pipeline.join()
+
+    asyncio.run(main())
+    assert max_running == 2
+
+
+def test_commands_are_shed_beyond_the_channel_queue():
+    async def command():
+        await asyncio.sleep(0)
+
+    async def main():
+        pipeline = CommandPipeline(max_channel_queued=2)
+        assert pipeline.submit('test', command, 1, None)
+        await asyncio.sleep(0)
+        assert pipeline.running == 1
+        # 2 waiting besides the running one
+        assert [pipeline.submit('test', command, 1, None) for _ in range(4)] == [
+            True, True, False, False,
+        ]
+        # Another channel has a lane of its own
+        assert pipeline.submit('test', command, 2, None)
+        assert pipeline.shed_count == 2
+        await pipeline.join()
+        assert pipeline.submit('test', command, 1, None)
+        await pipeline.join()
+
+    asyncio.run(main())
+
+
+def test_commands_are_shed_beyond_the_process_queue():
+    async def command():
+        await asyncio.sleep(0)
+
+    async def main():
+        pipeline = CommandPipeline(max_queued=3)
+        assert [pipeline.submit('test', command, channel_id, None) for channel_id in range(5)] == [
+            True, True, True, False, False,
+        ]
+        assert pipeline.shed_count == 2
+        await pipeline.join()
+
+    asyncio.run(main())
+
+
+def test_failed_command_does_not_stop_the_channel():
+    finished = []
+
+    async def fail():
+        raise RuntimeError('boom')
+
+    async def command():
+        finished.append(None)
+
+    async def main():
+        waits = []
+        pipeline = CommandPipeline(on_wait=lambda name, seconds: waits.append(name))
+        pipeline.submit('fail', fail, 1, None)
+        pipeline.submit('command', command, 1, None)
+        await pipeline.join()
+        assert waits == ['fail', 'command']
+
+    asyncio.run(main())
+    assert finished == [None]
+
+
+def test_shed_commands_are_replied_to_instead_of_run():
+    arguments = []
+    replies = []
+
+    async def command(_client, _message, command_arguments):
+        arguments.append(command_arguments[1])
+
+    async def reply(content):
+        replies.append(content)
+
+    async def main():
+        client = DakaP(
+            commands=[Command(names=('test',), func=command, usage='', description='')],
+            warm_commands=False,
+        )
+        client.command_pipeline = CommandPipeline(max_channel_queued=1)
+        for index in range(2):
+            await client.on_message(SimpleNamespace(
+                id=index,
+                guild=None,
+                channel=SimpleNamespace(id=1),
+                author=SimpleNamespace(bot=False, id=2),
+                content=f'$test {index}',
+                reply=reply,
+            ))
+        await client.command_pipeline.join()
+
+    asyncio.run(main())
+    assert arguments == ['0']
+    assert replies == ['```Too busy now, please try again later```']
@@ -0,0 +1,121 @@
+import asyncio
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+import pytest
+
+from dakap import emoji_cube
+from dakap.emoji_cube import EmojiCube, get_emoji_cube, save_emoji_cubes
+from dakap.emoji_index import EmojiIndex, current_day
+from dakap.memory import MemoryConfig
+
+
+@pytest.fixture
+def cube():
+    # Channels 10 and 11 from the day 100 to 104
+    return EmojiCube.build(
+        emoji_ids=[7, 8, 9],
+        channel_ids=[11, 10],
+        first_day=100,
+        last_day=104,
+        daily_emoji_counts=[
+            (10, 100, 7, 1),
+            (10, 103, 7, 2),
+            (10, 104, 8, 4),
+            (11, 101, 9, 5),
+            (11, 104, 7, 1),
+            # Unknown channel, day and emoji
+            (12, 104, 7, 100),
+            (10, 99, 7, 100),
+            (10, 104, 6, 100),
+        ],
+        daily_message_counts=[(10, 100, 3), (10, 104, 2), (11, 101, 1), (12, 104, 100)],
+        revision=1,
+    )
+
+
+def test_counts_since_the_day(cube):
+    assert cube.last_day == 104
+    assert cube.get_emoji_counts(since_day=0) == {7: 4, 8: 4, 9: 5}
+    assert cube.get_emoji_counts(since_day=103, channel_ids=[10, 12]) == {7: 2, 8: 4, 9: 0}
+    assert cube.get_message_counts(since_day=101) == {10: 2, 11: 1}
+
+
+def test_get_top_emojis_per_channel(cube):
+    assert cube.get_top_emojis_per_channel(top_k=2, since_day=0) == {
+        10: [(8, 4), (7, 3)],
+        11: [(9, 5), (7, 1)],
+    }
+    # Only the positive counts
+    assert cube.get_top_emojis_per_channel(top_k=5, since_day=102, channel_ids=[11]) == {
+        11: [(7, 1)],
+    }
+    assert cube.get_top_emojis_per_channel(top_k=0, since_day=0) == {10: [], 11: []}
+
+
+def test_get_trends(cube):
+    # The buckets end at the last day, and the first one is shorter
+    assert cube.get_trends([7, 9, 6], since_day=100, bucket_days=2) == {
+        7: [1, 0, 3],
+        9: [0, 5, 0],
+    }
+    assert cube.get_trends([8], since_day=103, bucket_days=7, channel_ids=[11]) == {8: [0]}
+    assert cube.get_trends([7], since_day=105, bucket_days=1) == {7: []}
+
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+def test_save_and_load(cube, tmp_path, mmap_mode):
+    cube.save(str(tmp_path))
+    loaded = EmojiCube.load(str(tmp_path), mmap_mode=mmap_mode)
+    assert isinstance(loaded.emoji_counts, np.memmap) == (mmap_mode is not None)
+    assert loaded.emoji_ids.tolist() == [7, 8, 9]
+    assert loaded.channel_ids.tolist() == [10, 11]
+    assert (loaded.first_day, loaded.revision) == (100, 1)
+    assert np.array_equal(loaded.emoji_counts, cube.emoji_counts)
+    assert np.array_equal(loaded.message_counts, cube.message_counts)
+    assert loaded.get_trends([7], since_day=100, bucket_days=5) == {7: [4]}
+
+
+@pytest.fixture
+def emoji_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(emoji_cube, 'EMOJI_CUBE_DIR', str(tmp_path))
+    monkeypatch.setattr(emoji_cube, '_cubes', OrderedDict())
+    monkeypatch.setattr(emoji_cube, '_unsaved_guild_ids', set())
+    monkeypatch.setattr(emoji_cube, '_last_saved', {})
+    monkeypatch.setattr(emoji_cube, 'get_memory_config', lambda: MemoryConfig(max_emoji_cubes=2))
+    index = EmojiIndex(':memory:')
+    yield index
+    index.close()
+
+
+def test_rebuilt_cubes_are_saved_at_most_once_per_interval(emoji_index, tmp_path):
+    today = current_day()
+
+    async def main():
+        get_cube = partial(get_emoji_cube, 1, [7], [10], emoji_index)
+        await emoji_index.run(emoji_index.add_counts, 1, 10, {today: 1}, {(today, 7): 1}, None)
+        first_cube = await get_cube()
+        assert await get_cube() is first_cube
+        assert EmojiCube.load(str(tmp_path / '1')).revision == first_cube.revision
+
+        await emoji_index.run(emoji_index.add_counts, 1, 10, {today: 1}, {(today, 7): 2}, None)
+        cube = await get_cube()
+        assert cube.get_emoji_counts(since_day=today) == {7: 3}
+        # Not saved again within the interval, until shutting down
+        assert EmojiCube.load(str(tmp_path / '1')).revision == first_cube.revision
+        await save_emoji_cubes()
+        assert EmojiCube.load(str(tmp_path / '1')).revision == cube.revision
+
+    asyncio.run(main())
+
+
+def test_least_recently_used_cubes_are_dropped(emoji_index):
+    async def main():
+        cubes = [await get_emoji_cube(guild_id, [7], [10], emoji_index) for guild_id in (1, 2)]
+        # Guild 1 is used again, then guild 3 takes the place of guild 2
+        assert await get_emoji_cube(1, [7], [10], emoji_index) is cubes[0]
+        await get_emoji_cube(3, [7], [10], emoji_index)
+        assert list(emoji_cube._cubes) == [1, 3]
+
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from dakap.emoji_index import EmojiIndex
+
+
+@pytest.fixture
+def emoji_index():
+    index = EmojiIndex(':memory:')
+    yield index
+    index.close()
+
+
+def test_checkpoints_only_move_forward(emoji_index):
+    assert emoji_index.get_checkpoint(10) is None
+    emoji_index.add_counts(1, 10, {100: 2}, {(100, 7): 3}, checkpoint=500)
+    emoji_index.move_checkpoint(guild_id=1, channel_id=10, checkpoint=400)
+    emoji_index.move_checkpoint(guild_id=1, channel_id=11, checkpoint=300)
+    assert emoji_index.get_checkpoint(10) == 500
+    assert emoji_index.get_checkpoints([10, 11, 12]) == {10: 500, 11: 300}
+
+
+def test_counts_are_added_up(emoji_index):
+    emoji_index.add_counts(1, 10, {100: 2, 101: 1}, {(100, 7): 3}, checkpoint=None)
+    emoji_index.add_counts(1, 10, {101: 4}, {(100, 7): 1, (101, 8): 2}, checkpoint=None)
+    emoji_index.add_counts(1, 11, {101: 5}, {(101, 7): 1}, checkpoint=None)
+    assert emoji_index.get_checkpoint(10) is None
+    assert emoji_index.get_message_counts([10, 11], since_day=101) == {10: 5, 11: 5}
+    assert emoji_index.get_emoji_counts([10, 11], since_day=100) == {7: 5, 8: 2}
+    assert emoji_index.get_emoji_counts([10], since_day=101) == {8: 2}
+
+
+def test_revisions_are_bumped_per_guild(emoji_index):
+    assert emoji_index.get_revision(1) == 0
+    emoji_index.add_counts(1, 10, {100: 1}, {}, checkpoint=500)
+    emoji_index.add_counts(2, 20, {200: 1}, {(200, 7): 1}, checkpoint=None)
+    assert (emoji_index.get_revision(1), emoji_index.get_revision(2)) == (1, 1)
+
+    # No new messages
+    emoji_index.add_counts(1, 10, {}, {}, checkpoint=600)
+    assert emoji_index.get_revision(1) == 1
+
+    # Only the counts of the guild 1 are old enough
+    emoji_index.prune(before_day=150)
+    assert (emoji_index.get_revision(1), emoji_index.get_revision(2)) == (2, 1)
+    assert emoji_index.get_message_counts([10, 20], since_day=0) == {20: 1}
+    emoji_index.prune(before_day=150)
+    assert emoji_index.get_revision(1) == 2
+
+
+def test_run_calls_in_the_thread_of_the_database(emoji_index):
+    async def main():
+        await emoji_index.run(emoji_index.add_counts, 1, 10, {100: 1}, {}, checkpoint=500)
+        return await emoji_index.run(emoji_index.get_checkpoints, [10])
+
+    assert asyncio.run(main()) == {10: 500}
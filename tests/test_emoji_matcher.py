@@ -0,0 +1,93 @@
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from dakap.emoji_matcher import DailyEmojiCounts, EmojiMatcher
+
+FIRST_DAY = 19_000
+DAY_COUNT = 7
+
+EMOJIS = [
+    *(discord.PartialEmoji(name=f'emoji_{index}', id=1000 + index) for index in range(20)),
+    *(
+        discord.PartialEmoji(name=f'animated_{index}', id=2000 + index, animated=True)
+        for index in range(10)
+    ),
+    # A name which is a prefix of another
+    discord.PartialEmoji(name='emoji', id=3000),
+]
+UNKNOWN_EMOJIS = [
+    discord.PartialEmoji(name='emoji_1', id=9001),
+    discord.PartialEmoji(name='other', id=9002, animated=True),
+    # The animated form of a known static emoji
+    discord.PartialEmoji(name='emoji_2', id=1002, animated=True),
+]
+OTHER_TOKENS = ['lorem', 'ipsum', '😀', '<:emoji_1:', '<emoji_1:1001>', 'https://example.com/', '\n']
+
+
+def _legacy_count(emojis, message) -> Counter:
+    """The previous substring loop of `_count_emojis_in_msg`."""
+    emoji_counter: Counter = Counter()
+    for emoji in emojis:
+        if str(emoji) in message.content:
+            emoji_counter[emoji] += 1
+        if str(emoji) in [str(reaction.emoji) for reaction in message.reactions]:
+            emoji_counter[emoji] += 1
+    return emoji_counter
+
+
+def _make_messages(count: int, seed: int = 0) -> list[SimpleNamespace]:
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        tokens = rng.choices(
+            [*map(str, EMOJIS), *map(str, UNKNOWN_EMOJIS), *OTHER_TOKENS],
+            k=rng.randint(0, 8),
+        )
+        if tokens and rng.random() < 0.2:
+            # The same emoji repeated
+            tokens += [tokens[0]] * rng.randint(1, 3)
+        reaction_emojis = rng.sample([*EMOJIS, *UNKNOWN_EMOJIS, '👍', '😀'], k=rng.randint(0, 4))
+        messages.append(SimpleNamespace(
+            content=rng.choice(['', ' ']).join(tokens),
+            reactions=[
+                SimpleNamespace(emoji=emoji, count=rng.randint(1, 5)) for emoji in reaction_emojis
+            ],
+            day=FIRST_DAY + rng.randrange(DAY_COUNT),
+        ))
+    return messages
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_matcher_counts_like_the_substring_loop(seed):
+    matcher = EmojiMatcher(EMOJIS)
+    for message in _make_messages(1000, seed=seed):
+        emoji_counter = Counter(matcher.find_in_content(message.content))
+        emoji_counter.update(matcher.find_in_reactions(message.reactions))
+        assert emoji_counter == _legacy_count(EMOJIS, message), message
+
+
+def test_daily_counts_add_up_like_the_substring_loop():
+    messages = _make_messages(3000)
+    daily_counts = DailyEmojiCounts(
+        EmojiMatcher(EMOJIS),
+        first_day=FIRST_DAY,
+        last_day=FIRST_DAY + DAY_COUNT - 1,
+    )
+    legacy_emoji_counts: Counter = Counter()
+    for message in messages:
+        daily_counts.add_message(message, day=message.day)
+        for emoji, count in _legacy_count(EMOJIS, message).items():
+            legacy_emoji_counts[message.day, emoji.id] += count
+
+    assert daily_counts.get_message_counts() == Counter(message.day for message in messages)
+    assert daily_counts.get_emoji_counts() == legacy_emoji_counts
+
+
+def test_daily_counts_reject_days_out_of_the_range():
+    daily_counts = DailyEmojiCounts(EmojiMatcher(EMOJIS), first_day=FIRST_DAY, last_day=FIRST_DAY)
+    with pytest.raises(IndexError):
+        daily_counts.add_message(SimpleNamespace(content='', reactions=[]), day=FIRST_DAY + 1)
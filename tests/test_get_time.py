@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytest
+from dateutil import parser
+from dateutil.tz import gettz
+
+from dakap.get_time import _get_tzinfo, _parse_common_time
+
+DEFAULT_DTS = [
+    datetime(2023, 7, 1, 12, 34, tzinfo=gettz('Asia/Taipei')),
+    datetime(2023, 11, 5, 0, 0, tzinfo=gettz('America/New_York')),
+]
+
+
+@pytest.mark.parametrize('default_dt', DEFAULT_DTS)
+@pytest.mark.parametrize('time_str', [
+    '21:30',
+    '9:05',
+    '00:00:59',
+    '2023-01-02 21:30',
+    '2024-02-29 23:59:59',
+    '21:30 JST',
+    '21:30 TW',
+    '21:30 CST',
+    '21:30 UTC',
+    '21:30 GMT',
+    '2023-07-01 09:00 ET',
+    # Ambiguous in America/New_York
+    '2023-11-05 01:30 ET',
+    '2023-11-05 01:30',
+])
+def test_common_time_is_parsed_like_dateutil(time_str, default_dt):
+    parsed = _parse_common_time(time_str, default_dt)
+    expected = parser.parse(time_str, default=default_dt, tzinfos=_get_tzinfo)
+    assert parsed is not None
+    assert parsed == expected
+    assert (parsed.replace(tzinfo=None), parsed.utcoffset(), parsed.tzname()) == (
+        expected.replace(tzinfo=None),
+        expected.utcoffset(),
+        expected.tzname(),
+    )
+
+
+@pytest.mark.parametrize('time_str', [
+    '9PM',
+    '21:30 PM',
+    '21:30 EST',
+    '2023/01/02 21:30',
+    '25:00',
+    '2023-02-30 21:30',
+    '21:30 +0900',
+])
+def test_other_formats_are_left_to_dateutil(time_str):
+    assert _parse_common_time(time_str, DEFAULT_DTS[0]) is None
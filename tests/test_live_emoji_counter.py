@@ -0,0 +1,168 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from dakap import live_emoji_counter
+from dakap.emoji_index import EmojiIndex, snowflake_day
+from dakap.live_emoji_counter import LiveEmojiCounter
+
+CLIENT = SimpleNamespace(user=SimpleNamespace(id=1))
+EMOJI = discord.PartialEmoji(name='emoji', id=100)
+
+
+@pytest.fixture
+def emoji_index(monkeypatch):
+    index = EmojiIndex(':memory:')
+    monkeypatch.setattr(live_emoji_counter, 'get_emoji_index', lambda: index)
+    yield index
+    index.close()
+
+
+def make_guild(guild_id: int, shard_id: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(id=guild_id, shard_id=shard_id, emojis=[EMOJI])
+
+
+def make_message(
+    guild: SimpleNamespace,
+    channel_id: int,
+    content: str = '',
+    seconds: float = 60,
+) -> SimpleNamespace:
+    """A message sent the seconds after now."""
+    return SimpleNamespace(
+        id=discord.utils.time_snowflake(datetime.now(tz=timezone.utc) + timedelta(seconds=seconds)),
+        guild=guild,
+        channel=SimpleNamespace(id=channel_id),
+        author=SimpleNamespace(id=2),
+        content=content,
+        reactions=[],
+    )
+
+
+def test_sessions_are_restarted_per_shard(emoji_index):
+    counter = LiveEmojiCounter()
+    guild_0 = make_guild(1, shard_id=0)
+    guild_1 = make_guild(2, shard_id=1)
+
+    async def main():
+        await counter.start_session(0)
+        await counter.start_session(1)
+        session_start_id = counter.session_start_ids[0]
+        message_0 = make_message(guild_0, 10, f'{EMOJI}')
+        message_1 = make_message(guild_1, 20, f'{EMOJI}')
+        counter.on_message(CLIENT, message_0)
+        counter.on_message(CLIENT, message_1)
+
+        # The shard 1 identified again, so its live counts have a gap
+        await counter.start_session(1)
+        assert counter.session_start_ids[0] == session_start_id
+        # Both scanned up to their sessions
+        for guild, channel_id in ((guild_0, 10), (guild_1, 20)):
+            emoji_index.move_checkpoint(
+                guild_id=guild.id,
+                channel_id=channel_id,
+                checkpoint=counter.get_session_start_id(guild),
+            )
+        await counter.flush()
+        return snowflake_day(message_0.id)
+
+    day = asyncio.run(main())
+    assert emoji_index.get_message_counts([10, 20], since_day=day) == {10: 1}
+    assert emoji_index.get_emoji_counts([10, 20], since_day=day) == {EMOJI.id: 1}
+
+
+def test_message_in_the_gap_is_counted_once(emoji_index):
+    counter = LiveEmojiCounter()
+    guild = make_guild(1)
+
+    async def main():
+        await counter.start_session(0)
+        gap_message = make_message(guild, 10, f'{EMOJI}', seconds=-60)
+        live_message = make_message(guild, 10, f'{EMOJI} {EMOJI}')
+        # A late event of the gap is left to the scan
+        counter.on_message(CLIENT, gap_message)
+        counter.on_message(CLIENT, live_message)
+
+        # Not added until the gap is scanned
+        await counter.flush()
+        assert emoji_index.get_checkpoint(10) is None
+        gap_day = snowflake_day(gap_message.id)
+        emoji_index.add_counts(
+            guild_id=guild.id,
+            channel_id=10,
+            message_counts={gap_day: 1},
+            emoji_counts={(gap_day, EMOJI.id): 1},
+            checkpoint=counter.session_start_ids[0],
+        )
+        await counter.flush()
+        await counter.flush()
+        return live_message
+
+    live_message = asyncio.run(main())
+    assert emoji_index.get_checkpoint(10) == live_message.id
+    assert emoji_index.get_message_counts([10], since_day=0) == {10: 2}
+    assert emoji_index.get_emoji_counts([10], since_day=0) == {EMOJI.id: 2}
+
+
+def test_deleted_live_message_is_uncounted(emoji_index):
+    counter = LiveEmojiCounter()
+    guild = make_guild(1)
+
+    async def main():
+        await counter.start_session(0)
+        emoji_index.move_checkpoint(
+            guild_id=guild.id,
+            channel_id=10,
+            checkpoint=counter.session_start_ids[0],
+        )
+        kept_message = make_message(guild, 10, f'{EMOJI}', seconds=60)
+        deleted_message = make_message(guild, 10, f'{EMOJI}', seconds=120)
+        for message in (kept_message, deleted_message):
+            counter.on_message(CLIENT, message)
+            # By 2 users
+            for _ in range(2):
+                counter.on_raw_reaction_add(guild, SimpleNamespace(
+                    message_id=message.id,
+                    channel_id=10,
+                    emoji=EMOJI,
+                ))
+        await counter.flush()
+        assert emoji_index.get_emoji_counts([10], since_day=0) == {EMOJI.id: 4}
+
+        await counter.on_message_delete(CLIENT, deleted_message)
+        await counter.flush()
+
+    asyncio.run(main())
+    assert emoji_index.get_message_counts([10], since_day=0) == {10: 1}
+    assert emoji_index.get_emoji_counts([10], since_day=0) == {EMOJI.id: 2}
+
+
+def test_reactions_of_the_oldest_messages_are_forgotten(emoji_index):
+    counter = LiveEmojiCounter(max_reactions=4)
+    guild = make_guild(1)
+
+    async def main():
+        await counter.start_session(0)
+        emoji_index.move_checkpoint(
+            guild_id=guild.id,
+            channel_id=10,
+            checkpoint=counter.session_start_ids[0],
+        )
+        messages = [make_message(guild, 10, seconds=index + 1) for index in range(5)]
+        payloads = [
+            SimpleNamespace(message_id=message.id, channel_id=10, emoji=EMOJI)
+            for message in messages
+        ]
+        for payload in payloads:
+            counter.on_raw_reaction_add(guild, payload)
+        # The first 2 messages are forgotten, so neither counted again nor uncounted
+        counter.on_raw_reaction_add(guild, payloads[0])
+        counter.on_raw_reaction_remove(guild, payloads[1])
+        counter.on_raw_reaction_remove(guild, payloads[4])
+        await counter.flush()
+
+    asyncio.run(main())
+    assert emoji_index.get_emoji_counts([10], since_day=0) == {EMOJI.id: 4}
@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import yarl
+
+from dakap.metrics import Metrics, send_stats
+
+API_URL = yarl.URL('https://discord.com/api/v10')
+
+
+def test_route_masks_ids_and_emojis():
+    metrics = Metrics()
+    metrics.on_response(
+        'PUT',
+        API_URL / 'channels/123/messages/456/reactions/\N{THUMBS UP SIGN}/@me',
+        204,
+    )
+    assert list(metrics.api_responses) == [
+        ('PUT', '/api/v10/channels/{id}/messages/{id}/reactions/{emoji}/@me', 204),
+    ]
+
+
+def test_route_masks_interaction_and_webhook_tokens():
+    metrics = Metrics()
+    metrics.on_response(
+        'POST',
+        API_URL / 'interactions/123/aW50ZXJhY3Rpb246MTIz/callback',
+        204,
+    )
+    metrics.on_response(
+        'PATCH',
+        API_URL / 'webhooks/456/aW50ZXJhY3Rpb246NDU2/messages/@original',
+        200,
+    )
+    assert list(metrics.api_responses) == [
+        ('POST', '/api/v10/interactions/{id}/{token}/callback', 204),
+        ('PATCH', '/api/v10/webhooks/{id}/{token}/messages/@original', 200),
+    ]
+    assert 'aW50' not in metrics.render_prometheus()
+    assert not any('aW50' in line for line in metrics.render_summary())
+
+
+def test_stats_are_sent_only_to_the_owner_without_fetching_the_application():
+    replies = []
+
+    async def application_info():
+        raise AssertionError('Fetched when logging in')
+
+    async def reply(content):
+        replies.append(content)
+
+    client = SimpleNamespace(
+        application=SimpleNamespace(team=None, owner=SimpleNamespace(id=1)),
+        application_info=application_info,
+    )
+    for author_id in (1, 2):
+        message = SimpleNamespace(author=SimpleNamespace(id=author_id), reply=reply)
+        asyncio.run(send_stats(client, message, ['stats']))
+    assert len(replies) == 1
+    assert replies[0].startswith('```')
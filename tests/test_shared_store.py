@@ -0,0 +1,52 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from dakap.shared_store import SharedStore
+
+
+@pytest.fixture
+def shared_store():
+    store = SharedStore(':memory:')
+    yield store
+    store.close()
+
+
+def test_values_expire(shared_store):
+    shared_store.put_many('quote', {'AAPL': [1.0], '2330.TW': {'name': '台積電'}}, ttl=60)
+    shared_store.put_many('quote', {'MSFT': [2.0]}, ttl=-1)
+    assert shared_store.get_many('quote', ['AAPL', '2330.TW', 'MSFT', 'GOOG']) == {
+        'AAPL': [1.0],
+        '2330.TW': {'name': '台積電'},
+    }
+    assert shared_store.get_many('info', ['AAPL']) == {}
+    assert shared_store.get_many('quote', []) == {}
+
+
+def test_expired_values_are_dropped_on_put(shared_store):
+    shared_store.put_many('quote', {'AAPL': 1, 'MSFT': 2}, ttl=-1)
+    shared_store.put_many('quote', {'GOOG': 3}, ttl=60)
+    assert shared_store._connection.execute(  # pylint: disable=protected-access
+        'SELECT key FROM entries'
+    ).fetchall() == [('GOOG',)]
+
+
+def test_database_is_opened_in_its_thread(tmp_path):
+    path = str(tmp_path / 'shared-store.sqlite3')
+    # Another process holding the write lock
+    locker = sqlite3.connect(path)
+    locker.execute('BEGIN EXCLUSIVE')
+    store = SharedStore(path)
+    try:
+        async def main():
+            # The event loop is not blocked while the store waits for the lock
+            await asyncio.sleep(0)
+            locker.rollback()
+            return await store.run(threading.current_thread)
+
+        assert asyncio.run(main()).name.startswith('SharedStore')
+    finally:
+        locker.close()
+        store.close()
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from dakap.single_flight import SingleFlightCache
+
+
+def test_get_coalesces_concurrent_callers():
+    calls = []
+
+    async def fetch():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    async def main():
+        cache = SingleFlightCache(ttl=60)
+        results = await asyncio.gather(*(cache.get('key', fetch) for _ in range(5)))
+        assert results == ['value'] * 5
+        assert await cache.get('key', fetch) == 'value'
+        return cache
+
+    cache = asyncio.run(main())
+    assert len(calls) == 1
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 4, 1)
+
+
+def test_get_refetches_after_ttl_and_invalidate():
+    values = iter(range(10))
+
+    async def fetch():
+        return next(values)
+
+    async def main():
+        cache = SingleFlightCache(ttl=0)
+        assert await cache.get('key', fetch) == 0
+        assert await cache.get('key', fetch) == 1
+        cache.ttl = 60
+        assert await cache.get('key', fetch) == 2
+        assert await cache.get('key', fetch) == 2
+        assert cache.get_cached('key') == 2
+        cache.invalidate('key')
+        assert cache.get_cached('key') is None
+        assert await cache.get('key', fetch) == 3
+        cache.invalidate()
+        assert await cache.get('key', fetch) == 4
+
+    asyncio.run(main())
+
+
+def test_get_does_not_cache_failures():
+    async def fail():
+        raise RuntimeError('boom')
+
+    async def fetch():
+        return 'value'
+
+    async def main():
+        cache = SingleFlightCache(ttl=60)
+        with pytest.raises(RuntimeError):
+            await cache.get('key', fail)
+        assert await cache.get('key', fetch) == 'value'
+
+    asyncio.run(main())
+
+
+def test_get_many_fetches_missing_keys_in_one_batch():
+    batches = []
+
+    async def fetch(keys):
+        batches.append(keys)
+        await asyncio.sleep(0)
+        return {key: key.upper() for key in keys if key != 'missing'}
+
+    async def main():
+        cache = SingleFlightCache(ttl=60)
+        cache.put('cached', 'CACHED!')
+        in_flight = cache.get_many(['a'], fetch)
+        futures = cache.get_many(['a', 'b', 'b', 'cached', 'missing'], fetch)
+        assert futures['a'] is in_flight['a']
+        assert await futures['a'] == 'A'
+        assert await futures['b'] == 'B'
+        assert await futures['cached'] == 'CACHED!'
+        with pytest.raises(KeyError):
+            await futures['missing']
+        # After the done callbacks
+        await asyncio.sleep(0)
+        assert cache.get_cached('b') == 'B'
+        assert cache.get_cached('missing') is None
+
+    asyncio.run(main())
+    assert batches == [['a'], ['b', 'missing']]
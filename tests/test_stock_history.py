@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from dakap import stock_history
+from dakap.stock_history import PriceHistory, PriceHistoryStore, render_sparkline
+
+INTERVAL = stock_history.HISTORY_INTERVAL_SECONDS
+
+
+def make_history(start: int, closes: list[float]) -> PriceHistory:
+    closes = np.array(closes, dtype=np.float64)
+    return PriceHistory(
+        timestamps=start + INTERVAL * np.arange(len(closes), dtype=np.int64),
+        opens=closes,
+        highs=closes + 1,
+        lows=closes - 1,
+        closes=closes,
+        volumes=np.ones(len(closes)),
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PriceHistoryStore(str(tmp_path))
+
+
+def test_load_missing_symbol_is_empty(store, tmp_path):
+    history = store.load('AAPL')
+    assert all(len(column) == 0 for column in history)
+    assert not list(tmp_path.iterdir())
+
+
+def test_merge_appends_and_overwrites_the_open_bar(store):
+    with store.lock('AAPL'):
+        store.merge('AAPL', make_history(0, [1, 2, 3]))
+    mapped = store.load('AAPL')
+    assert isinstance(mapped.closes, np.memmap)
+
+    # The last bar was still open
+    with store.lock('AAPL'):
+        store.merge('AAPL', make_history(2 * INTERVAL, [4, 5]))
+    history = store.load('AAPL')
+    assert history.closes.tolist() == [1, 2, 4, 5]
+    assert history.timestamps.tolist() == [0, INTERVAL, 2 * INTERVAL, 3 * INTERVAL]
+    # The mapped bars stay valid
+    assert mapped.closes.tolist() == [1, 2, 4]
+
+
+def test_merge_rewrites_when_the_bars_shrink(store):
+    with store.lock('AAPL'):
+        store.merge('AAPL', make_history(0, [1, 2, 3, 4]))
+    mapped = store.load('AAPL')
+    with store.lock('AAPL'):
+        store.merge('AAPL', make_history(INTERVAL, [5]))
+    assert store.load('AAPL').closes.tolist() == [1, 5]
+    assert mapped.closes.tolist() == [1, 2, 3, 4]
+
+
+def test_merge_rewrites_only_the_recent_bars_beyond_the_cap(store, monkeypatch):
+    monkeypatch.setattr(stock_history, 'MAX_HISTORY_BARS', 8)
+    bars_per_day = 24 * 60 * 60 // INTERVAL
+    old_start = -(stock_history.HISTORY_DAYS + 1) * bars_per_day * INTERVAL
+    with store.lock('AAPL'):
+        store.merge('AAPL', make_history(old_start, [1, 2]))
+        store.merge('AAPL', make_history(0, list(range(10))))
+    history = store.load('AAPL')
+    assert history.closes.tolist() == list(range(10))
+
+
+@pytest.mark.parametrize('symbol', ['..', '.', '../AAPL', 'A/B', ''])
+def test_invalid_symbols_are_rejected(store, tmp_path, symbol):
+    with pytest.raises(ValueError):
+        store.load(symbol)
+    with pytest.raises(ValueError):
+        with store.lock(symbol):
+            pass
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize('symbol', ['AAPL', 'brk-b', '5253.T', '^N225', 'EURUSD=X'])
+def test_valid_symbols_are_stored(store, symbol):
+    with store.lock(symbol):
+        store.merge(symbol, make_history(0, [1]))
+    assert store.load(symbol).closes.tolist() == [1]
+
+
+@pytest.mark.parametrize('length', [1, 5, 24, 25, 100])
+def test_sparkline_width(length):
+    sparkline = render_sparkline(np.arange(length, dtype=np.float64))
+    assert len(sparkline) == min(length, stock_history.SPARKLINE_WIDTH)
+    assert sparkline[-1] == ('▄' if length == 1 else '█')
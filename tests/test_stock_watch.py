@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from dakap import stock_watch
+from dakap.stock_watch import StockWatcher, _add_alert
+from dakap.stock_watch_store import StockWatchStore
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    monkeypatch.setattr(stock_watch, 'get_discord_embed_for_stock_price', lambda quote: quote)
+    store = StockWatchStore(':memory:')
+    yield StockWatcher(store)
+    store.close()
+
+
+def make_client(channel_errors: dict[int, Exception]) -> SimpleNamespace:
+    """A client whose channels fail to send with the errors."""
+
+    def get_channel(channel_id):
+        async def send(**_kwargs):
+            if channel_id in channel_errors:
+                raise channel_errors[channel_id]
+            return SimpleNamespace()
+
+        return SimpleNamespace(id=channel_id, send=send)
+
+    return SimpleNamespace(get_channel=get_channel)
+
+
+@pytest.mark.parametrize('error', [
+    discord.Forbidden(SimpleNamespace(status=403, reason='Forbidden'), 'Missing Access'),
+    discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), 'Unknown Channel'),
+])
+def test_watches_of_unreachable_channels_are_dropped(watcher, error):
+    store = watcher.store
+    store.add_watches(1, ['AAPL'])
+    store.add_watches(2, ['AAPL'])
+    store.add_alert(channel_id=1, user_id=3, symbol='AAPL', direction='above', threshold=200.0)
+    client = make_client({1: error})
+    quotes = {'AAPL': SimpleNamespace(last_price=100.0)}
+
+    async def main():
+        for channel_id in (1, 2):
+            await watcher._update_watch_message(client, channel_id, ['AAPL'], quotes)
+
+    asyncio.run(main())
+    assert store.get_watches() == {2: ['AAPL']}
+    assert store.get_alerts() == []
+    assert list(watcher._watch_messages) == [2]
+
+
+@pytest.mark.parametrize('threshold', ['nan', 'inf', '-Infinity', 'abc'])
+def test_alerts_need_finite_thresholds(threshold):
+    with pytest.raises(ValueError, match='Usage'):
+        asyncio.run(_add_alert(SimpleNamespace(), ['AAPL', '>', threshold]))
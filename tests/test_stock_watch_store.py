@@ -0,0 +1,41 @@
+import pytest
+
+from dakap.stock_watch_store import Alert, StockWatchStore, has_stock_watch_store
+
+
+@pytest.fixture
+def store():
+    stock_watch_store = StockWatchStore(':memory:')
+    yield stock_watch_store
+    stock_watch_store.close()
+
+
+def test_store_is_not_created_until_used(tmp_path):
+    path = str(tmp_path / 'stock-watch.sqlite3')
+    assert not has_stock_watch_store(path)
+    StockWatchStore(path).close()
+    assert has_stock_watch_store(path)
+
+
+def test_subscriptions(store):
+    assert not store.has_subscriptions()
+    store.add_watches(1, ['AAPL', '5253.T'])
+    store.add_watches(1, ['AAPL'])
+    store.add_alert(channel_id=2, user_id=3, symbol='AAPL', direction='above', threshold=200.0)
+    assert store.has_subscriptions()
+    assert store.get_watches() == {1: ['AAPL', '5253.T']}
+    assert store.get_alerts() == [Alert(1, 2, 3, 'AAPL', 'above', 200.0)]
+
+    assert store.remove_watches(1, ['AAPL']) == 1
+    assert store.remove_watches(2) == 1
+    store.remove_alerts([1])
+    assert store.get_watches() == {1: ['5253.T']}
+    assert store.remove_watches(1) == 1
+    assert not store.has_subscriptions()
+
+
+def test_alert_is_crossed_on_its_side():
+    above = Alert(1, 2, 3, 'AAPL', 'above', 200.0)
+    below = above._replace(direction='below')
+    assert [above.is_crossed(price) for price in (199.9, 200.0, 200.1)] == [False, True, True]
+    assert [below.is_crossed(price) for price in (199.9, 200.0, 200.1)] == [True, True, False]